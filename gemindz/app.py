@@ -1,17 +1,45 @@
-from flask import Flask, request, jsonify
+import os
+import time
+from flask import Flask, g, request, jsonify
 from flask_jwt_extended import JWTManager
-from datetime import datetime
 from blueprints import register_blueprints
+from commands import register_commands
 from database import init_db
-from config import DevelopmentConfig
-from models import Log
+from config import config_by_name
+from log_archive import LogArchive
+from log_partitions import LogMaintenance
+from log_writer import LogWriter
+from metrics_registry import observe_request, registry
+from passwords import PasswordHasher
+from profiling import RequestProfiler
+from query_stats import QueryInstrumentation, current_query_stats
+from shards import ShardRouter
 from sqlalchemy.exc import SQLAlchemyError
 from werkzeug.exceptions import InternalServerError
 
 
-def create_app():
+def create_app(config_name=None):
+    """
+    Create the application.
+
+    Args:
+        config_name (str): Name of the configuration to load, 'development' or
+            'production'. Defaults to the GEMINDZ_CONFIG environment variable,
+            then to 'development'. A configuration class is accepted as well.
+
+    Every GEMINDZ_<KEY> environment variable then overrides the <KEY> setting,
+    e.g. GEMINDZ_SQLALCHEMY_DATABASE_URI. Values are parsed as JSON when possible.
+
+    Returns:
+        Flask: The application.
+    """
+    config_name = config_name or os.environ.get('GEMINDZ_CONFIG', 'development')
+    if isinstance(config_name, str) and config_name not in config_by_name:
+        raise ValueError(f"Unknown configuration: {config_name!r}")
+
     flask_app = Flask(__name__)
-    flask_app.config.from_object(DevelopmentConfig)
+    flask_app.config.from_object(config_by_name.get(config_name, config_name))
+    flask_app.config.from_prefixed_env('GEMINDZ')
 
     # Register JWT manager
     JWTManager(flask_app)
@@ -19,18 +47,67 @@ def create_app():
     # Initialize database
     init_db(flask_app)
 
+    # Spread execution results over the configured shards
+    ShardRouter(flask_app)
+
+    # Hash passwords in a pool of worker processes
+    PasswordHasher(flask_app)
+
+    # Start the write-behind request logger
+    log_writer = LogWriter(flask_app)
+
+    # Move old log partitions to compressed segment files
+    LogArchive(flask_app)
+
+    # Start the log partitioning, archiving and retention job
+    LogMaintenance(flask_app)
+
+    # Expose the state of the log writer as metrics
+    registry.gauge_callback('gemindz_log_writer_queue_depth', 'Request logs waiting to be written.',
+                            lambda: log_writer.stats()['queue_depth'])
+    registry.gauge_callback('gemindz_log_writer_dropped_total', 'Request logs dropped by the log writer.',
+                            lambda: log_writer.stats()['dropped'], kind='counter')
+    registry.gauge_callback('gemindz_log_writer_flushed_total', 'Request logs written by the log writer.',
+                            lambda: log_writer.stats()['flushed'], kind='counter')
+
+    # Profile sampled or admin-requested requests when PROFILING_ENABLED is set
+    RequestProfiler(flask_app)
+
+    # Report the SQL statements of every request
+    QueryInstrumentation(flask_app)
+
     # Register blueprints
     register_blueprints(flask_app)
 
+    # Register CLI commands
+    register_commands(flask_app)
+
+    # Register before request function
+    @flask_app.before_request
+    def before_request_func():
+        g.request_started = time.perf_counter()
+
     # Register after request function
     @flask_app.after_request
     def after_request_func(response):
         try:
+            # Time the request with a monotonic clock; a before_request hook
+            # registered earlier may have answered before the clock started
+            started = g.get('request_started')
+            duration = time.perf_counter() - started if started is not None else None
+            query_stats = current_query_stats()
+            observe_request(request.blueprint, request.endpoint, request.method, response.status_code, duration,
+                            query_stats.duration)
+            # Unmatched URLs share one histogram to keep the number of routes bounded
+            route = request.url_rule.rule if request.url_rule else '<unmatched>'
             # Check if the response has an error
-            error = response.json.get('error') if response.json else None
-            # Log request details
-            Log.log_request(endpoint=request.path, method=request.method,
-                            status_code=response.status_code, error=error)
+            data = response.get_json(silent=True) if not response.is_streamed else None
+            error = data.get('error') if isinstance(data, dict) else None
+            # Queue request details for the background log writer
+            log_writer.log_request(endpoint=request.path, method=request.method,
+                                   status_code=response.status_code, error=error,
+                                   duration_ms=duration * 1000 if duration is not None else None, route=route,
+                                   query_count=query_stats.count, query_time_ms=query_stats.duration_ms)
         except Exception as e:
             # Log the exception if an error occurs during logging
             flask_app.logger.error(
@@ -67,8 +144,6 @@ def create_app():
         error_message = "An unexpected error occurred. Please try again later."
         return jsonify({"error": error_message}), 500
 
-    flask_app.start_time = datetime.now()
-
     return flask_app
 
 
@@ -0,0 +1,163 @@
+"""
+Run the benchmark scenarios against a seeded database and compare the results
+with a baseline.
+
+    python benchmarks/run.py --scale small --save-baseline
+    python benchmarks/run.py --scale small            # fails on regressions
+
+The database is seeded on first use and reused by later runs with the same
+--database, so large scales are only seeded once. Baselines depend on the
+machine, so record one on the machine the comparisons run on.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+from datetime import datetime
+
+APP_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIRECTORY)
+
+DEFAULT_BASELINE = os.path.join(APP_DIRECTORY, 'benchmarks', 'baseline.json')
+
+# Metrics compared with the baseline, and whether higher values are better
+COMPARED_METRICS = {
+    'throughput_rps': True,
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'peak_memory_kib': False,
+}
+# Latency changes below this are noise, whatever the relative change
+MIN_LATENCY_DELTA_MS = 1.0
+
+
+def create_benchmark_app(database_path, config_name):
+    os.environ.update({
+        'GEMINDZ_CONFIG': config_name,
+        'GEMINDZ_SQLALCHEMY_DATABASE_URI': json.dumps(f'sqlite:///{database_path}'),
+        'GEMINDZ_LOG_MAINTENANCE_INTERVAL': 'null',
+    })
+    from app import create_app
+    return create_app()
+
+
+def build_context(app, counts):
+    from flask_jwt_extended import create_access_token
+    with app.app_context():
+        admin_token = create_access_token(identity='user0', additional_claims={'role': 'admin'})
+        user_token = create_access_token(identity='user1', additional_claims={'role': 'user'})
+    return {
+        'counts': counts,
+        'admin_headers': {'Authorization': f'Bearer {admin_token}'},
+        'user_headers': {'Authorization': f'Bearer {user_token}'},
+    }
+
+
+def ensure_seeded(app, counts, seed):
+    from benchmarks.seed import seed_database
+    from models import TestCase, db
+    with app.app_context():
+        seeded = db.session.query(TestCase.id).first() is not None
+        db.session.remove()
+        if not seeded:
+            print(f'Seeding {counts} ...', file=sys.stderr)
+            seed_database(db, counts, seed=seed)
+
+
+def compare(baseline, results, threshold, memory_threshold):
+    """
+    Returns:
+        list: Description of every metric of `results` that is worse than in
+        `baseline` by more than the threshold.
+    """
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if previous is None:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            before, after = previous[metric], current[metric]
+            allowed = memory_threshold if metric == 'peak_memory_kib' else threshold
+            if higher_is_better:
+                regressed = after < before * (1 - allowed)
+            else:
+                regressed = after > before * (1 + allowed)
+                if metric.endswith('_ms') and after - before < MIN_LATENCY_DELTA_MS:
+                    regressed = False
+            if regressed:
+                regressions.append(f'{name}: {metric} {before} -> {after}')
+    return regressions
+
+
+def main():
+    from benchmarks.scenarios import SCENARIOS, run_scenario
+    from benchmarks.seed import SCALES
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--database', help='SQLite file to seed and reuse (default: a temporary file)')
+    parser.add_argument('--config', default='production')
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='Run only these scenarios')
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative latency/throughput change')
+    parser.add_argument('--memory-threshold', type=float, default=0.25, help='Allowed relative memory change')
+    args = parser.parse_args()
+    if args.requests < 1:
+        parser.error('--requests must be at least 1')
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_path = os.path.abspath(args.database or os.path.join(directory, 'benchmark.db'))
+        app = create_benchmark_app(database_path, args.config)
+        counts = SCALES[args.scale]
+        ensure_seeded(app, counts, args.seed)
+
+        client = app.test_client()
+        context = build_context(app, counts)
+        results = {
+            'meta': {'scale': args.scale, 'counts': counts, 'config': args.config, 'requests': args.requests,
+                     'python': platform.python_version(), 'platform': platform.platform(),
+                     'created_at': datetime.utcnow().isoformat()},
+            'scenarios': {},
+        }
+        for name in args.scenario or SCENARIOS:
+            print(f'Running {name} ...', file=sys.stderr)
+            results['scenarios'][name] = run_scenario(client, SCENARIOS[name], context, requests=args.requests,
+                                                      warmup=args.warmup, seed=args.seed)
+        app.extensions['log_writer'].stop()
+
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as output:
+            json.dump(results, output, indent=2)
+        print(f'Baseline written to {args.baseline}', file=sys.stderr)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('No baseline to compare with, run with --save-baseline first', file=sys.stderr)
+        return 0
+    with open(args.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    if baseline['meta']['scale'] != args.scale:
+        print(f"The baseline was recorded at scale {baseline['meta']['scale']}, not compared", file=sys.stderr)
+        return 0
+
+    regressions = compare(baseline, results, args.threshold, args.memory_threshold)
+    for regression in regressions:
+        print(f'REGRESSION {regression}', file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""
+Benchmark scenarios: one per endpoint and access pattern, driven through the
+Flask test client so the numbers cover routing, handlers, queries and encoding
+but not the network.
+
+A scenario builds the next request from the benchmark context (dataset sizes
+and auth headers) and a random generator, as (method, url, options for
+client.open()).
+"""
+import math
+import random
+import time
+import tracemalloc
+
+from benchmarks.seed import PASSWORD
+
+
+def home(context, rng):
+    return 'GET', '/', {}
+
+
+def login(context, rng):
+    username = f"user{rng.randrange(context['counts']['users'])}"
+    return 'POST', '/auth/login', {'json': {'username': username, 'password': PASSWORD}}
+
+
+def test_cases_list(context, rng):
+    return 'GET', '/testcases/', {'headers': context['user_headers']}
+
+
+def test_cases_list_fields(context, rng):
+    return 'GET', '/testcases/?fields=id,name', {'headers': context['user_headers']}
+
+
+def test_cases_export(context, rng):
+    return 'GET', '/testcases/export?format=csv', {'headers': context['user_headers']}
+
+
+def test_case_get(context, rng):
+    test_case_id = rng.randint(1, context['counts']['test_cases'])
+    return 'GET', f'/testcases/{test_case_id}', {'headers': context['user_headers']}
+
+
+def test_cases_search(context, rng):
+    return 'GET', f'/testcases/search?q=feature {rng.randrange(97)}', {'headers': context['user_headers']}
+
+
+def test_case_create(context, rng):
+    return 'POST', '/testcases/', {'headers': context['admin_headers'],
+                                   'json': {'name': f'Benchmark {rng.random()}', 'description': 'Created'}}
+
+
+def execution_results_page(context, rng):
+    return 'GET', f'/execution_results/{_test_asset_id(context, rng)}', {}
+
+
+def execution_results_filtered(context, rng):
+    return 'GET', f'/execution_results/{_test_asset_id(context, rng)}?result=failed&limit=50', {}
+
+
+def execution_results_summary(context, rng):
+    return 'GET', f'/execution_results/{_test_asset_id(context, rng)}/summary', {}
+
+
+def execution_results_trend(context, rng):
+    return 'GET', f'/execution_results/trend?test_asset_id={_test_asset_id(context, rng)}&bucket=1d', {}
+
+
+def execution_results_flaky(context, rng):
+    return 'GET', '/execution_results/flaky?limit=20', {}
+
+
+def execution_results_batch(context, rng):
+    items = [{'test_case_id': rng.randint(1, context['counts']['test_cases']),
+              'test_asset_id': _test_asset_id(context, rng), 'result': 'passed'} for _ in range(100)]
+    return 'POST', '/execution_results/batch', {'headers': context['admin_headers'], 'json': items}
+
+
+def logs_page(context, rng):
+    return 'GET', '/logs/?limit=100', {}
+
+
+def logs_filtered(context, rng):
+    return 'GET', '/logs/?endpoint_name=/testcases/&status_code=200&limit=100', {}
+
+
+def logs_stream(context, rng):
+    return 'GET', '/logs/?limit=10000', {'headers': {'Accept': 'application/x-ndjson'}}
+
+
+def logs_latency(context, rng):
+    return 'GET', '/logs/latency', {}
+
+
+def logs_rollups(context, rng):
+    return 'GET', '/logs/rollups', {}
+
+
+def metrics(context, rng):
+    return 'GET', '/metrics', {}
+
+
+def _test_asset_id(context, rng):
+    return rng.randint(1, context['counts']['test_assets'])
+
+
+SCENARIOS = {scenario.__name__: scenario for scenario in (
+    home, login,
+    test_cases_list, test_cases_list_fields, test_cases_search, test_cases_export, test_case_get, test_case_create,
+    execution_results_page, execution_results_filtered, execution_results_summary, execution_results_trend,
+    execution_results_flaky, execution_results_batch,
+    logs_page, logs_filtered, logs_stream, logs_latency, logs_rollups, metrics,
+)}
+
+
+def run_scenario(client, scenario, context, requests=200, warmup=10, memory_requests=5, seed=0):
+    """
+    Send warmup requests, then time `requests` requests one after the other,
+    then trace the memory allocated by `memory_requests` more (tracing slows
+    requests down, so it is kept out of the timed ones).
+
+    Returns:
+        dict: Throughput, latency percentiles in milliseconds, peak traced
+        memory in KiB and the number of 5xx responses.
+    """
+    rng = random.Random(seed)
+
+    def send():
+        method, url, options = scenario(context, rng)
+        response = client.open(url, method=method, **options)
+        response.get_data()  # Consume streamed bodies
+        return response.status_code
+
+    for _ in range(warmup):
+        send()
+
+    durations = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        request_started = time.perf_counter()
+        if send() >= 500:
+            errors += 1
+        durations.append(time.perf_counter() - request_started)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    try:
+        for _ in range(memory_requests):
+            send()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    durations.sort()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'throughput_rps': round(requests / elapsed, 2),
+        'p50_ms': _percentile_ms(durations, 0.5),
+        'p95_ms': _percentile_ms(durations, 0.95),
+        'p99_ms': _percentile_ms(durations, 0.99),
+        'max_ms': round(durations[-1] * 1000, 3),
+        'peak_memory_kib': round(peak_memory / 1024, 1),
+    }
+
+
+def _percentile_ms(sorted_durations, quantile):
+    # Nearest-rank percentile
+    rank = max(math.ceil(quantile * len(sorted_durations)), 1)
+    return round(sorted_durations[rank - 1] * 1000, 3)
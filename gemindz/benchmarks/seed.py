@@ -0,0 +1,131 @@
+"""
+Bulk seeder for the benchmark datasets.
+
+Rows are generated deterministically from a seed and inserted with Core
+executemany in chunks, one transaction per chunk. The derived tables
+(execution result summaries, latency histograms, table versions) are filled
+the way the application fills them, so reads see a consistent database.
+"""
+import random
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from flakiness import rebuild_flakiness
+from latency import record_latencies
+from models import ExecutionResult, Log, TestCase, User
+from passwords import hash_password
+from rollups import rebuild_summaries
+from versioning import bump_table_version
+
+# Number of rows of every table, per scale
+SCALES = {
+    'tiny': {'users': 10, 'test_cases': 100, 'test_assets': 10, 'execution_results': 1000, 'logs': 1000},
+    'small': {'users': 100, 'test_cases': 1000, 'test_assets': 100, 'execution_results': 100000,
+              'logs': 100000},
+    'medium': {'users': 1000, 'test_cases': 10000, 'test_assets': 1000, 'execution_results': 1000000,
+               'logs': 1000000},
+    'large': {'users': 10000, 'test_cases': 100000, 'test_assets': 10000, 'execution_results': 10000000,
+              'logs': 10000000},
+}
+
+PASSWORD = 'benchmark'
+RESULTS = ('passed', 'failed', 'skipped')
+RESULT_WEIGHTS = (80, 15, 5)
+ENDPOINTS = (('/testcases/', 'GET'), ('/testcases/<int:test_case_id>', 'GET'),
+             ('/execution_results/<int:test_asset_id>', 'GET'), ('/logs/', 'GET'), ('/auth/login', 'POST'))
+STATUS_CODES = (200, 200, 200, 200, 201, 304, 400, 401, 404, 500)
+
+# Seeded rows are spread over this period, ending at the seeding time
+HISTORY = timedelta(days=7)
+
+
+def seed_database(db, counts, seed=0, chunk_size=50000, now=None):
+    """
+    Fill an empty database with the given number of rows per table.
+
+    Args:
+        db: The Flask-SQLAlchemy extension, used inside an app context.
+        counts (dict): Number of 'users', 'test_cases', 'test_assets',
+            'execution_results' and 'logs' to create, e.g. SCALES['small'].
+        seed (int): Seed of the generated data.
+        chunk_size (int): Rows inserted per transaction.
+        now (datetime): End of the seeded history, the current time by default.
+
+    Returns:
+        dict: Number of rows inserted per table.
+    """
+    rng = random.Random(seed)
+    now = now or datetime.utcnow()
+    start = now - HISTORY
+    engine = db.engine
+
+    # Hashing is slow on purpose, so every user shares one hash
+    password_hash = hash_password(PASSWORD)
+    users = ({'username': f'user{number}', 'password_hash': password_hash,
+              'role': 'admin' if number == 0 else 'user', 'created_at': start}
+             for number in range(counts['users']))
+    _insert_chunks(engine, User, users, chunk_size)
+
+    test_cases = ({'name': f'Test case {number}', 'description': f'Checks feature {number % 97}',
+                   'version': 1, 'created_at': start, 'updated_at': start}
+                  for number in range(1, counts['test_cases'] + 1))
+    _insert_chunks(engine, TestCase, test_cases, chunk_size)
+
+    execution_results = ({'test_case_id': rng.randint(1, counts['test_cases']),
+                          'test_asset_id': rng.randint(1, counts['test_assets']),
+                          'result': rng.choices(RESULTS, RESULT_WEIGHTS)[0],
+                          'created_at': _moment(start, number, counts['execution_results'])}
+                         for number in range(counts['execution_results']))
+    _insert_chunks(engine, ExecutionResult, execution_results, chunk_size)
+    with engine.begin() as connection:
+        rebuild_summaries(connection)
+        rebuild_flakiness(connection)
+
+    logs = (_log(rng, _moment(start, number, counts['logs'])) for number in range(counts['logs']))
+    _insert_chunks(engine, Log, logs, chunk_size, after_chunk=_record_log_latencies)
+
+    bump_table_version(TestCase.__tablename__)
+    db.session.commit()
+    return dict(counts)
+
+
+def _moment(start, number, total):
+    # Evenly spaced and increasing, like rows written by the application
+    return start + HISTORY * number / max(total, 1)
+
+
+def _log(rng, created_at):
+    route, method = rng.choice(ENDPOINTS)
+    endpoint = re.sub(r'<int:\w+>', lambda match: str(rng.randint(1, 1000)), route)
+    status_code = rng.choice(STATUS_CODES)
+    return {'endpoint_name': endpoint, 'method': method, 'status_code': status_code,
+            'error': 'Not found' if status_code == 404 else None,
+            'duration_ms': round(rng.lognormvariate(2, 1), 3), 'created_at': created_at,
+            # Only used for the latency histograms, which are kept per route
+            'route': route}
+
+
+def _record_log_latencies(connection, rows):
+    record_latencies(connection, [(row['route'], row['created_at'], row['duration_ms']) for row in rows])
+
+
+def _insert_chunks(engine, model, rows, chunk_size, after_chunk=None):
+    columns = set(model.__table__.columns.keys())
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            _insert_chunk(engine, model, chunk, columns, after_chunk)
+            chunk = []
+    if chunk:
+        _insert_chunk(engine, model, chunk, columns, after_chunk)
+
+
+def _insert_chunk(engine, model, chunk, columns, after_chunk):
+    with engine.begin() as connection:
+        connection.execute(insert(model), [{key: value for key, value in row.items() if key in columns}
+                                           for row in chunk])
+        if after_chunk is not None:
+            after_chunk(connection, chunk)
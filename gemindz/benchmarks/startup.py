@@ -0,0 +1,68 @@
+"""
+Measure how long a worker takes to start: import time, create_app time and
+the time to serve the first request, on a new database (cold, the schema is
+created) and on an existing one (warm, only the fingerprint is checked).
+
+Each run is a fresh interpreter so nothing is already imported:
+
+    python benchmarks/startup.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+APP_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child interpreter and prints its timings as JSON
+CHILD = """
+import json, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+app.test_client().get('/')
+served = time.perf_counter()
+app.extensions['log_writer'].stop()
+print(json.dumps({'import': imported - started, 'create_app': created - imported,
+                  'first_request': served - created, 'total': served - started}))
+"""
+
+
+def run_once(database_uri, config_name):
+    environ = dict(os.environ, GEMINDZ_CONFIG=config_name,
+                   GEMINDZ_SQLALCHEMY_DATABASE_URI=json.dumps(database_uri),
+                   GEMINDZ_LOG_MAINTENANCE_INTERVAL='null')
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=APP_DIRECTORY, env=environ,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(samples):
+    return {phase: {'median_ms': round(statistics.median(sample[phase] for sample in samples) * 1000, 2),
+                    'max_ms': round(max(sample[phase] for sample in samples) * 1000, 2)}
+            for phase in samples[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--config', default='development')
+    args = parser.parse_args()
+
+    results = {'cold': [], 'warm': []}
+    with tempfile.TemporaryDirectory() as directory:
+        for run in range(args.runs):
+            database_uri = f"sqlite:///{os.path.join(directory, f'startup-{run}.db')}"
+            results['cold'].append(run_once(database_uri, args.config))
+            results['warm'].append(run_once(database_uri, args.config))
+
+    print(json.dumps({name: summarize(samples) for name, samples in results.items()}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,8 @@ from routes.execution_results import execution_results_bp
 from routes.auth import auth_bp
 from routes.logs import logs_bp
 from routes.home import home_bp
+from routes.metrics import metrics_bp
+from routes.profiles import profiles_bp
 
 
 def register_blueprints(app):
@@ -11,3 +13,5 @@ def register_blueprints(app):
     app.register_blueprint(auth_bp)
     app.register_blueprint(logs_bp)
     app.register_blueprint(home_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(profiles_bp)
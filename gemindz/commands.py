@@ -0,0 +1,91 @@
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select
+
+from database import db
+from flakiness import rebuild_flakiness
+from log_partitions import maintain_logs
+from models import TestCase
+from rollups import rebuild_summaries
+from search import rebuild_search_index
+from shards import create_shard_engine, current_router, prune_test_cases, rebalance, shard_url
+
+
+def register_commands(app):
+    app.cli.add_command(rebuild_summaries_command)
+    app.cli.add_command(rebuild_flakiness_command)
+    app.cli.add_command(maintain_logs_command)
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(rebalance_shards_command)
+
+
+def _result_engines():
+    # The shards when execution results are sharded, the main database otherwise
+    return current_router().engines or [db.engine]
+
+
+@click.command('rebuild-summaries')
+@click.option('--test-asset-id', type=int, default=None, help='Only rebuild the summary of this test asset.')
+@with_appcontext
+def rebuild_summaries_command(test_asset_id):
+    """Recompute the execution result summary counts from the raw results.
+
+    With shards, the results of test cases deleted from the main database are deleted first.
+    """
+    router = current_router()
+    if router.enabled:
+        # First delete the shard rows of test cases deleted from the main database
+        test_case_ids = db.session.scalars(select(TestCase.id)).all()
+        pruned = sum(prune_test_cases(engine, test_case_ids) for engine in router.engines)
+        if pruned:
+            click.echo(f'Deleted {pruned} execution results of deleted test cases.')
+    for engine in _result_engines():
+        with engine.begin() as connection:
+            rebuild_summaries(connection, test_asset_id)
+    click.echo('Execution result summaries rebuilt.')
+
+
+@click.command('rebuild-flakiness')
+@with_appcontext
+def rebuild_flakiness_command():
+    """Recompute the flakiness state of every pair from the raw results."""
+    for engine in _result_engines():
+        with engine.begin() as connection:
+            rebuild_flakiness(connection)
+    click.echo('Flakiness states rebuilt.')
+
+
+@click.command('maintain-logs')
+@with_appcontext
+def maintain_logs_command():
+    """Seal finished log partitions, archive the old ones and drop the expired ones."""
+    result = maintain_logs(db.engine, current_app.config, archive=current_app.extensions.get('log_archive'))
+    click.echo(f"Sealed {len(result['sealed'])}, archived {len(result['archived'])} "
+               f"and dropped {len(result['dropped'])} log partitions.")
+
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Reindex every test case for GET /testcases/search."""
+    with db.engine.begin() as connection:
+        rebuild_search_index(connection)
+    click.echo('Test case search index rebuilt.')
+
+
+@click.command('rebalance-shards')
+@click.option('--to', 'targets', multiple=True, required=True,
+              help='Database URI of a shard of the new layout, in order; repeat for every shard.')
+@with_appcontext
+def rebalance_shards_command(targets):
+    """Move the execution results from the configured shards to a new shard layout."""
+    sources = _result_engines()
+    # Databases kept in the new layout are written through the engines already open on them
+    engines = {str(engine.url): engine for engine in (*sources, db.engine)}
+    pragmas = current_app.config.get('SQLITE_PRAGMAS', {})
+    targets = [engines.get(str(shard_url(uri, current_app.instance_path)))
+               or create_shard_engine(uri, pragmas, current_app.instance_path) for uri in targets]
+    moved = rebalance(sources, targets)
+    click.echo(f'Moved {moved} execution results. Set EXECUTION_RESULT_SHARDS to the new shards before '
+               f'restarting the application.')
@@ -6,7 +6,95 @@ class Config:
     # JWT configuration
     JWT_SECRET_KEY = '34kt0OC79E9_vAgP7NkeRgqhiChiVCVT0MpDlzM_JI0'
     JWT_TOKEN_LOCATION = ['headers', 'cookies']
+    IDENTITY_CACHE_TTL = 60  # Seconds a looked-up user role is trusted
 
+    # Password hashing; hashes made with another method are upgraded on login
+    PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'  # Werkzeug method with its cost parameters
+    PASSWORD_HASH_WORKERS = None  # Processes, None for half the CPUs, 0 to hash inline
+    PASSWORD_HASH_MAX_PENDING = None  # Jobs queued or running, None for 4 per worker
+    PASSWORD_HASH_QUEUE_TIMEOUT = 1.0  # Seconds to wait for a slot before answering 503
+
+    # Request log writer configuration
+    LOG_QUEUE_MAXSIZE = 10000
+    LOG_BATCH_SIZE = 500
+    LOG_FLUSH_INTERVAL = 1.0  # Seconds before a partial batch is written
+    LOG_OVERFLOW_POLICY = 'drop'  # 'drop', 'sample' or 'block'
+    LOG_QUEUE_HIGH_WATER = 0.8  # Fraction of the queue where sampling starts
+    LOG_SAMPLE_RATE = 0.1
+    LOG_BLOCK_TIMEOUT = 0.5  # Seconds
+    LOG_SHUTDOWN_TIMEOUT = 5.0  # Seconds
+
+    # POST /execution_results/batch
+    EXECUTION_RESULTS_BATCH_MODE = 'all_or_nothing'  # Or 'partial'
+    EXECUTION_RESULTS_BATCH_MAX_ITEMS = 10000
+
+    # GET /execution_results/<test_asset_id> pagination
+    EXECUTION_RESULTS_PAGE_SIZE = 100
+    EXECUTION_RESULTS_MAX_PAGE_SIZE = 1000
+
+    # GET /execution_results/trend
+    EXECUTION_RESULTS_TREND_DAYS = 90  # Default range
+    EXECUTION_RESULTS_TREND_MAX_BUCKETS = 1000
+    EXECUTION_RESULTS_PASSING = ('pass', 'passed')  # Results counted in the pass rate
+
+    # GET /execution_results/flaky
+    FLAKINESS_MIN_RUNS = 5  # Pairs with fewer runs are not ranked
+    FLAKINESS_PAGE_SIZE = 20
+    FLAKINESS_MAX_PAGE_SIZE = 100
+
+    # Execution result shards (see shards.py): database URIs the results are
+    # spread over by test asset, or none to keep them in the main database.
+    # Changing the list needs a `flask rebalance-shards` run first.
+    EXECUTION_RESULT_SHARDS = []
+    EXECUTION_RESULT_SHARD_WORKERS = None  # Threads of cross-shard queries, one per shard by default
+
+    # GET /testcases/search pagination
+    TEST_CASES_SEARCH_PAGE_SIZE = 20
+    TEST_CASES_SEARCH_MAX_PAGE_SIZE = 100
+
+    # POST /testcases/import and GET /testcases/export
+    TEST_CASES_IMPORT_CHUNK_SIZE = 1000  # Test cases inserted per transaction
+    TEST_CASES_IMPORT_MAX_ERRORS = 100  # Row errors listed in the response
+    TEST_CASES_EXPORT_CHUNK_SIZE = 1000
+
+    # DELETE /testcases/
+    TEST_CASES_BULK_DELETE_MAX_IDS = 10000
+
+    # Log partitioning and retention
+    LOG_PARTITION_DAYS = 1
+    LOG_PARTITION_GRACE = 3600  # Seconds before a finished partition is sealed
+    LOG_RETENTION_DAYS = 30  # Older partitions are downsampled to hourly counts and dropped
+    LOG_MAINTENANCE_INTERVAL = 3600  # Seconds, None disables the background job
+
+    # Cold tier of the logs, see log_archive.py
+    LOG_ARCHIVE_AFTER_DAYS = None  # Partitions older than this move to segment files, None disables it
+    LOG_ARCHIVE_DIRECTORY = None  # Defaults to <instance path>/log_archive
+    LOG_ARCHIVE_BLOCK_ROWS = 1000  # Rows per compressed block
+
+    # GET /logs pagination
+    LOGS_PAGE_SIZE = 100
+    LOGS_MAX_PAGE_SIZE = 1000
+    LOGS_STREAM_CHUNK_SIZE = 1000
+
+    # Request profiling, see profiling.py
+    PROFILING_ENABLED = False
+    PROFILING_SAMPLE_RATE = 0.0  # Fraction of requests profiled
+    PROFILING_HEADER = 'X-Profile'  # Profiles the request when sent with an admin token
+    PROFILING_DIRECTORY = None  # Defaults to <instance path>/profiles
+    PROFILING_MAX_FILES = 100
+
+    # SQL statement instrumentation, see query_stats.py
+    QUERY_STATS_HEADERS = None  # X-Query-Count/X-Query-Time-Ms headers, None to follow DEBUG
+    QUERY_SLOW_THRESHOLD_MS = 100  # Slower statements go to the slow query log
+    QUERY_SLOW_LOG_FILE = None  # Also write the slow query log to this file
+    QUERY_REPEAT_THRESHOLD = 10  # Flag requests running one statement shape more often
+
+    # SQLite storage: pragmas run on every new connection, and GET handlers
+    # read from a separate read-only engine when SQLITE_READ_ENGINE is set
+    SQLITE_PRAGMAS = {}
+    SQLITE_READ_ENGINE = False
+    SQLITE_READ_POOL_SIZE = 5
+    SQLITE_READ_MAX_OVERFLOW = 10
 
 class DevelopmentConfig(Config):
     # Define development-specific configuration variables here
@@ -16,3 +104,26 @@ class DevelopmentConfig(Config):
 class ProductionConfig(Config):
     # Define production-specific configuration variables here
     DEBUG = False
+
+    SQLITE_PRAGMAS = {
+        'busy_timeout': 5000,  # Milliseconds to wait for a lock
+        'journal_mode': 'WAL',  # Readers do not block the writer
+        'synchronous': 'NORMAL',  # Durable enough in WAL mode, fsync at checkpoints only
+        'mmap_size': 268435456,  # 256 MiB
+        'cache_size': -65536,  # Negative values are KiB: 64 MiB
+        'foreign_keys': 'ON',
+    }
+    SQLITE_READ_ENGINE = True
+    SQLITE_READ_POOL_SIZE = 8
+    # Keep a week of logs in the database, older ones are read from the archive
+    LOG_ARCHIVE_AFTER_DAYS = 7
+    # Handlers keep their connection until the request ends, so a single pooled
+    # connection would serialize whole requests (and deadlock a request that
+    # needs a second one); SQLite's write lock and busy_timeout serialize the writes
+    SQLALCHEMY_ENGINE_OPTIONS = {'pool_size': 4, 'max_overflow': 4, 'pool_timeout': 30}
+
+
+config_by_name = {
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+}
@@ -1,10 +1,94 @@
+import os
+import sqlite3
+from flask import current_app, g
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
 
 db = SQLAlchemy()
 
+
 def init_db(app):
     with app.app_context():
         db.init_app(app)
-        db.create_all()
-        app.start_time = datetime.now()
+
+        # Apply the configured pragmas to every connection of the writer engine
+        pragmas = app.config.get('SQLITE_PRAGMAS', {})
+        if pragmas:
+            event.listen(db.engine, 'connect', _pragma_listener(pragmas))
+
+        if app.config.get('SQLITE_READ_ENGINE') and db.engine.url.database not in (None, '', ':memory:'):
+            init_read_engine(app, pragmas)
+
+        # Imported here since the models import db from this module
+        from schema import ensure_schema
+        if ensure_schema(db.engine, db.metadata):
+            app.logger.info("Migrated the database schema")
+
+        # Workers forked by a preloading server open their own connections
+        engines = [engine for engine in (db.engine, app.extensions.get('read_engine')) if engine is not None]
+
+        def dispose_engines():
+            for engine in engines:
+                engine.dispose(close=False)
+
+        os.register_at_fork(after_in_child=dispose_engines)
+
+
+def init_read_engine(app, pragmas):
+    """
+    Create a read-only engine with its own connection pool on the database
+    file of the writer engine, used by read_session().
+    """
+    read_engine = create_engine(
+        f'sqlite:///file:{db.engine.url.database}?mode=ro&uri=true',
+        pool_size=app.config.get('SQLITE_READ_POOL_SIZE', 5),
+        max_overflow=app.config.get('SQLITE_READ_MAX_OVERFLOW', 10),
+        connect_args={'check_same_thread': False})
+    # The journal mode can only be changed by the writer
+    read_pragmas = {name: value for name, value in pragmas.items() if name != 'journal_mode'}
+    event.listen(read_engine, 'connect', _pragma_listener({**read_pragmas, 'query_only': 'ON'}))
+
+    app.extensions['read_engine'] = read_engine
+    app.extensions['read_session_factory'] = sessionmaker(bind=read_engine)
+    app.teardown_appcontext(_close_read_session)
+
+
+def read_session():
+    """
+    Return the session GET handlers read from: a session of the read-only
+    engine when SQLITE_READ_ENGINE is enabled, db.session otherwise.
+    """
+    factory = current_app.extensions.get('read_session_factory')
+    if factory is None:
+        return db.session
+    if 'read_session' not in g:
+        g.read_session = factory()
+    return g.read_session
+
+
+def _close_read_session(exception=None):
+    session = g.pop('read_session', None)
+    if session is not None:
+        session.close()
+
+
+@event.listens_for(Engine, 'connect')
+def _enable_foreign_keys(dbapi_connection, connection_record):
+    # SQLite leaves foreign keys off by default; the ON DELETE CASCADE
+    # constraints the models rely on need them on every connection
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys = ON')
+        cursor.close()
+
+
+def _pragma_listener(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # Set the busy timeout first so the other pragmas wait for locks
+        for name, value in sorted(pragmas.items(), key=lambda item: item[0] != 'busy_timeout'):
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+    return set_pragmas
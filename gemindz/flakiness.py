@@ -0,0 +1,70 @@
+from sqlalchemy import event, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import ExecutionResult, FlakinessState
+
+flakiness_table = FlakinessState.__table__
+
+# Weight of the latest run in the decayed flip rate: a flip counts for half
+# as much after about 7 more runs
+FLIP_RATE_ALPHA = 0.1
+
+
+def _build_record_statement():
+    state = flakiness_table.c
+    statement = sqlite_insert(flakiness_table)
+    flipped = (state.last_result != statement.excluded.last_result).cast(FlakinessState.flip_rate.type)
+    # Column references in the SET clause read the stored row, before the update
+    return statement.on_conflict_do_update(
+        index_elements=[state.test_case_id, state.test_asset_id],
+        set_={
+            'last_result': statement.excluded.last_result,
+            'run_count': state.run_count + 1,
+            'flip_count': state.flip_count + (state.last_result != statement.excluded.last_result),
+            'flip_rate': state.flip_rate * (1 - FLIP_RATE_ALPHA) + flipped * FLIP_RATE_ALPHA,
+            'last_run_at': statement.excluded.last_run_at,
+        })
+
+
+_record_statement = _build_record_statement()
+
+
+def record_runs(connection, rows):
+    """
+    Update the flakiness state of the pairs of new execution results, in
+    constant time per result: a run whose result differs from the previous
+    result of its pair is a flip.
+
+    Must be called on the connection that inserted the results, in insertion
+    order.
+
+    Args:
+        connection: Connection of the inserting transaction.
+        rows (list): Dicts with 'test_case_id', 'test_asset_id', 'result' and 'created_at'.
+    """
+    if not rows:
+        return
+    connection.execute(_record_statement, [
+        {'test_case_id': row['test_case_id'], 'test_asset_id': row['test_asset_id'], 'last_result': row['result'],
+         'run_count': 1, 'flip_count': 0, 'flip_rate': 0.0, 'last_run_at': row.get('created_at')}
+        for row in rows])
+
+
+def rebuild_flakiness(connection, chunk_size=10000):
+    """
+    Recompute the flakiness state of every pair by replaying all execution
+    results in recording order, e.g. to backfill results recorded before the
+    state was kept.
+    """
+    connection.execute(flakiness_table.delete())
+    results = connection.execution_options(yield_per=chunk_size).execute(
+        select(ExecutionResult.test_case_id, ExecutionResult.test_asset_id, ExecutionResult.result,
+               ExecutionResult.created_at).order_by(ExecutionResult.id))
+    for partition in results.partitions():
+        record_runs(connection, [row._asdict() for row in partition])
+
+
+@event.listens_for(ExecutionResult, 'after_insert')
+def _record_inserted_run(mapper, connection, target):
+    record_runs(connection, [{'test_case_id': target.test_case_id, 'test_asset_id': target.test_asset_id,
+                              'result': target.result, 'created_at': target.created_at}])
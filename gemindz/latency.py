@@ -0,0 +1,64 @@
+from bisect import bisect_left
+from collections import Counter
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import LatencyHistogram
+
+# Upper bounds in milliseconds of the fixed histogram buckets; the last
+# bucket (index len(BUCKET_BOUNDS_MS)) holds everything slower
+BUCKET_BOUNDS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def bucket_index(duration_ms):
+    return bisect_left(BUCKET_BOUNDS_MS, duration_ms)
+
+
+def record_latencies(connection, samples):
+    """
+    Add request durations to the hourly histograms.
+
+    Args:
+        connection: Connection of the transaction writing the request logs.
+        samples (iterable): (endpoint_name, created_at, duration_ms) tuples.
+    """
+    counts = Counter((created_at.replace(minute=0, second=0, microsecond=0), endpoint_name,
+                      bucket_index(duration_ms)) for endpoint_name, created_at, duration_ms in samples)
+    if not counts:
+        return
+    histogram = LatencyHistogram.__table__
+    statement = sqlite_insert(histogram)
+    statement = statement.on_conflict_do_update(
+        index_elements=[histogram.c.hour, histogram.c.endpoint_name, histogram.c.bucket],
+        set_={'count': histogram.c.count + statement.excluded['count']})
+    connection.execute(statement, [{'hour': hour, 'endpoint_name': endpoint_name, 'bucket': bucket, 'count': count}
+                                   for (hour, endpoint_name, bucket), count in counts.items()])
+
+
+def percentile(bucket_counts, quantile):
+    """
+    Estimate a percentile from bucket counts, interpolating linearly inside
+    the bucket that contains it.
+
+    Args:
+        bucket_counts (list): Count of every bucket, indexed like BUCKET_BOUNDS_MS
+            plus the overflow bucket.
+        quantile (float): Between 0 and 1.
+
+    Returns:
+        float: Estimated duration in milliseconds, None if there are no samples.
+    """
+    total = sum(bucket_counts)
+    if not total:
+        return None
+    rank = quantile * total
+    seen = 0
+    for index, count in enumerate(bucket_counts):
+        if count and seen + count >= rank:
+            if index == len(BUCKET_BOUNDS_MS):
+                # Unbounded bucket, the best estimate is its lower bound
+                return float(BUCKET_BOUNDS_MS[-1])
+            lower = BUCKET_BOUNDS_MS[index - 1] if index else 0
+            return lower + (BUCKET_BOUNDS_MS[index] - lower) * (rank - seen) / count
+        seen += count
+    return float(BUCKET_BOUNDS_MS[-1])
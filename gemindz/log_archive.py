@@ -0,0 +1,400 @@
+import fcntl
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import zlib
+from bisect import bisect_left
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from log_partitions import PARTITION_DATE_FORMAT, PARTITION_PREFIX, list_partitions
+from models import LogRollup
+
+# A partition is archived as two immutable files named after its table:
+# - <name>.seg: the rows ordered by (created_at, id), in zlib-compressed blocks
+#   of LOG_ARCHIVE_BLOCK_ROWS rows, each a JSON list of rows.
+# - <name>.idx: a header with the column names, followed by one fixed-size
+#   entry per block with its time range and location in the segment file.
+#   Readers memory-map it and binary search the entries for a time range.
+# The index is renamed into place last, so a segment exists once its index does.
+# Server workers all run the archiving job, so it holds an exclusive lock on
+# LOCK_NAME in the archive directory while it writes or deletes files.
+SEGMENT_SUFFIX = '.seg'
+INDEX_SUFFIX = '.idx'
+LOCK_NAME = '.lock'
+INDEX_MAGIC = b'GLIX'
+INDEX_VERSION = 1
+# Magic, version, length of the JSON list of column names that follows
+_HEADER = struct.Struct('<4sHI')
+# First and last created_at in microseconds since the epoch, offset, length and row count
+_ENTRY = struct.Struct('<qqQII')
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def to_microseconds(moment):
+    return (moment - _EPOCH) // _MICROSECOND
+
+
+def from_microseconds(value):
+    return _EPOCH + timedelta(microseconds=value)
+
+
+class _Entries:
+    """
+    Sequence view of the block entries of a memory-mapped index.
+    """
+
+    def __init__(self, buffer, offset, count):
+        self._buffer = buffer
+        self._offset = offset
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, position):
+        return _ENTRY.unpack_from(self._buffer, self._offset + position * _ENTRY.size)
+
+
+class Segment:
+    """
+    Archived rows of one log partition, read from its memory-mapped files.
+    """
+
+    def __init__(self, directory, name):
+        self.name = name
+        self.start, self.end = (datetime.strptime(bound, PARTITION_DATE_FORMAT)
+                                for bound in name[len(PARTITION_PREFIX):].split('_'))
+        self.segment_path = os.path.join(directory, name + SEGMENT_SUFFIX)
+        self.index_path = os.path.join(directory, name + INDEX_SUFFIX)
+        self._lock = threading.Lock()
+        self._index = None
+
+    def _open(self):
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._data = _map(self.segment_path)
+                    index = _map(self.index_path)
+                    magic, version, columns_length = _HEADER.unpack_from(index)
+                    if magic != INDEX_MAGIC or version != INDEX_VERSION:
+                        raise ValueError(f"{self.index_path} is not a log archive index")
+                    columns = json.loads(index[_HEADER.size:_HEADER.size + columns_length])
+                    self._positions = {name: position for position, name in enumerate(columns)}
+                    self._entries = _Entries(index, _HEADER.size + columns_length,
+                                             (len(index) - _HEADER.size - columns_length) // _ENTRY.size)
+                    self._index = index
+        return self._entries
+
+    def blocks(self, time_gte=None, time_lte=None):
+        """
+        Yield the decoded rows of the blocks overlapping [time_gte, time_lte],
+        decompressing no other block.
+        """
+        entries = self._open()
+        first = 0
+        if time_gte is not None:
+            # Blocks are in time order, skip those ending before the range
+            first = bisect_left(entries, to_microseconds(time_gte), key=lambda entry: entry[1])
+        upper = to_microseconds(time_lte) if time_lte is not None else None
+        for position in range(first, len(entries)):
+            first_us, _, offset, length, _ = entries[position]
+            if upper is not None and first_us > upper:
+                return
+            yield json.loads(zlib.decompress(self._data[offset:offset + length]))
+
+    def read(self, filters, fields, required=(), cursor=None):
+        """
+        Yield the rows matching the log filters of parse_log_filters and
+        following the (created_at, id) cursor, one list per block, as tuples of
+        the fields followed by the required columns that are not among them.
+        """
+        self._open()
+        names = fields + tuple(name for name in required if name not in fields)
+        row_type = _row_type(names)
+        positions = [self._positions.get(name) for name in names]
+        created_at = self._positions['created_at']
+        row_id = self._positions['id']
+        # Datetimes are stored as microseconds since the epoch
+        created_at_field = names.index('created_at') if 'created_at' in names else None
+
+        time_gte = max(filter(None, (filters.get('time'), filters.get('time[gte]'), cursor and cursor[0])),
+                       default=None)
+        time_lte = filters.get('time') or filters.get('time[lte]')
+        checks = []
+        if 'endpoint_name' in filters:
+            checks.append((self._positions['endpoint_name'], filters['endpoint_name']))
+        if 'status_code' in filters:
+            checks.append((self._positions['status_code'], filters['status_code']))
+        lower = to_microseconds(time_gte) if time_gte is not None else None
+        upper = to_microseconds(time_lte) if time_lte is not None else None
+        after = (to_microseconds(cursor[0]), cursor[1]) if cursor else None
+
+        for rows in self.blocks(time_gte, time_lte):
+            matches = []
+            for row in rows:
+                if lower is not None and row[created_at] < lower:
+                    continue
+                if upper is not None and row[created_at] > upper:
+                    break
+                if after is not None and (row[created_at], row[row_id]) <= after:
+                    continue
+                if any(row[position] != value for position, value in checks):
+                    continue
+                values = [row[position] if position is not None else None for position in positions]
+                if created_at_field is not None:
+                    values[created_at_field] = from_microseconds(values[created_at_field])
+                matches.append(row_type(*values))
+            if matches:
+                yield matches
+
+    def rows(self):
+        """
+        Yield every archived row as a dict of column values.
+        """
+        self._open()
+        columns = list(self._positions)
+        for rows in self.blocks():
+            for row in rows:
+                yield dict(zip(columns, row))
+
+    def close(self):
+        with self._lock:
+            if self._index is not None:
+                for buffer in (self._index, self._data):
+                    if isinstance(buffer, mmap.mmap):
+                        buffer.close()
+                self._index = None
+
+
+_row_types = {}
+
+
+def _row_type(names):
+    row_type = _row_types.get(names)
+    if row_type is None:
+        row_type = _row_types[names] = namedtuple('ArchivedLog', names)
+    return row_type
+
+
+def _map(path):
+    with open(path, 'rb') as file:
+        if not os.fstat(file.fileno()).st_size:
+            # Segments of empty partitions, which cannot be mapped
+            return b''
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def write_segment(connection, table, directory, block_rows=1000):
+    """
+    Write the rows of a log partition table to a segment and its index.
+
+    Returns:
+        int: Number of archived rows.
+    """
+    columns = [column.name for column in table.columns]
+    created_at = columns.index('created_at')
+    segment_path = os.path.join(directory, table.name + SEGMENT_SUFFIX)
+    index_path = os.path.join(directory, table.name + INDEX_SUFFIX)
+    # Unique temporary files, which only replace the final ones once complete
+    segment_tmp = _temporary_file(segment_path)
+    index_tmp = _temporary_file(index_path)
+
+    try:
+        entries = []
+        offset = 0
+        with open(segment_tmp, 'wb') as segment:
+            result = connection.execution_options(yield_per=block_rows).execute(
+                select(table).order_by(table.c.created_at, table.c.id))
+            for partition in result.partitions():
+                rows = [list(row) for row in partition]
+                for row in rows:
+                    row[created_at] = to_microseconds(row[created_at])
+                block = zlib.compress(json.dumps(rows, separators=(',', ':')).encode())
+                segment.write(block)
+                entries.append((rows[0][created_at], rows[-1][created_at], offset, len(block), len(rows)))
+                offset += len(block)
+            segment.flush()
+            os.fsync(segment.fileno())
+
+        encoded_columns = json.dumps(columns).encode()
+        with open(index_tmp, 'wb') as index:
+            index.write(_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(encoded_columns)))
+            index.write(encoded_columns)
+            for entry in entries:
+                index.write(_ENTRY.pack(*entry))
+            index.flush()
+            os.fsync(index.fileno())
+
+        os.replace(segment_tmp, segment_path)
+        os.replace(index_tmp, index_path)
+    finally:
+        for path in (segment_tmp, index_tmp):
+            if os.path.exists(path):
+                os.remove(path)
+    return sum(entry[4] for entry in entries)
+
+
+def _temporary_file(path):
+    fd, temporary_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                          dir=os.path.dirname(path))
+    os.close(fd)
+    return temporary_path
+
+
+@contextmanager
+def _exclusive_lock(directory):
+    """
+    Hold the lock of the archive directory, shared by every process using it.
+    """
+    with open(os.path.join(directory, LOCK_NAME), 'a') as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+class LogArchive:
+    """
+    Cold tier of the request logs: partitions that ended more than
+    LOG_ARCHIVE_AFTER_DAYS days ago are moved out of the database into
+    compressed segment files in LOG_ARCHIVE_DIRECTORY (defaults to
+    <instance path>/log_archive). A None LOG_ARCHIVE_AFTER_DAYS disables
+    archiving, but existing segments are still read.
+
+    Segments are immutable, so their memory maps are kept open and shared by
+    every request of the process. Deleted segments are only forgotten, their
+    maps are closed once the requests still reading them are done with them.
+    """
+
+    def __init__(self, app=None):
+        self._segments = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.directory = config.get('LOG_ARCHIVE_DIRECTORY') or os.path.join(app.instance_path, 'log_archive')
+        self.after_days = config.get('LOG_ARCHIVE_AFTER_DAYS')
+        self.block_rows = config.get('LOG_ARCHIVE_BLOCK_ROWS', 1000)
+        app.extensions['log_archive'] = self
+
+    def segments(self, time_gte=None, time_lte=None):
+        """
+        Returns:
+            list: Segments overlapping [time_gte, time_lte], oldest first. Their
+            time ranges do not overlap, nor those of the log partition tables.
+        """
+        return [segment for segment in self._list_segments()
+                if (time_gte is None or segment.end > time_gte) and (time_lte is None or segment.start <= time_lte)]
+
+    def _list_segments(self):
+        try:
+            names = sorted(name[:-len(INDEX_SUFFIX)] for name in os.listdir(self.directory)
+                           if name.startswith(PARTITION_PREFIX) and name.endswith(INDEX_SUFFIX))
+        except FileNotFoundError:
+            return []
+        # Keep the segments, and their memory maps, of the names still listed
+        with self._lock:
+            self._segments = {name: self._segments.get(name) or Segment(self.directory, name) for name in names}
+            return sorted(self._segments.values(), key=lambda segment: segment.start)
+
+    def archive_partitions(self, engine, now):
+        """
+        Move every partition that ended more than LOG_ARCHIVE_AFTER_DAYS days
+        ago to a segment, then drop its table. A partition whose segment was
+        written by an interrupted run is only dropped.
+
+        Returns:
+            list: Names of the archived partitions.
+        """
+        if self.after_days is None:
+            return []
+        cutoff = now - timedelta(days=self.after_days)
+        with engine.connect() as connection:
+            due = [table for _, end, table in list_partitions(connection) if end <= cutoff]
+        if not due:
+            return []
+
+        os.makedirs(self.directory, exist_ok=True)
+        with _exclusive_lock(self.directory):
+            # Another worker may have archived them while this one waited for the lock
+            with engine.connect() as connection:
+                due = [table for _, end, table in list_partitions(connection) if end <= cutoff]
+            for table in due:
+                if not os.path.exists(os.path.join(self.directory, table.name + INDEX_SUFFIX)):
+                    with engine.connect() as connection:
+                        write_segment(connection, table, self.directory, self.block_rows)
+                with engine.begin() as connection:
+                    table.drop(connection)
+        return [table.name for table in due]
+
+    def drop_expired(self, engine, retention_days, now):
+        """
+        Downsample every segment that ended more than retention_days ago into
+        hourly LogRollup counts, then delete its files.
+
+        The index is deleted before the counts are committed, so a run
+        interrupted in between loses the counts of the segment rather than
+        adding them twice on the next run. Segment files left without their
+        index are deleted as well.
+
+        Returns:
+            list: Names of the deleted segments.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        cutoff = now - timedelta(days=retention_days)
+        with _exclusive_lock(self.directory):
+            expired = [segment for segment in self._list_segments() if segment.end <= cutoff]
+            for segment in expired:
+                self._drop_segment(engine, segment)
+            self._remove_orphans(cutoff)
+        return [segment.name for segment in expired]
+
+    def _drop_segment(self, engine, segment):
+        with self._lock:
+            self._segments.pop(segment.name, None)
+        counts = Counter()
+        for row in segment.rows():
+            hour = from_microseconds(row['created_at']).replace(minute=0, second=0, microsecond=0)
+            counts[hour, row['endpoint_name'], row['status_code']] += 1
+        # The index first, so a segment is never listed without its data
+        os.remove(segment.index_path)
+        if counts:
+            rollup = LogRollup.__table__
+            statement = sqlite_insert(rollup)
+            statement = statement.on_conflict_do_update(
+                index_elements=[rollup.c.hour, rollup.c.endpoint_name, rollup.c.status_code],
+                set_={'count': rollup.c.count + statement.excluded['count']})
+            with engine.begin() as connection:
+                connection.execute(statement, [
+                    {'hour': hour, 'endpoint_name': endpoint_name, 'status_code': status_code, 'count': count}
+                    for (hour, endpoint_name, status_code), count in counts.items()])
+        os.remove(segment.segment_path)
+
+    def _remove_orphans(self, cutoff):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not (name.startswith(PARTITION_PREFIX) and name.endswith(SEGMENT_SUFFIX)):
+                continue
+            base = name[:-len(SEGMENT_SUFFIX)]
+            if base + INDEX_SUFFIX in names:
+                continue
+            end = datetime.strptime(base[len(PARTITION_PREFIX):].split('_')[1], PARTITION_DATE_FORMAT)
+            if end <= cutoff:
+                os.remove(os.path.join(self.directory, name))
@@ -0,0 +1,213 @@
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, Index, MetaData, Table, and_, delete, func, insert, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import db
+from models import Log, LogRollup
+
+# The log table is the head partition that receives new rows. Rows of past
+# partitions are moved to one table per partition, named after the partition
+# bounds: log_p<start>_<end> with both dates as YYYYMMDD.
+PARTITION_PREFIX = 'log_p'
+PARTITION_DATE_FORMAT = '%Y%m%d'
+
+_EPOCH = datetime(1970, 1, 1)
+_metadata = MetaData()
+_metadata_lock = threading.Lock()
+
+
+def partition_bounds(moment, days):
+    """
+    Returns:
+        tuple: (start, end) of the partition of `days` days containing `moment`.
+    """
+    elapsed = (moment - _EPOCH).days
+    start = _EPOCH + timedelta(days=elapsed - elapsed % days)
+    return start, start + timedelta(days=days)
+
+
+def partition_table(start, end):
+    """
+    Return the table of a partition, with the columns and indexes of the log table.
+    """
+    name = f'{PARTITION_PREFIX}{start:{PARTITION_DATE_FORMAT}}_{end:{PARTITION_DATE_FORMAT}}'
+    with _metadata_lock:
+        table = _metadata.tables.get(name)
+        if table is None:
+            head = Log.__table__
+            columns = [Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable)
+                       for column in head.columns]
+            indexes = [Index(index.name.replace(head.name, name, 1), *[column.name for column in index.columns])
+                       for index in head.indexes]
+            table = Table(name, _metadata, *columns, *indexes)
+    return table
+
+
+def list_partitions(connection):
+    """
+    Returns:
+        list: (start, end, table) of every partition, oldest first.
+    """
+    names = connection.execute(
+        text("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB :pattern"),
+        {'pattern': PARTITION_PREFIX + '[0-9]*'}).scalars()
+    partitions = []
+    for name in names:
+        start, end = (datetime.strptime(bound, PARTITION_DATE_FORMAT)
+                      for bound in name[len(PARTITION_PREFIX):].split('_'))
+        partitions.append((start, end, partition_table(start, end)))
+    return sorted(partitions, key=lambda partition: partition[0])
+
+
+def log_sources(connection, time_gte=None, time_lte=None):
+    """
+    Route a time range to the tables holding its logs.
+
+    Returns:
+        list: Partition tables overlapping [time_gte, time_lte] oldest first,
+        followed by the head log table. Their time ranges do not overlap, so
+        reading them in this order returns logs in creation order.
+    """
+    sources = [table for start, end, table in list_partitions(connection)
+               if (time_gte is None or end > time_gte) and (time_lte is None or start <= time_lte)]
+    sources.append(Log.__table__)
+    return sources
+
+
+def seal_partitions(engine, days, now, grace=timedelta(0)):
+    """
+    Move the rows of every partition that ended before now - grace from the
+    head log table to the partition's own table, one transaction per partition.
+    The grace period leaves time for rows still queued in the log writer.
+
+    Returns:
+        list: Names of the partitions that received rows.
+    """
+    head = Log.__table__
+    boundary, _ = partition_bounds(now - grace, days)
+    sealed = []
+    while True:
+        with engine.begin() as connection:
+            oldest = connection.execute(select(func.min(head.c.created_at))).scalar()
+            if oldest is None or oldest >= boundary:
+                return sealed
+            start, end = partition_bounds(oldest, days)
+            table = partition_table(start, end)
+            table.create(connection, checkfirst=True)
+            in_partition = and_(head.c.created_at >= start, head.c.created_at < end)
+            connection.execute(insert(table).from_select([column.name for column in head.columns],
+                                                         select(head).where(in_partition)))
+            connection.execute(delete(head).where(in_partition))
+            sealed.append(table.name)
+
+
+def drop_expired_partitions(engine, retention_days, now):
+    """
+    Downsample every partition that ended more than retention_days ago into
+    hourly LogRollup counts, then drop it, in one transaction per partition.
+
+    Returns:
+        list: Names of the dropped partitions.
+    """
+    cutoff = now - timedelta(days=retention_days)
+    with engine.connect() as connection:
+        expired = [table for _, end, table in list_partitions(connection) if end <= cutoff]
+    for table in expired:
+        with engine.begin() as connection:
+            downsample(connection, table)
+            table.drop(connection)
+    return [table.name for table in expired]
+
+
+def downsample(connection, table):
+    """
+    Add the per-endpoint, per-status hourly request counts of a log table to LogRollup.
+    """
+    rollup = LogRollup.__table__
+    # Same text format SQLAlchemy stores DateTime values in
+    hour = func.strftime('%Y-%m-%d %H:00:00.000000', table.c.created_at)
+    counts = select(hour, table.c.endpoint_name, table.c.status_code, func.count()) \
+        .where(table.c.created_at.isnot(None)) \
+        .group_by(hour, table.c.endpoint_name, table.c.status_code)
+    statement = sqlite_insert(rollup).from_select(['hour', 'endpoint_name', 'status_code', 'count'], counts)
+    statement = statement.on_conflict_do_update(
+        index_elements=[rollup.c.hour, rollup.c.endpoint_name, rollup.c.status_code],
+        set_={'count': rollup.c.count + statement.excluded['count']})
+    connection.execute(statement)
+
+
+def maintain_logs(engine, config, now=None, archive=None):
+    """
+    Seal finished partitions, then downsample and drop the expired ones. With
+    a LogArchive, the partitions due for archiving are then moved to it and
+    its expired segments are downsampled and deleted.
+
+    Returns:
+        dict: Names of the 'sealed', 'dropped' and 'archived' partitions.
+    """
+    now = now or datetime.utcnow()
+    retention_days = config.get('LOG_RETENTION_DAYS', 30)
+    sealed = seal_partitions(engine, config.get('LOG_PARTITION_DAYS', 1), now,
+                             timedelta(seconds=config.get('LOG_PARTITION_GRACE', 3600)))
+    dropped = drop_expired_partitions(engine, retention_days, now)
+    archived = []
+    if archive is not None:
+        archived = archive.archive_partitions(engine, now)
+        dropped += archive.drop_expired(engine, retention_days, now)
+    return {'sealed': sealed, 'dropped': dropped, 'archived': archived}
+
+
+class LogMaintenance:
+    """
+    Background thread running maintain_logs every LOG_MAINTENANCE_INTERVAL
+    seconds. A falsy interval disables it.
+
+    The thread is started by the first request each process serves, so
+    servers that fork workers after loading the app run it in the workers.
+    """
+
+    def __init__(self, app=None):
+        self._thread = None
+        self._stop_event = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.interval = app.config.get('LOG_MAINTENANCE_INTERVAL')
+        self._config = app.config
+        self._logger = app.logger
+        self._archive = app.extensions.get('log_archive')
+        with app.app_context():
+            self._engine = db.engine
+        self._lock = threading.Lock()
+        app.extensions['log_maintenance'] = self
+        if self.interval:
+            app.before_request(self.start)
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='log-maintenance', daemon=True)
+                    self._thread.start()
+
+    def _after_fork(self):
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def run_once(self, now=None):
+        return maintain_logs(self._engine, self._config, now, self._archive)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                self._logger.error(f"An error occurred during log maintenance: {e}")
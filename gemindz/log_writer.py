@@ -0,0 +1,239 @@
+import atexit
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from database import db
+from latency import record_latencies
+from models import Log
+
+# Control messages understood by the writer thread
+_STOP = object()
+
+
+class LogWriter:
+    """
+    Write-behind pipeline for request logs.
+
+    Request handlers only enqueue a row; a background thread drains the bounded
+    queue and bulk-inserts the rows in a single transaction whenever the batch
+    reaches LOG_BATCH_SIZE rows or LOG_FLUSH_INTERVAL seconds have passed since
+    the first row of the batch was queued.
+
+    When the queue is full the LOG_OVERFLOW_POLICY decides what happens:
+    - drop: discard the new row.
+    - sample: once the queue is above LOG_QUEUE_HIGH_WATER, only keep a
+      LOG_SAMPLE_RATE fraction of new rows; discard them when it is full.
+    - block: wait up to LOG_BLOCK_TIMEOUT seconds for room, then discard.
+
+    The thread is started by the first row logged in each process, so servers
+    that fork workers after loading the app give every worker its own writer.
+    """
+
+    OVERFLOW_POLICIES = ('drop', 'sample', 'block')
+
+    def __init__(self, app=None):
+        self._queue = None
+        self._thread = None
+        self._engine = None
+        self._logger = None
+        self._lock = threading.Lock()
+        self._stopped = False
+        self.enqueued = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.failed = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.batch_size = config.get('LOG_BATCH_SIZE', 500)
+        self.flush_interval = config.get('LOG_FLUSH_INTERVAL', 1.0)
+        self.overflow_policy = config.get('LOG_OVERFLOW_POLICY', 'drop')
+        self.sample_rate = config.get('LOG_SAMPLE_RATE', 0.1)
+        self.block_timeout = config.get('LOG_BLOCK_TIMEOUT', 0.5)
+        self.shutdown_timeout = config.get('LOG_SHUTDOWN_TIMEOUT', 5.0)
+        if self.overflow_policy not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown LOG_OVERFLOW_POLICY: {self.overflow_policy!r}")
+
+        maxsize = config.get('LOG_QUEUE_MAXSIZE', 10000)
+        self.high_water = int(maxsize * config.get('LOG_QUEUE_HIGH_WATER', 0.8))
+        self._queue = queue.Queue(maxsize=maxsize)
+
+        # The writer uses its own connections so a logging failure never
+        # touches the session of the request being logged
+        with app.app_context():
+            self._engine = db.engine
+        self._logger = app.logger
+
+        app.extensions['log_writer'] = self
+        atexit.register(self.stop)
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+                self._thread.start()
+
+    def _after_fork(self):
+        # The parent's thread does not exist in the child, and its locks may be held
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._thread = None
+        self.enqueued = self.dropped = self.flushed = self.failed = 0
+
+    def log_request(self, endpoint, method, status_code, error=None, duration_ms=None, route=None,
+                    query_count=None, query_time_ms=None):
+        """
+        Queue a request log row. Never blocks longer than LOG_BLOCK_TIMEOUT.
+
+        The duration of requests with a route (the URL rule that matched) is
+        also added to the latency histogram of that route.
+
+        Returns:
+            bool: True if the row was queued, False if it was dropped.
+        """
+        if self._stopped:
+            self._count('dropped')
+            return False
+        if self._thread is None:
+            self.start()
+
+        row = {
+            'endpoint_name': endpoint,
+            'method': method,
+            'status_code': status_code,
+            'error': error,
+            'duration_ms': duration_ms,
+            'query_count': query_count,
+            'query_time_ms': query_time_ms,
+            'created_at': datetime.utcnow(),
+        }
+
+        if self.overflow_policy == 'sample' and self._queue.qsize() >= self.high_water:
+            if random.random() >= self.sample_rate:
+                self._count('dropped')
+                return False
+
+        try:
+            if self.overflow_policy == 'block':
+                self._queue.put((row, route), timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait((row, route))
+        except queue.Full:
+            self._count('dropped')
+            return False
+
+        self._count('enqueued')
+        return True
+
+    def flush(self, timeout=None):
+        """
+        Write every row queued so far and wait until it is committed.
+
+        Args:
+            timeout (float): Seconds to wait, for room in the queue then for
+                the write, None to wait forever.
+
+        Returns:
+            bool: True if the flush completed within the timeout.
+        """
+        if self._thread is None and not self._stopped:
+            self.start()
+        if not self._thread or not self._thread.is_alive():
+            return False
+        done = threading.Event()
+        # A full queue behind a wedged writer thread must not hang the caller
+        started = time.monotonic()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        if timeout is not None:
+            timeout = max(0, timeout - (time.monotonic() - started))
+        return done.wait(timeout)
+
+    def stop(self):
+        """
+        Flush the remaining rows and stop the writer thread, waiting at most
+        LOG_SHUTDOWN_TIMEOUT seconds for both.
+        """
+        if self._stopped:
+            return
+        self._stopped = True
+        if self._thread and self._thread.is_alive():
+            # A full queue behind a wedged writer thread must not hang the shutdown
+            started = time.monotonic()
+            try:
+                self._queue.put(_STOP, timeout=self.shutdown_timeout)
+            except queue.Full:
+                self._logger.error(f"Stopped the log writer with {self._queue.qsize()} request logs unwritten")
+                return
+            timeout = self.shutdown_timeout
+            if timeout is not None:
+                timeout = max(0, timeout - (time.monotonic() - started))
+            self._thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enqueued': self.enqueued,
+                'dropped': self.dropped,
+                'flushed': self.flushed,
+                'failed': self.failed,
+                'queue_depth': self._queue.qsize() if self._queue else 0,
+            }
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                self._write(batch)
+                return
+            if isinstance(item, threading.Event):
+                self._write(batch)
+                batch, deadline = [], None
+                item.set()
+                continue
+
+            if item is not None:
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._write(batch)
+                batch, deadline = [], None
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            with self._engine.begin() as connection:
+                connection.execute(insert(Log), [row for row, _ in batch])
+                record_latencies(connection, [(route, row['created_at'], row['duration_ms'])
+                                              for row, route in batch
+                                              if route is not None and row['duration_ms'] is not None])
+        except Exception as e:
+            self._count('failed', len(batch))
+            self._logger.error(f"An error occurred while writing {len(batch)} request logs: {e}")
+        else:
+            self._count('flushed', len(batch))
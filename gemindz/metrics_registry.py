@@ -0,0 +1,193 @@
+import threading
+from bisect import bisect_left
+
+
+class MetricsRegistry:
+    """
+    Thread-safe registry of counters and histograms.
+
+    Every thread updates its own shard without locking; shards are only merged
+    when the metrics are collected. Shards of finished threads are folded into
+    a single retired shard so short-lived request threads do not accumulate.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._metrics = {}
+        self._callbacks = {}
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=()):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def gauge_callback(self, name, documentation, callback, kind='gauge'):
+        """
+        Register a metric whose value is read from callback() on every
+        collection. Registering the same name again replaces the callback.
+        """
+        with self._lock:
+            self._callbacks[name] = (documentation, callback, kind)
+
+    def shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def collect(self):
+        """
+        Returns:
+            dict: Merged value of every (metric name, label values) pair.
+        """
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    _merge(self._retired, shard)
+            self._shards = alive
+            merged = _merge({}, self._retired)
+            for _, shard in alive:
+                _merge(merged, dict(shard))
+        return merged
+
+    def render(self):
+        """
+        Render every metric in the Prometheus text exposition format.
+        """
+        values = self.collect()
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render(values))
+        with self._lock:
+            callbacks = list(self._callbacks.items())
+        for name, (documentation, callback, kind) in callbacks:
+            try:
+                value = callback()
+            except Exception:
+                continue
+            lines += [f'# HELP {name} {documentation}', f'# TYPE {name} {kind}', f'{name} {_format(value)}']
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+
+class Counter:
+    def __init__(self, registry, name, documentation, labelnames):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def inc(self, amount=1, **labels):
+        shard = self.registry.shard()
+        key = (self.name, tuple(str(labels[label]) for label in self.labelnames))
+        shard[key] = shard.get(key, 0) + amount
+
+    def render(self, values):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for (name, labelvalues), value in sorted(values.items()):
+            if name == self.name:
+                lines.append(f'{name}{_labels(self.labelnames, labelvalues)} {_format(value)}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, registry, name, documentation, labelnames, buckets):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        shard = self.registry.shard()
+        key = (self.name, tuple(str(labels[label]) for label in self.labelnames))
+        # Per-bucket counts, then the overflow bucket, the sum and the count
+        values = shard.get(key)
+        if values is None:
+            values = shard[key] = [0] * (len(self.buckets) + 3)
+        values[bisect_left(self.buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    def render(self, values):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for (name, labelvalues), counts in sorted(values.items()):
+            if name != self.name:
+                continue
+            cumulative = 0
+            for bound, count in zip([*self.buckets, '+Inf'], counts):
+                cumulative += count
+                labels = _labels(self.labelnames + ('le',), labelvalues + (_format(bound),))
+                lines.append(f'{name}_bucket{labels} {cumulative}')
+            labels = _labels(self.labelnames, labelvalues)
+            lines.append(f'{name}_sum{labels} {_format(counts[-2])}')
+            lines.append(f'{name}_count{labels} {counts[-1]}')
+        return lines
+
+
+def _merge(target, shard):
+    for key, value in shard.items():
+        if isinstance(value, list):
+            current = target.get(key)
+            target[key] = [a + b for a, b in zip(current, value)] if current else list(value)
+        else:
+            target[key] = target.get(key, 0) + value
+    return target
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('{}="{}"'.format(name, value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                     for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _format(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+registry = MetricsRegistry()
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+requests_total = registry.counter(
+    'gemindz_http_requests_total', 'Total number of HTTP requests.',
+    ('blueprint', 'endpoint', 'method', 'status_class'))
+request_duration = registry.histogram(
+    'gemindz_http_request_duration_seconds', 'Time spent handling HTTP requests.',
+    ('blueprint', 'endpoint'), LATENCY_BUCKETS)
+request_db_duration = registry.histogram(
+    'gemindz_http_request_db_duration_seconds', 'Time spent executing SQL statements per HTTP request.',
+    ('blueprint', 'endpoint'), LATENCY_BUCKETS)
+
+
+def observe_request(blueprint, endpoint, method, status_code, duration, db_duration=0.0):
+    """
+    Record a handled request. The database time is the time the request spent
+    in SQL statements (see query_stats.py). Requests without a duration are
+    only counted.
+    """
+    blueprint = blueprint or 'none'
+    endpoint = endpoint or 'unmatched'
+    requests_total.inc(blueprint=blueprint, endpoint=endpoint, method=method,
+                       status_class=f'{status_code // 100}xx')
+    if duration is None:
+        return
+    request_duration.observe(duration, blueprint=blueprint, endpoint=endpoint)
+    request_db_duration.observe(db_duration, blueprint=blueprint, endpoint=endpoint)
@@ -1,5 +1,5 @@
 from database import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import hash_password, verify_password
 from datetime import datetime
 
 
@@ -11,9 +11,18 @@ class BaseMixin(object):
 class TestCase(BaseMixin, db.Model):
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
+    # Row version, incremented in the UPDATE statement itself. Not a version_id_col,
+    # so concurrent writes stay last-write-wins instead of raising StaleDataError
+    version = db.Column(db.Integer, nullable=False, server_default='1', onupdate=db.literal_column('version') + 1)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    # Define a relationship with ExecutionResults
-    execution_results = db.relationship('ExecutionResult', backref='test_case', cascade='all, delete-orphan')
+    # A test case deleted by two requests at once is simply gone
+    __mapper_args__ = {'confirm_deleted_rows': False}
+
+    # Define a relationship with ExecutionResults; deleting a test case leaves
+    # its results to the ON DELETE CASCADE of the database instead of loading them
+    execution_results = db.relationship('ExecutionResult', backref='test_case', cascade='all, delete-orphan',
+                                        passive_deletes=True)
 
     def __init__(self, name, description):
         self.name = name
@@ -25,12 +34,93 @@ class ExecutionResult(BaseMixin, db.Model):
     test_asset_id = db.Column(db.Integer, nullable=False)
     result = db.Column(db.String(50), nullable=False)
 
+    __table_args__ = (
+        # History of a test asset, optionally filtered by test case or result; SQLite
+        # appends the rowid to every index, so each one also returns rows in id order
+        db.Index('ix_execution_result_test_asset_id', 'test_asset_id'),
+        db.Index('ix_execution_result_test_asset_id_test_case_id', 'test_asset_id', 'test_case_id'),
+        db.Index('ix_execution_result_test_asset_id_result', 'test_asset_id', 'result'),
+        # Children removed by the ON DELETE CASCADE of a test case
+        db.Index('ix_execution_result_test_case_id', 'test_case_id'),
+    )
+
     def __init__(self, test_case_id, test_asset_id, result):
         self.test_case_id = test_case_id
         self.test_asset_id = test_asset_id
         self.result = result
 
 
+class ExecutionResultSummary(db.Model):
+    # Number of execution results per (test asset, test case, result), kept in
+    # step with ExecutionResult by rollups.py
+    test_asset_id = db.Column(db.Integer, primary_key=True)
+    test_case_id = db.Column(db.Integer, db.ForeignKey('test_case.id', ondelete='CASCADE'), primary_key=True)
+    result = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Rows removed by the cascade when a test case is deleted
+        db.Index('ix_execution_result_summary_test_case_id', 'test_case_id'),
+    )
+
+
+class ExecutionResultAssetTrend(db.Model):
+    # Number of execution results per test asset, result and hour or day
+    # bucket, kept in step with ExecutionResult by rollups.py. Results of
+    # deleted test cases stay counted, as history of the asset.
+    granularity = db.Column(db.Integer, primary_key=True)  # Bucket size in seconds
+    test_asset_id = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)  # Start of the bucket
+    result = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ExecutionResultCaseTrend(db.Model):
+    # Same as ExecutionResultAssetTrend, per test case across test assets
+    granularity = db.Column(db.Integer, primary_key=True)
+    test_case_id = db.Column(db.Integer, db.ForeignKey('test_case.id', ondelete='CASCADE'), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)
+    result = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        # Rows removed by the cascade when a test case is deleted
+        db.Index('ix_execution_result_case_trend_test_case_id', 'test_case_id'),
+    )
+
+
+class FlakinessState(db.Model):
+    # Outcome history of a (test case, test asset) pair, updated by flakiness.py
+    # as results are recorded
+    test_case_id = db.Column(db.Integer, db.ForeignKey('test_case.id', ondelete='CASCADE'), primary_key=True)
+    test_asset_id = db.Column(db.Integer, primary_key=True)
+    last_result = db.Column(db.String(50), nullable=False)
+    run_count = db.Column(db.Integer, nullable=False, default=0)
+    flip_count = db.Column(db.Integer, nullable=False, default=0)  # Runs with another result than the previous one
+    flip_rate = db.Column(db.Float, nullable=False, default=0.0)  # Exponentially decayed share of flipping runs
+    last_run_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        # GET /execution_results/flaky reads the highest rates first, overall or for a test asset
+        db.Index('ix_flakiness_state_flip_rate', 'flip_rate'),
+        db.Index('ix_flakiness_state_test_asset_id_flip_rate', 'test_asset_id', 'flip_rate'),
+    )
+
+
+class TableVersion(db.Model):
+    # Version of a whole table, bumped by every write to it (see versioning.py)
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class SchemaVersion(db.Model):
+    # Fingerprint of the schema the database was last migrated to (see schema.py)
+    name = db.Column(db.String(50), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    applied_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
 class User(BaseMixin, db.Model):
     username = db.Column(db.String(50), unique=True, nullable=False)
     password_hash = db.Column(db.String(128), nullable=False)
@@ -38,14 +128,14 @@ class User(BaseMixin, db.Model):
 
     def __init__(self, username, password, role='user'):
         self.username = username
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
         self.role = role
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
 
 
 class Log(BaseMixin, db.Model):
@@ -53,20 +143,43 @@ class Log(BaseMixin, db.Model):
     method = db.Column(db.String(10), nullable=False)
     status_code = db.Column(db.Integer, nullable=False)
     error = db.Column(db.Text)
-
-    def __init__(self, endpoint_name, method, status_code, error=None):
+    duration_ms = db.Column(db.Float)
+    # SQL statements the request ran and the time spent in them (see query_stats.py)
+    query_count = db.Column(db.Integer)
+    query_time_ms = db.Column(db.Float)
+
+    __table_args__ = (
+        # GET /logs filters on one of these columns and orders by (created_at, id);
+        # SQLite appends the rowid to every index, so each one also serves the id tiebreak
+        db.Index('ix_log_created_at', 'created_at'),
+        db.Index('ix_log_endpoint_name_created_at', 'endpoint_name', 'created_at'),
+        db.Index('ix_log_status_code_created_at', 'status_code', 'created_at'),
+        # Ids stay unique across the partitions rows are moved to (see log_partitions.py)
+        {'sqlite_autoincrement': True},
+    )
+
+    def __init__(self, endpoint_name, method, status_code, error=None, duration_ms=None, query_count=None,
+                 query_time_ms=None):
         self.endpoint_name = endpoint_name
         self.method = method
         self.status_code = status_code
         self.error = error
+        self.duration_ms = duration_ms
+        self.query_count = query_count
+        self.query_time_ms = query_time_ms
+
+
+class LogRollup(db.Model):
+    # Hourly request counts kept after old log partitions are dropped
+    hour = db.Column(db.DateTime, primary_key=True)
+    endpoint_name = db.Column(db.String(100), primary_key=True)
+    status_code = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
 
-    @classmethod
-    def log_request(cls, endpoint, method, status_code, error=None):
-        new_log = cls(
-            endpoint_name=endpoint,
-            method=method,
-            status_code=status_code,
-            error=error
-        )
-        db.session.add(new_log)
-        db.session.commit()
+class LatencyHistogram(db.Model):
+    # Hourly request duration histogram per route, with the buckets of latency.py
+    hour = db.Column(db.DateTime, primary_key=True)
+    endpoint_name = db.Column(db.String(100), primary_key=True)  # URL rule, unlike the request path of Log
+    bucket = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,59 @@
+import base64
+import binascii
+import json
+from datetime import datetime, timezone
+
+
+def encode_cursor(created_at, row_id):
+    """
+    Build an opaque keyset cursor pointing after the row (created_at, id).
+    """
+    payload = json.dumps([created_at.isoformat(), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Returns:
+        tuple: (created_at, id) of the last row of the previous page.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+
+def parse_limit(value, default, maximum):
+    """
+    Parse a 'limit' query parameter, clamping it to the configured maximum.
+
+    Raises:
+        ValueError: If the limit is not a positive integer.
+    """
+    if value is None:
+        return default
+    limit = int(value)
+    if limit < 1:
+        raise ValueError(f"Invalid limit: {value!r}")
+    return min(limit, maximum)
+
+
+def parse_time(value):
+    """
+    Parse an ISO 8601 query parameter to a naive UTC datetime, the form times
+    are stored in. Times with an offset, e.g. a 'Z' suffix, are converted to UTC.
+
+    Raises:
+        ValueError: If the value is not an ISO 8601 date.
+    """
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
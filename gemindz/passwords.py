@@ -0,0 +1,141 @@
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from flask import current_app, has_app_context
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+
+def normalize_method(method):
+    """
+    Returns:
+        str: The method with its default cost parameters filled in, as Werkzeug
+        writes it at the start of the hashes, e.g. 'pbkdf2:sha256:600000' for
+        'pbkdf2:sha256'. Methods Werkzeug does not know are returned unchanged.
+    """
+    name, *args = method.split(':')
+    if name == 'scrypt' and not args:
+        return 'scrypt:32768:8:1'
+    if name == 'pbkdf2' and len(args) < 2:
+        hash_name = args[0] if args else 'sha256'
+        return f'pbkdf2:{hash_name}:{DEFAULT_PBKDF2_ITERATIONS}'
+    return method
+
+
+class PasswordHashingBusy(Exception):
+    """
+    Raised when PASSWORD_HASH_MAX_PENDING hashing jobs are already in flight
+    and none finished within PASSWORD_HASH_QUEUE_TIMEOUT seconds.
+    """
+
+
+class PasswordHasher:
+    """
+    Hash and verify passwords in a pool of worker processes, so the key
+    derivation runs outside the GIL and does not hold up other requests.
+
+    PASSWORD_HASH_METHOD is a Werkzeug method string including its cost
+    parameters (e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'); hashes
+    made with another method or cost are reported by needs_rehash().
+
+    The pool has PASSWORD_HASH_WORKERS processes (half the CPUs by default, 0
+    hashes in the calling thread). At most PASSWORD_HASH_MAX_PENDING jobs may
+    be queued or running; callers wait up to PASSWORD_HASH_QUEUE_TIMEOUT
+    seconds for a slot, then get PasswordHashingBusy.
+    """
+
+    def __init__(self, app=None, method=DEFAULT_METHOD, workers=0):
+        self.method = normalize_method(method)
+        self.workers = workers
+        self.max_pending = None
+        self.queue_timeout = None
+        self._slots = None
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        # Hashes start with the method in this form, which needs_rehash compares
+        self.method = normalize_method(config.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD))
+        workers = config.get('PASSWORD_HASH_WORKERS')
+        self.workers = max(1, (os.cpu_count() or 2) // 2) if workers is None else workers
+        self.max_pending = config.get('PASSWORD_HASH_MAX_PENDING') or self.workers * 4
+        self.queue_timeout = config.get('PASSWORD_HASH_QUEUE_TIMEOUT', 1.0)
+        if self.workers:
+            self._slots = threading.BoundedSemaphore(self.max_pending)
+        app.extensions['password_hasher'] = self
+        atexit.register(self.shutdown)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        return password_hash.split('$', 1)[0] != self.method
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _run(self, function, *args):
+        if not self.workers:
+            return function(*args)
+
+        if self._slots is not None and not self._slots.acquire(timeout=self.queue_timeout):
+            raise PasswordHashingBusy()
+        try:
+            executor = self._pool()
+            return executor.submit(function, *args).result()
+        except BrokenProcessPool:
+            # A worker died; start a new pool for the next caller
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+            raise
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+    def _pool(self):
+        # Started on first use, and again in every forked server worker, since
+        # a process pool cannot be shared across a fork
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+                self._executor_pid = os.getpid()
+            return self._executor
+
+
+# Used outside an application, or by applications without a hasher
+_inline_hasher = PasswordHasher()
+
+
+def current_hasher():
+    if has_app_context():
+        return current_app.extensions.get('password_hasher', _inline_hasher)
+    return _inline_hasher
+
+
+def hash_password(password):
+    return current_hasher().hash(password)
+
+
+def verify_password(password_hash, password):
+    return current_hasher().verify(password_hash, password)
+
+
+def needs_rehash(password_hash):
+    return current_hasher().needs_rehash(password_hash)
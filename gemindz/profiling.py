@@ -0,0 +1,153 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import re
+import threading
+import uuid
+from datetime import datetime
+
+from flask import g, request
+from flask_jwt_extended import verify_jwt_in_request
+
+from security import current_user_role
+
+PROFILE_SUFFIX = '.pstats'
+# <created_at>--<endpoint>--<request id>.pstats
+PROFILE_ID_PATTERN = re.compile(r'^(?P<created_at>\d{8}T\d{12})--(?P<endpoint>[\w.]+)--(?P<request_id>[\w-]{1,64})$')
+_UNSAFE_ENDPOINT_CHARACTERS = re.compile(r'[^\w.]')
+_UNSAFE_REQUEST_ID_CHARACTERS = re.compile(r'[^\w-]')
+
+
+class RequestProfiler:
+    """
+    Profile requests with cProfile and keep their pstats files in a bounded
+    ring on disk, named after the endpoint and the request ID.
+
+    Disabled unless PROFILING_ENABLED is set. Once enabled, a request is
+    profiled when:
+    - it is sampled, with probability PROFILING_SAMPLE_RATE, or
+    - it carries the PROFILING_HEADER header (X-Profile) and an admin access token.
+
+    Files are written to PROFILING_DIRECTORY (<instance path>/profiles by
+    default); only the PROFILING_MAX_FILES most recent ones are kept. Only the
+    thread running the view is profiled, and a streamed body is not included.
+    """
+
+    def __init__(self, app=None):
+        self.directory = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.sample_rate = config.get('PROFILING_SAMPLE_RATE', 0.0)
+        self.header = config.get('PROFILING_HEADER', 'X-Profile')
+        self.max_files = config.get('PROFILING_MAX_FILES', 100)
+        self.directory = config.get('PROFILING_DIRECTORY') or os.path.join(app.instance_path, 'profiles')
+        app.extensions['request_profiler'] = self
+        if config.get('PROFILING_ENABLED'):
+            app.before_request(self._start)
+            app.after_request(self._stop)
+            app.teardown_request(self._discard)
+
+    def list_profiles(self):
+        """
+        Returns:
+            list: Dicts describing the stored profiles, most recent first.
+        """
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        profiles = []
+        for name in names:
+            profile_id = name[:-len(PROFILE_SUFFIX)]
+            match = PROFILE_ID_PATTERN.match(profile_id)
+            if not name.endswith(PROFILE_SUFFIX) or not match:
+                continue
+            profiles.append({
+                'id': profile_id,
+                'endpoint': match['endpoint'],
+                'request_id': match['request_id'],
+                'created_at': datetime.strptime(match['created_at'], '%Y%m%dT%H%M%S%f').isoformat(),
+                'size': os.path.getsize(os.path.join(self.directory, name)),
+            })
+        return sorted(profiles, key=lambda profile: profile['id'], reverse=True)
+
+    def profile_path(self, profile_id):
+        """
+        Returns:
+            str: Path of the pstats file of a profile, None if there is no such profile.
+        """
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        path = os.path.join(self.directory, profile_id + PROFILE_SUFFIX)
+        return path if os.path.isfile(path) else None
+
+    def summary(self, profile_id, sort='cumulative', limit=50):
+        """
+        Returns:
+            str: The `limit` most expensive functions of a profile as text.
+        """
+        output = io.StringIO()
+        stats = pstats.Stats(self.profile_path(profile_id), stream=output)
+        stats.sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+    def _should_profile(self):
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        if self.header not in request.headers:
+            return False
+        try:
+            verify_jwt_in_request(optional=True)
+            return current_user_role() == 'admin'
+        except Exception:
+            # Invalid tokens are reported by the view itself
+            return False
+
+    def _start(self):
+        if not self._should_profile():
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this thread
+            return
+        g.profiler = profiler
+
+    def _stop(self, response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+
+        request_id = _UNSAFE_REQUEST_ID_CHARACTERS.sub('_', request.headers.get('X-Request-ID', '')[:64])
+        endpoint = _UNSAFE_ENDPOINT_CHARACTERS.sub('_', request.endpoint or 'unmatched')
+        profile_id = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}--{endpoint}--{request_id or uuid.uuid4().hex}"
+        os.makedirs(self.directory, exist_ok=True)
+        profiler.dump_stats(os.path.join(self.directory, profile_id + PROFILE_SUFFIX))
+        self._prune()
+
+        response.headers['X-Profile-Id'] = profile_id
+        return response
+
+    def _discard(self, exception=None):
+        # Requests that failed before after_request still stop their profiler
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+
+    def _prune(self):
+        with self._lock:
+            profiles = sorted(name for name in os.listdir(self.directory) if name.endswith(PROFILE_SUFFIX))
+            for name in profiles[:max(len(profiles) - self.max_files, 0)]:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    # Already pruned by another worker
+                    pass
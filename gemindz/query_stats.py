@@ -0,0 +1,157 @@
+import logging
+import re
+import time
+from collections import Counter
+from functools import lru_cache
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+slow_query_logger = logging.getLogger('gemindz.slow_queries')
+repeated_query_logger = logging.getLogger('gemindz.repeated_queries')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_WHITESPACE = re.compile(r'\s+')
+_COMMA = re.compile(r'\s*,\s*')
+_PLACEHOLDER_LIST = re.compile(r'\(\?(?:, \?)+\)')
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(statement):
+    """
+    Reduce a statement to its shape: literals become placeholders, whitespace
+    is collapsed and IN lists of any length are folded into one placeholder.
+    """
+    statement = _STRING.sub('?', statement)
+    statement = _NUMBER.sub('?', statement)
+    statement = _WHITESPACE.sub(' ', statement).strip()
+    statement = _COMMA.sub(', ', statement)
+    return _PLACEHOLDER_LIST.sub('(?)', statement)
+
+
+class QueryStats:
+    """
+    SQL statements executed while handling one request.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    @property
+    def duration_ms(self):
+        return self.duration * 1000
+
+    def record(self, statement, elapsed):
+        """
+        Returns:
+            str: The shape of the statement.
+        """
+        shape = normalize_sql(statement)
+        self.count += 1
+        self.duration += elapsed
+        self.shapes[shape] += 1
+        return shape
+
+    def repeated(self, threshold):
+        """
+        Returns:
+            list: (shape, count) of the statement shapes run more than threshold
+            times, the typical sign of an N+1 query pattern.
+        """
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > threshold]
+
+
+def current_query_stats():
+    """
+    Returns:
+        QueryStats: Statements of the current request so far, None outside requests.
+    """
+    if not has_request_context():
+        return None
+    stats = g.get('query_stats')
+    if stats is None:
+        stats = g.query_stats = QueryStats()
+    return stats
+
+
+class QueryInstrumentation:
+    """
+    Report the SQL statements of every request.
+
+    - X-Query-Count and X-Query-Time-Ms response headers, when
+      QUERY_STATS_HEADERS is set (defaults to the debug mode).
+    - Statements slower than QUERY_SLOW_THRESHOLD_MS are logged with their
+      normalized SQL to the 'gemindz.slow_queries' logger, and to
+      QUERY_SLOW_LOG_FILE if set.
+    - Requests running the same statement shape more than QUERY_REPEAT_THRESHOLD
+      times are logged to the 'gemindz.repeated_queries' logger, and get an
+      X-Query-Repeated header when headers are enabled.
+
+    The counts themselves are collected for every request by the cursor
+    execution hooks below, whether or not the extension is set up.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        self.headers = config.get('QUERY_STATS_HEADERS')
+        if self.headers is None:
+            self.headers = app.debug
+        self.repeat_threshold = config.get('QUERY_REPEAT_THRESHOLD', 10)
+
+        log_file = config.get('QUERY_SLOW_LOG_FILE')
+        if log_file and not any(getattr(handler, 'baseFilename', None) == log_file
+                                for handler in slow_query_logger.handlers):
+            handler = logging.FileHandler(log_file)
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            slow_query_logger.addHandler(handler)
+
+        app.extensions['query_instrumentation'] = self
+        app.after_request(self._report)
+
+    def _report(self, response):
+        stats = current_query_stats()
+        if stats is None or not stats.count:
+            return response
+
+        repeated = stats.repeated(self.repeat_threshold) if self.repeat_threshold else []
+        for shape, count in repeated:
+            repeated_query_logger.warning("%s %s ran the same statement %d times: %s",
+                                          request.method, request.path, count, shape)
+
+        if self.headers:
+            response.headers['X-Query-Count'] = str(stats.count)
+            response.headers['X-Query-Time-Ms'] = f'{stats.duration_ms:.3f}'
+            if repeated:
+                response.headers['X-Query-Repeated'] = str(repeated[0][1])
+        return response
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('statement_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _stop_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['statement_started'].pop()
+    stats = current_query_stats()
+    if stats is None:
+        return
+    shape = stats.record(statement, elapsed)
+    if elapsed * 1000 >= current_app.config.get('QUERY_SLOW_THRESHOLD_MS', 100):
+        slow_query_logger.warning("%.1f ms in %s %s: %s", elapsed * 1000, request.method, request.path, shape)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _discard_statement_timer(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get('statement_started'):
+        connection.info['statement_started'].pop()
@@ -0,0 +1,203 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, bindparam, delete, event, func, insert, inspect, literal, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import ExecutionResult, ExecutionResultAssetTrend, ExecutionResultCaseTrend, ExecutionResultSummary
+
+summary_table = ExecutionResultSummary.__table__
+# Trend tables and the column they are kept per
+trend_tables = {
+    'test_asset_id': ExecutionResultAssetTrend.__table__,
+    'test_case_id': ExecutionResultCaseTrend.__table__,
+}
+
+HOUR = 3600
+DAY = 86400
+# Bucket sizes the trends are stored in, in seconds; longer buckets are merged from them
+TREND_GRANULARITIES = (HOUR, DAY)
+# Text format SQLAlchemy stores DateTime values in, truncated to each granularity
+_BUCKET_FORMATS = {HOUR: '%Y-%m-%d %H:00:00.000000', DAY: '%Y-%m-%d 00:00:00.000000'}
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def record_results(connection, rows):
+    """
+    Add execution results to the summary and trend counts.
+
+    Must be called on the connection that inserted the results so the counts
+    are committed or rolled back together with them.
+
+    Args:
+        connection: Connection of the inserting transaction.
+        rows (list): Dicts with 'test_asset_id', 'test_case_id', 'result' and
+            'created_at', the time bucket the result is counted in for the trends.
+    """
+    counts = _count(rows)
+    if not counts:
+        return
+    statement = sqlite_insert(summary_table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[summary_table.c.test_asset_id, summary_table.c.test_case_id, summary_table.c.result],
+        set_={'count': summary_table.c.count + statement.excluded.count})
+    connection.execute(statement, counts)
+    _add_to_trends(connection, rows, 1)
+
+
+def forget_results(connection, rows):
+    """
+    Remove deleted execution results from the summary and trend counts,
+    dropping groups that no longer have any result.
+    """
+    counts = _count(rows)
+    if not counts:
+        return
+    # Bound parameter names must differ from the column names in an UPDATE
+    params = [{'b_' + key: value for key, value in row.items()} for row in counts]
+    group = and_(summary_table.c.test_asset_id == bindparam('b_test_asset_id'),
+                 summary_table.c.test_case_id == bindparam('b_test_case_id'),
+                 summary_table.c.result == bindparam('b_result'))
+    connection.execute(update(summary_table).where(group).values(count=summary_table.c.count - bindparam('b_count')),
+                       params)
+    connection.execute(delete(summary_table).where(group, summary_table.c.count <= 0), params)
+    _add_to_trends(connection, rows, -1)
+
+
+def rebuild_summaries(connection, test_asset_id=None):
+    """
+    Recompute the summary counts and the trends from the execution results,
+    for every test asset or a single one. The test case trends are only
+    rebuilt for every test asset.
+    """
+    groups = select(ExecutionResult.test_asset_id, ExecutionResult.test_case_id, ExecutionResult.result,
+                    func.count()).group_by(ExecutionResult.test_asset_id, ExecutionResult.test_case_id,
+                                           ExecutionResult.result)
+    clear = delete(summary_table)
+    if test_asset_id is not None:
+        groups = groups.where(ExecutionResult.test_asset_id == test_asset_id)
+        clear = clear.where(summary_table.c.test_asset_id == test_asset_id)
+    connection.execute(clear)
+    connection.execute(insert(summary_table).from_select(
+        ['test_asset_id', 'test_case_id', 'result', 'count'], groups))
+
+    for key, table in trend_tables.items():
+        # Test case trends span test assets, so only a full rebuild covers them
+        if test_asset_id is not None and key != 'test_asset_id':
+            continue
+        clear = delete(table)
+        if test_asset_id is not None:
+            clear = clear.where(table.c.test_asset_id == test_asset_id)
+        connection.execute(clear)
+        for granularity in TREND_GRANULARITIES:
+            bucket = func.strftime(_BUCKET_FORMATS[granularity], ExecutionResult.created_at)
+            groups = select(literal(granularity), ExecutionResult.__table__.c[key], bucket, ExecutionResult.result,
+                            func.count()) \
+                .where(ExecutionResult.created_at.isnot(None)) \
+                .group_by(ExecutionResult.__table__.c[key], bucket, ExecutionResult.result)
+            if test_asset_id is not None:
+                groups = groups.where(ExecutionResult.test_asset_id == test_asset_id)
+            connection.execute(insert(table).from_select(['granularity', key, 'bucket', 'result', 'count'], groups))
+
+
+def bucket_start(moment, size):
+    """
+    Returns:
+        datetime: Start of the bucket of `size` seconds containing `moment`,
+        buckets being aligned on the epoch.
+    """
+    elapsed = (moment - _EPOCH) // timedelta(seconds=1)
+    return _EPOCH + timedelta(seconds=elapsed - elapsed % size)
+
+
+def trend(session, key, value, size, time_gte, time_lte):
+    """
+    Count the execution results of a test asset or test case per result in
+    buckets of `size` seconds, merged from the stored buckets of the largest
+    granularity dividing the size.
+
+    Args:
+        key (str): 'test_asset_id' or 'test_case_id'.
+        value (int): ID of the test asset or test case.
+        size (int): Bucket size in seconds, a multiple of an hour.
+        time_gte (datetime): Time the first bucket contains.
+        time_lte (datetime): Time the last bucket contains.
+
+    Returns:
+        list: (bucket start, Counter of results) of the buckets with results, oldest first.
+    """
+    table = trend_tables[key]
+    granularity = max(granularity for granularity in TREND_GRANULARITIES if size % granularity == 0)
+    rows = session.execute(
+        select(table.c.bucket, table.c.result, table.c.count)
+        .where(table.c.granularity == granularity, table.c[key] == value,
+               table.c.bucket >= bucket_start(time_gte, size), table.c.bucket <= time_lte)
+        .order_by(table.c.bucket))
+
+    buckets = {}
+    for bucket, result, count in rows:
+        buckets.setdefault(bucket_start(bucket, size), Counter())[result] += count
+    return list(buckets.items())
+
+
+def _add_to_trends(connection, rows, sign):
+    for key, table in trend_tables.items():
+        counts = Counter()
+        for row in rows:
+            if row.get('created_at') is None:
+                continue
+            for granularity in TREND_GRANULARITIES:
+                counts[granularity, row[key], bucket_start(row['created_at'], granularity), row['result']] += sign
+        if not counts:
+            continue
+
+        params = [{'granularity': granularity, key: value, 'bucket': bucket, 'result': result, 'count': count}
+                  for (granularity, value, bucket, result), count in counts.items()]
+        statement = sqlite_insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.granularity, table.c[key], table.c.bucket, table.c.result],
+            set_={'count': table.c.count + statement.excluded['count']})
+        connection.execute(statement, params)
+        if sign < 0:
+            # Bound parameter names must differ from the column names
+            group = and_(table.c.granularity == bindparam('b_granularity'), table.c[key] == bindparam('b_' + key),
+                         table.c.bucket == bindparam('b_bucket'), table.c.result == bindparam('b_result'))
+            connection.execute(delete(table).where(group, table.c.count <= 0),
+                               [{'b_' + name: value for name, value in param.items()} for param in params])
+
+
+def _count(rows):
+    counts = Counter((row['test_asset_id'], row['test_case_id'], row['result']) for row in rows)
+    return [{'test_asset_id': test_asset_id, 'test_case_id': test_case_id, 'result': result, 'count': count}
+            for (test_asset_id, test_case_id, result), count in counts.items()]
+
+
+def _as_row(execution_result):
+    return {'test_asset_id': execution_result.test_asset_id, 'test_case_id': execution_result.test_case_id,
+            'result': execution_result.result, 'created_at': execution_result.created_at}
+
+
+@event.listens_for(ExecutionResult, 'after_insert')
+def _record_inserted_result(mapper, connection, target):
+    record_results(connection, [_as_row(target)])
+
+
+@event.listens_for(ExecutionResult, 'after_update')
+def _move_updated_result(mapper, connection, target):
+    state = inspect(target)
+    previous = {}
+    for key in ('test_asset_id', 'test_case_id', 'result', 'created_at'):
+        history = state.attrs[key].history
+        if history.deleted:
+            previous[key] = history.deleted[0]
+    if previous:
+        forget_results(connection, [{**_as_row(target), **previous}])
+        record_results(connection, [_as_row(target)])
+
+
+@event.listens_for(ExecutionResult, 'after_delete')
+def _forget_deleted_result(mapper, connection, target):
+    # Results of a deleted test case are removed by the database cascade
+    # instead, together with their summary and test case trend rows
+    forget_results(connection, [_as_row(target)])
@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify, request
 from flask_jwt_extended import create_access_token
 from models import db, User
+from passwords import PasswordHashingBusy, needs_rehash
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
@@ -13,7 +14,9 @@ def login():
     Expects a JSON payload with 'username' and 'password' fields.
 
     Returns:
-        JSON: Access token if login is successful.
+        JSON: Access token if login is successful. The token carries the user's
+        role as a claim for clients; admin checks read the current role instead.
+        503 Service Unavailable when the password hashing pool is saturated.
     """
     data = request.get_json()
     if not all(key in data for key in ['username', 'password']):
@@ -21,7 +24,11 @@ def login():
 
     user = User.query.filter_by(username=data['username']).first()
     if user and user.check_password(data['password']):
-        access_token = create_access_token(identity=user.username)
+        # Upgrade hashes made with an older method or cost
+        if needs_rehash(user.password_hash):
+            user.set_password(data['password'])
+            db.session.commit()
+        access_token = create_access_token(identity=user.username, additional_claims={"role": user.role})
         return jsonify(access_token=access_token), 200
     else:
         return jsonify({"error": "Invalid username or password"}), 401
@@ -36,6 +43,7 @@ def register():
 
     Returns:
         JSON: Success message upon successful user registration.
+        503 Service Unavailable when the password hashing pool is saturated.
     """
     data = request.get_json()
     if not all(key in data for key in ['username', 'password', 'role']):
@@ -52,3 +60,13 @@ def register():
     db.session.commit()
 
     return jsonify({"message": "User registered successfully"}), 201
+
+
+@auth_bp.errorhandler(PasswordHashingBusy)
+def handle_password_hashing_busy(error):
+    """
+    Shed logins and registrations while the password hashing pool is saturated,
+    instead of tying up more request threads.
+    """
+    db.session.rollback()
+    return jsonify({"error": "Too many concurrent logins. Please try again later."}), 503, {'Retry-After': '1'}
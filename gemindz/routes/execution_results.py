@@ -1,12 +1,30 @@
-from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, ExecutionResult, TestCase, User
+import json
+import math
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+from operator import ge, le
+from flask import Blueprint, current_app, jsonify, request
+from flask_jwt_extended import jwt_required
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from flakiness import record_runs
+from models import db, ExecutionResult, ExecutionResultSummary, FlakinessState, TestCase
+from pagination import decode_cursor, encode_cursor, parse_limit, parse_time
+from rollups import DAY, HOUR, bucket_start, record_results, trend
+from security import admin_required
+from serializers import execution_result_serializer, flakiness_serializer
+from shards import current_router
 
 execution_results_bp = Blueprint('execution_results', __name__, url_prefix='/execution_results')
 
+# Trend bucket sizes: a number of hours or days, e.g. '6h' or '7d'
+BUCKET_SIZE = re.compile(r'([1-9][0-9]*)([hd])')
+
 
 @execution_results_bp.route('', methods=['POST'])
 @jwt_required()
+@admin_required("Unauthorized to record execution results")
 def record_execution_result():
     """
     Record the execution result for a test case on a specific test asset.
@@ -17,12 +35,6 @@ def record_execution_result():
     Returns:
         JSON: Confirmation message upon successful recording of execution result.
     """
-    current_user = get_jwt_identity()
-    user = User.query.filter_by(username=current_user).first()
-
-    if not user or user.role != 'admin':
-        return jsonify({"error": "Unauthorized to record execution results"}), 401
-
     data = request.get_json()
     if not data or 'test_case_id' not in data or 'test_asset_id' not in data or 'result' not in data:
         return jsonify({"error": "Missing required fields: test_case_id, test_asset_id, result"}), 400
@@ -35,10 +47,11 @@ def record_execution_result():
     if not db.session.query(TestCase.id).filter_by(id=test_case_id).scalar():
         return jsonify({"error": "Test case not found"}), 404
 
-    # Save the execution result to the database
+    # Save the execution result to the database of its test asset
+    session = current_router().session(test_asset_id)
     new_execution_result = ExecutionResult(test_case_id=test_case_id, test_asset_id=test_asset_id, result=result)
-    db.session.add(new_execution_result)
-    db.session.commit()
+    session.add(new_execution_result)
+    session.commit()
 
     # Return the created execution result in the JSON response
     return jsonify({
@@ -52,32 +65,410 @@ def record_execution_result():
     }), 201
 
 
+@execution_results_bp.route('/batch', methods=['POST'])
+@jwt_required()
+@admin_required("Unauthorized to record execution results")
+def record_execution_results_batch():
+    """
+    Record many execution results in a single transaction.
+
+    Expects either a JSON array of objects or an NDJSON body
+    (Content-Type: application/x-ndjson) with one object per line, each with
+    'test_case_id', 'test_asset_id', and 'result' fields.
+    Requires authentication and admin privileges.
+
+    Supported query parameters:
+    - mode: 'all_or_nothing' rejects the whole batch if any item is invalid,
+      'partial' records the valid items (defaults to EXECUTION_RESULTS_BATCH_MODE).
+
+    With EXECUTION_RESULT_SHARDS, the results of every shard are committed
+    separately, after the results of all of them are inserted. If a shard
+    fails to commit, it and the shards after it are rolled back, and their
+    items get the 'failed' status: only those items should be retried, the
+    'created' ones are recorded.
+
+    Returns:
+        JSON: Created, rejected and failed counts, and the status of every
+        item in request order. 201 if every item was recorded, 207 if only
+        some were, 400 if nothing was recorded because of invalid items, 500
+        if nothing could be committed.
+    """
+    mode = request.args.get('mode', current_app.config.get('EXECUTION_RESULTS_BATCH_MODE', 'all_or_nothing'))
+    if mode not in ('all_or_nothing', 'partial'):
+        return jsonify({"error": "mode must be 'all_or_nothing' or 'partial'"}), 400
+
+    max_items = current_app.config.get('EXECUTION_RESULTS_BATCH_MAX_ITEMS', 10000)
+    items = []
+    for item in _read_batch_items():
+        if len(items) == max_items:
+            return jsonify({"error": f"A batch can contain at most {max_items} execution results"}), 413
+        items.append(item)
+    if not items:
+        return jsonify({"error": "No execution results provided"}), 400
+
+    statuses = [{"index": index, "status": "pending"} for index in range(len(items))]
+    for status, item in zip(statuses, items):
+        error = _validate_execution_result(item)
+        if error:
+            status.update(status="rejected", error=error)
+
+    # Check every referenced test case with a single IN query
+    test_case_ids = {item['test_case_id'] for status, item in zip(statuses, items) if status['status'] == 'pending'}
+    existing_ids = set(db.session.scalars(select(TestCase.id).where(TestCase.id.in_(test_case_ids))))
+    for status, item in zip(statuses, items):
+        if status['status'] == 'pending' and item['test_case_id'] not in existing_ids:
+            status.update(status="rejected", error="Test case not found")
+
+    accepted = [(status, item) for status, item in zip(statuses, items) if status['status'] == 'pending']
+    rejected_count = len(items) - len(accepted)
+
+    if (rejected_count and mode == 'all_or_nothing') or not accepted:
+        for status, _ in accepted:
+            status['status'] = "skipped"
+        return jsonify({"created": 0, "rejected": rejected_count, "results": statuses}), 400
+
+    # Insert the accepted results with one executemany per shard
+    created_at = datetime.utcnow()
+    rows = [{"test_case_id": item['test_case_id'], "test_asset_id": item['test_asset_id'],
+             "result": item['result'], "created_at": created_at} for _, item in accepted]
+    router = current_router()
+    positions_by_shard = {}
+    for position, row in enumerate(rows):
+        positions_by_shard.setdefault(router.index(row['test_asset_id']), []).append(position)
+    # Take the write locks of the shards in one order, so concurrent batches cannot deadlock
+    sessions = [(router.session(rows[positions[0]]['test_asset_id']), positions)
+                for _, positions in sorted(positions_by_shard.items())]
+
+    new_ids = [None] * len(rows)
+    for session, positions in sessions:
+        shard_rows = [rows[position] for position in positions]
+        shard_ids = session.scalars(
+            insert(ExecutionResult).returning(ExecutionResult.id, sort_by_parameter_order=True), shard_rows).all()
+        # Bulk inserts bypass the ORM events, so update the counts and flakiness states explicitly
+        record_results(session.connection(), shard_rows)
+        record_runs(session.connection(), shard_rows)
+        for position, new_id in zip(positions, shard_ids):
+            new_ids[position] = new_id
+    # Once a shard fails to commit, the later ones are rolled back too
+    failed_positions = set()
+    for session, positions in sessions:
+        if not failed_positions:
+            try:
+                session.commit()
+                continue
+            except SQLAlchemyError as e:
+                current_app.logger.error(f"An SQLAlchemy error occurred while recording execution results: {e}")
+        session.rollback()
+        failed_positions.update(positions)
+
+    for position, ((status, _), new_id) in enumerate(zip(accepted, new_ids)):
+        if position in failed_positions:
+            status.update(status="failed", error="Not recorded, please retry")
+        else:
+            status.update(status="created", id=new_id)
+
+    created_count = len(accepted) - len(failed_positions)
+    if not created_count:
+        status_code = 500
+    elif rejected_count or failed_positions:
+        status_code = 207
+    else:
+        status_code = 201
+    return jsonify({"created": created_count, "rejected": rejected_count, "failed": len(failed_positions),
+                    "results": statuses}), status_code
+
+
+def _read_batch_items():
+    """
+    Yield the items of a batch body, decoding NDJSON bodies line by line so the
+    request is never buffered as a whole. Lines that are not valid JSON are
+    yielded as None.
+    """
+    if request.mimetype == 'application/x-ndjson':
+        for line in request.stream:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    yield None
+        return
+
+    data = request.get_json(silent=True)
+    if isinstance(data, list):
+        yield from data
+
+
+def _validate_execution_result(item):
+    """
+    Return the validation error of a batch item, or None if it is valid.
+    """
+    if not isinstance(item, dict):
+        return "Item must be a JSON object"
+    if 'test_case_id' not in item or 'test_asset_id' not in item or 'result' not in item:
+        return "Missing required fields: test_case_id, test_asset_id, result"
+    # JSON true and false decode to bools, which are ints too
+    if any(not isinstance(item[key], int) or isinstance(item[key], bool) for key in ('test_case_id', 'test_asset_id')):
+        return "test_case_id and test_asset_id must be integers"
+    if not isinstance(item['result'], str) or len(item['result']) > 50:
+        return "Invalid result provided for execution result"
+    return None
+
+
 @execution_results_bp.route('/<int:test_asset_id>', methods=['GET'])
 @jwt_required(optional=True)
 def get_execution_results_for_test_asset(test_asset_id):
     """
-    Retrieve the execution results for a specific test asset.
+    Retrieve the execution results for a specific test asset, oldest first.
+
+    Args:
+        test_asset_id (int): ID of the test asset.
+
+    Supported query parameters:
+    - test_case_id: Filter results by test case.
+    - result: Filter results by result.
+    - time[gte]: Filter results recorded at or after the provided time.
+    - time[lte]: Filter results recorded at or before the provided time.
+    - limit: Maximum number of results to return (defaults to EXECUTION_RESULTS_PAGE_SIZE).
+    - cursor: Opaque cursor from the X-Next-Cursor header of the previous page.
+    - fields: Comma-separated fields to return, all of them by default.
+
+    Returns:
+        JSON: Execution results for the specified test asset. The X-Next-Cursor
+        header is set when more results are available.
+    """
+    query_params = request.args.to_dict()
+
+    try:
+        fields = execution_result_serializer.parse_fields(query_params.get('fields'))
+        base_query = filtered_execution_results_query(test_asset_id, query_params, fields)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Resume after the last result of the previous page
+    cursor = query_params.get('cursor')
+    if cursor:
+        try:
+            base_query = base_query.where(ExecutionResult.id > decode_cursor(cursor)[1])
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    try:
+        limit = parse_limit(query_params.get('limit'),
+                            default=current_app.config.get('EXECUTION_RESULTS_PAGE_SIZE', 100),
+                            maximum=current_app.config.get('EXECUTION_RESULTS_MAX_PAGE_SIZE', 1000))
+    except ValueError:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+
+    # Select plain columns so rows skip the ORM identity map
+    session = current_router().read_session(test_asset_id)
+    execution_results = session.execute(base_query.order_by(ExecutionResult.id).limit(limit + 1)).all()
+
+    if not execution_results and not cursor:
+        return jsonify({"message": "No execution results found for the specified test asset"}), 404
+
+    response = execution_result_serializer.response(execution_results[:limit], fields)
+    if len(execution_results) > limit:
+        last_result = execution_results[limit - 1]
+        response.headers['X-Next-Cursor'] = encode_cursor(last_result.created_at, last_result.id)
+    return response, 200
+
+
+def filtered_execution_results_query(test_asset_id, query_params, fields=execution_result_serializer.fields):
+    """
+    Build the select statement for the results of a test asset matching the
+    filters in the query parameters. It selects the fields, then the cursor
+    columns that are not among them.
+
+    Raises:
+        ValueError: If a filter has an invalid value.
+    """
+    base_query = select(*execution_result_serializer.columns(fields, required=('created_at', 'id'))) \
+        .where(ExecutionResult.test_asset_id == test_asset_id)
+
+    test_case_id = query_params.get('test_case_id')
+    if test_case_id:
+        try:
+            base_query = base_query.where(ExecutionResult.test_case_id == int(test_case_id))
+        except ValueError:
+            raise ValueError("test_case_id must be an integer")
+
+    result = query_params.get('result')
+    if result:
+        base_query = base_query.where(ExecutionResult.result == result)
+
+    for param, compare in (('time[gte]', ge), ('time[lte]', le)):
+        value = _parse_time(query_params, param)
+        if value:
+            base_query = base_query.where(compare(ExecutionResult.created_at, value))
+
+    return base_query
+
+
+@execution_results_bp.route('/<int:test_asset_id>/summary', methods=['GET'])
+@jwt_required(optional=True)
+def get_execution_results_summary(test_asset_id):
+    """
+    Retrieve the number of execution results per result for a specific test
+    asset, overall and per test case.
 
     Args:
         test_asset_id (int): ID of the test asset.
 
     Returns:
-        JSON: Execution results for the specified test asset.
+        JSON: Result counts for the specified test asset.
     """
-    # Query the database to fetch execution results for the given test asset ID
-    execution_results = ExecutionResult.query.filter_by(test_asset_id=test_asset_id).all()
+    groups = current_router().read_session(test_asset_id).execute(
+        select(ExecutionResultSummary.test_case_id, ExecutionResultSummary.result, ExecutionResultSummary.count)
+        .where(ExecutionResultSummary.test_asset_id == test_asset_id)
+    ).all()
 
-    if not execution_results:
+    if not groups:
         return jsonify({"message": "No execution results found for the specified test asset"}), 404
 
-    # Format the results
-    results = [
-        {
-            "id": result.id,
-            "test_case_id": result.test_case_id,
-            "test_asset_id": result.test_asset_id,
-            "result": result.result
-        } for result in execution_results
-    ]
-
-    return jsonify(results), 200
+    totals = {}
+    test_cases = {}
+    for test_case_id, result, count in groups:
+        totals[result] = totals.get(result, 0) + count
+        test_case = test_cases.setdefault(test_case_id, {"test_case_id": test_case_id, "total": 0, "results": {}})
+        test_case["total"] += count
+        test_case["results"][result] = count
+
+    return jsonify({
+        "test_asset_id": test_asset_id,
+        "total": sum(totals.values()),
+        "results": totals,
+        "test_cases": list(test_cases.values())
+    }), 200
+
+
+@execution_results_bp.route('/trend', methods=['GET'])
+@jwt_required(optional=True)
+def get_execution_results_trend():
+    """
+    Retrieve the number of execution results per result and time bucket for a
+    test asset or a test case, read from the pre-aggregated hourly and daily
+    counts.
+
+    Supported query parameters:
+    - test_asset_id or test_case_id: The test asset or test case (exactly one is required).
+    - bucket: Bucket size, a number of hours or days such as '6h' or '7d' (defaults to '1d').
+      Buckets are aligned on the epoch in UTC.
+    - time[gte]: Time the first bucket contains (defaults to EXECUTION_RESULTS_TREND_DAYS days ago).
+    - time[lte]: Time the last bucket contains (defaults to now).
+
+    Returns:
+        JSON: The buckets with results, oldest first, with their start, total,
+        count per result and pass rate, the share of results listed in
+        EXECUTION_RESULTS_PASSING.
+    """
+    query_params = request.args.to_dict()
+
+    keys = [key for key in ('test_asset_id', 'test_case_id') if query_params.get(key)]
+    if len(keys) != 1:
+        return jsonify({"error": "Provide either test_asset_id or test_case_id"}), 400
+    key = keys[0]
+    try:
+        value = int(query_params[key])
+    except ValueError:
+        return jsonify({"error": f"{key} must be an integer"}), 400
+
+    match = BUCKET_SIZE.fullmatch(query_params.get('bucket', '1d'))
+    if not match:
+        return jsonify({"error": "bucket must be a number of hours or days, e.g. '6h' or '1d'"}), 400
+    size = int(match.group(1)) * (HOUR if match.group(2) == 'h' else DAY)
+
+    try:
+        time_lte = _parse_time(query_params, 'time[lte]') or datetime.utcnow()
+        time_gte = _parse_time(query_params, 'time[gte]') or \
+            time_lte - timedelta(days=current_app.config.get('EXECUTION_RESULTS_TREND_DAYS', 90))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    max_buckets = current_app.config.get('EXECUTION_RESULTS_TREND_MAX_BUCKETS', 1000)
+    if math.ceil((time_lte - bucket_start(time_gte, size)).total_seconds() / size) > max_buckets:
+        return jsonify({"error": f"A trend can contain at most {max_buckets} buckets"}), 400
+
+    router = current_router()
+    if key == 'test_asset_id':
+        counts = trend(router.read_session(value), key, value, size, time_gte, time_lte)
+    else:
+        # The results of a test case are spread over every shard
+        counts = {}
+        for shard_counts in router.fan_out(lambda connection: trend(connection, key, value, size, time_gte, time_lte)):
+            for start, results in shard_counts:
+                counts.setdefault(start, Counter()).update(results)
+        counts = sorted(counts.items())
+
+    passing = set(current_app.config.get('EXECUTION_RESULTS_PASSING', ('pass', 'passed')))
+    buckets = []
+    for start, results in counts:
+        total = sum(results.values())
+        buckets.append({
+            "start": start.isoformat(),
+            "total": total,
+            "results": dict(results),
+            "pass_rate": sum(count for result, count in results.items() if result in passing) / total
+        })
+
+    return jsonify({key: value, "bucket": match.group(0), "buckets": buckets}), 200
+
+
+@execution_results_bp.route('/flaky', methods=['GET'])
+@jwt_required(optional=True)
+def get_flaky_execution_results():
+    """
+    Retrieve the (test case, test asset) pairs whose results flip most often,
+    by decreasing decayed flip rate.
+
+    Supported query parameters:
+    - test_asset_id: Only return the pairs of this test asset.
+    - min_runs: Ignore pairs with fewer runs (defaults to FLAKINESS_MIN_RUNS).
+    - limit: Maximum number of pairs to return (defaults to FLAKINESS_PAGE_SIZE).
+    - fields: Comma-separated fields to return, all of them by default.
+
+    Returns:
+        JSON: The flakiest pairs with their last result, run and flip counts,
+        flip rate and last run time.
+    """
+    query_params = request.args.to_dict()
+
+    try:
+        fields = flakiness_serializer.parse_fields(query_params.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        limit = parse_limit(query_params.get('limit'),
+                            default=current_app.config.get('FLAKINESS_PAGE_SIZE', 20),
+                            maximum=current_app.config.get('FLAKINESS_MAX_PAGE_SIZE', 100))
+        min_runs = int(query_params.get('min_runs', current_app.config.get('FLAKINESS_MIN_RUNS', 5)))
+        test_asset_id = query_params.get('test_asset_id')
+        test_asset_id = int(test_asset_id) if test_asset_id else None
+    except ValueError:
+        return jsonify({"error": "limit, min_runs and test_asset_id must be integers"}), 400
+
+    # Walks the flip rate index from the top, stopping after `limit` matches
+    query = select(*flakiness_serializer.columns(fields, required=('flip_rate',))) \
+        .where(FlakinessState.run_count >= min_runs, FlakinessState.flip_rate > 0) \
+        .order_by(FlakinessState.flip_rate.desc()).limit(limit)
+    router = current_router()
+    if test_asset_id is not None:
+        query = query.where(FlakinessState.test_asset_id == test_asset_id)
+        pairs = router.read_session(test_asset_id).execute(query).all()
+    else:
+        # The top `limit` pairs overall are among the top `limit` pairs of each shard
+        pairs = [pair for shard_pairs in router.fan_out(lambda connection: connection.execute(query).all())
+                 for pair in shard_pairs]
+        pairs = sorted(pairs, key=lambda pair: pair.flip_rate, reverse=True)[:limit]
+
+    return flakiness_serializer.response(pairs, fields)
+
+
+def _parse_time(query_params, param):
+    value = query_params.get(param)
+    if not value:
+        return None
+    try:
+        return parse_time(value)
+    except ValueError:
+        raise ValueError(f"Invalid date format for {param}. Please provide date in ISO 8601 format")
@@ -1,16 +1,19 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, current_app, jsonify
 from datetime import datetime
 
 home_bp = Blueprint('home', __name__)
 
-# Store the server start time in the application instance
-start_time = datetime.now()
+
+@home_bp.record_once
+def record_start_time(state):
+    # Store the server start time in the application instance
+    state.app.start_time = datetime.now()
 
 
 @home_bp.route('/')
 def home():
     # Calculate the uptime by subtracting the start time from the current time
-    uptime = datetime.now() - start_time
+    uptime = datetime.now() - current_app.start_time
 
     # Return the uptime in the response
     return jsonify({"message": f"The server is up and running for {uptime}"})
@@ -1,14 +1,24 @@
-from flask import Blueprint, jsonify, request
-from models import Log
-from datetime import datetime
+from itertools import chain, islice
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from sqlalchemy import func, select, tuple_
+from database import read_session
+from models import LatencyHistogram, Log, LogRollup
+from latency import BUCKET_BOUNDS_MS, percentile
+from log_partitions import log_sources
+from pagination import decode_cursor, encode_cursor, parse_limit, parse_time
+from serializers import NDJSON_MIMETYPE, dumps, log_rollup_serializer, log_serializer
 
 logs_bp = Blueprint('logs', __name__, url_prefix='/logs')
 
 
+# Columns a page is ordered by and its cursor built from
+CURSOR_COLUMNS = ('created_at', 'id')
+
+
 @logs_bp.route('/', methods=['GET'])
 def get_logs():
     """
-    Retrieve logs based on query parameters.
+    Retrieve logs based on query parameters, ordered by creation time.
 
     Supported query parameters:
     - endpoint_name: Filter logs by endpoint name.
@@ -16,61 +26,268 @@ def get_logs():
     - time[gte]: Filter logs with a timestamp greater than or equal to the provided time.
     - time[lte]: Filter logs with a timestamp less than or equal to the provided time.
     - time: Filter logs with a timestamp equal to the provided time.
+    - limit: Maximum number of logs to return (defaults to LOGS_PAGE_SIZE).
+    - cursor: Opaque cursor from the X-Next-Cursor header of the previous page.
+    - fields: Comma-separated fields to return, all of them by default.
+
+    Requests sent with 'Accept: application/x-ndjson' stream every matching log
+    (up to 'limit' if given) as newline-delimited JSON instead of returning a page.
+
+    Only the log partitions overlapping the requested time range are read,
+    including those moved to the log archive, which are read first.
 
     Returns:
-        JSON: List of logs matching the query parameters.
+        JSON: List of logs matching the query parameters. The X-Next-Cursor
+        header is set when more logs are available.
     """
     query_params = request.args.to_dict()
 
-    # Initialize the base query
-    base_query = Log.query
+    try:
+        filters = parse_log_filters(query_params)
+        fields = log_serializer.parse_fields(query_params.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Resume after the last log of the previous page
+    cursor = None
+    if query_params.get('cursor'):
+        try:
+            cursor = decode_cursor(query_params['cursor'])
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    try:
+        limit = parse_limit(query_params.get('limit'),
+                            default=current_app.config.get('LOGS_PAGE_SIZE', 100),
+                            maximum=current_app.config.get('LOGS_MAX_PAGE_SIZE', 1000))
+    except ValueError:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+
+    lower_bound = max(filter(None, (filters.get('time'), filters.get('time[gte]'), cursor and cursor[0])),
+                      default=None)
+    upper_bound = filters.get('time') or filters.get('time[lte]')
+    session = read_session()
+    # Archived partitions are older than those still in the database
+    archive = current_app.extensions.get('log_archive')
+    segments = archive.segments(lower_bound, upper_bound) if archive is not None else []
+    archived = {segment.name for segment in segments}
+    queries = [page_logs_query(filtered_logs_query(filters, table, fields), table, cursor)
+               for table in log_sources(session.connection(), lower_bound, upper_bound) if table.name not in archived]
+
+    archived_logs = _archived_blocks(segments, filters, fields, cursor)
+
+    if request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE:
+        return _stream_logs(archived_logs, queries, fields, limit if 'limit' in query_params else None)
+
+    # Sources are in time order, so stop reading as soon as the page is full
+    logs = list(islice(chain.from_iterable(archived_logs), limit + 1))
+    for query in queries:
+        if len(logs) > limit:
+            break
+        logs.extend(session.execute(query.limit(limit + 1 - len(logs))).all())
+
+    response = log_serializer.response(logs[:limit], fields)
+    if len(logs) > limit:
+        last_log = logs[limit - 1]
+        response.headers['X-Next-Cursor'] = encode_cursor(last_log.created_at, last_log.id)
+    return response, 200
+
+
+@logs_bp.route('/rollups', methods=['GET'])
+def get_log_rollups():
+    """
+    Retrieve the hourly request counts kept for log partitions that were
+    dropped by the retention job.
+
+    Supported query parameters:
+    - endpoint_name: Filter counts by endpoint name.
+    - status_code: Filter counts by status code.
+    - time[gte]: Only return hours starting at or after the provided time.
+    - time[lte]: Only return hours starting at or before the provided time.
+    - fields: Comma-separated fields to return, all of them by default.
+
+    Returns:
+        JSON: List of hourly counts ordered by hour.
+    """
+    query_params = request.args.to_dict()
+
+    try:
+        filters = parse_log_filters(query_params)
+        fields = log_rollup_serializer.parse_fields(query_params.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    query = select(*log_rollup_serializer.columns(fields))
+    if 'endpoint_name' in filters:
+        query = query.where(LogRollup.endpoint_name == filters['endpoint_name'])
+    if 'status_code' in filters:
+        query = query.where(LogRollup.status_code == filters['status_code'])
+    if 'time[gte]' in filters:
+        query = query.where(LogRollup.hour >= filters['time[gte]'])
+    if 'time[lte]' in filters:
+        query = query.where(LogRollup.hour <= filters['time[lte]'])
+
+    rollups = read_session().execute(query.order_by(LogRollup.hour)).all()
+    return log_rollup_serializer.response(rollups, fields)
+
+
+@logs_bp.route('/latency', methods=['GET'])
+def get_latency():
+    """
+    Retrieve request latency percentiles and histogram buckets per route,
+    merged from the hourly latency histograms.
+
+    Histograms are kept per route, so 'endpoint_name' here holds the URL rule
+    (e.g. '/testcases/<int:test_case_id>'), not the request path that GET /logs
+    stores and filters on under the same name (e.g. '/testcases/42').
+
+    Supported query parameters:
+    - endpoint_name: Only return the route with this URL rule.
+    - time[gte]: Start of the time window, rounded down to the hour.
+    - time[lte]: End of the time window.
+
+    Returns:
+        JSON: For every route, its URL rule as 'endpoint_name', the request
+        count, the estimated p50, p90 and p99 durations in milliseconds, and
+        the count of every bucket with its upper bound ('le').
+    """
+    query_params = request.args.to_dict()
+
+    try:
+        filters = parse_log_filters(query_params)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    query = select(LatencyHistogram.endpoint_name, LatencyHistogram.bucket, func.sum(LatencyHistogram.count)) \
+        .group_by(LatencyHistogram.endpoint_name, LatencyHistogram.bucket)
+    if 'endpoint_name' in filters:
+        query = query.where(LatencyHistogram.endpoint_name == filters['endpoint_name'])
+    if 'time[gte]' in filters:
+        query = query.where(LatencyHistogram.hour >= filters['time[gte]'].replace(minute=0, second=0, microsecond=0))
+    if 'time[lte]' in filters:
+        query = query.where(LatencyHistogram.hour <= filters['time[lte]'])
+
+    histograms = {}
+    for endpoint_name, bucket, count in read_session().execute(query):
+        histograms.setdefault(endpoint_name, [0] * (len(BUCKET_BOUNDS_MS) + 1))[bucket] = count
+
+    bounds = [*BUCKET_BOUNDS_MS, '+Inf']
+    return jsonify([{
+        'endpoint_name': endpoint_name,
+        'count': sum(counts),
+        'p50': percentile(counts, 0.5),
+        'p90': percentile(counts, 0.9),
+        'p99': percentile(counts, 0.99),
+        'buckets': [{'le': bound, 'count': count} for bound, count in zip(bounds, counts)]
+    } for endpoint_name, counts in sorted(histograms.items())]), 200
+
+
+def parse_log_filters(query_params):
+    """
+    Parse the log filters of the query parameters.
+
+    Returns:
+        dict: The filters that are set, keyed by query parameter name.
+
+    Raises:
+        ValueError: If a filter has an invalid value.
+    """
+    filters = {}
 
-    # Filter logs by endpoint name
     endpoint_name = query_params.get('endpoint_name')
     if endpoint_name:
-        base_query = base_query.filter(Log.endpoint_name == endpoint_name)
+        filters['endpoint_name'] = endpoint_name
 
-    # Filter logs by status code
     status_code = query_params.get('status_code')
     if status_code:
-        base_query = base_query.filter(Log.status_code == int(status_code))
+        try:
+            filters['status_code'] = int(status_code)
+        except ValueError:
+            raise ValueError("status_code must be an integer")
+
+    for param in ('time[gte]', 'time[lte]', 'time'):
+        value = query_params.get(param)
+        if value:
+            try:
+                filters[param] = parse_time(value)
+            except ValueError:
+                raise ValueError(f"Invalid date format for {param}. Please provide date in ISO 8601 format")
+
+    return filters
+
+
+def filtered_logs_query(filters, table=Log.__table__, fields=log_serializer.fields):
+    """
+    Build the select statement for the filters parsed by parse_log_filters on
+    the head log table or one of its partitions. It selects the fields, then
+    the cursor columns that are not among them.
+    """
+    # Initialize the base query
+    base_query = select(*log_serializer.columns(fields, table, required=CURSOR_COLUMNS))
+
+    # Filter logs by endpoint name
+    if 'endpoint_name' in filters:
+        base_query = base_query.where(table.c.endpoint_name == filters['endpoint_name'])
+
+    # Filter logs by status code
+    if 'status_code' in filters:
+        base_query = base_query.where(table.c.status_code == filters['status_code'])
 
     # Filter logs by time range
-    time_gte = query_params.get('time[gte]')
-    time_lte = query_params.get('time[lte]')
-    time_eq = query_params.get('time')
+    if 'time[gte]' in filters:
+        base_query = base_query.where(table.c.created_at >= filters['time[gte]'])
+    if 'time[lte]' in filters:
+        base_query = base_query.where(table.c.created_at <= filters['time[lte]'])
+    if 'time' in filters:
+        base_query = base_query.where(table.c.created_at == filters['time'])
 
-    if time_gte:
-        try:
-            time_gte = datetime.fromisoformat(time_gte)
-            base_query = base_query.filter(Log.created_at >= time_gte)
-        except ValueError:
-            return jsonify({"error": "Invalid date format for time[gte]. Please provide date in ISO 8601 format"}), 400
+    return base_query
 
-    if time_lte:
-        try:
-            time_lte = datetime.fromisoformat(time_lte)
-            base_query = base_query.filter(Log.created_at <= time_lte)
-        except ValueError:
-            return jsonify({"error": "Invalid date format for time[lte]. Please provide date in ISO 8601 format"}), 400
 
-    if time_eq:
-        try:
-            time_eq = datetime.fromisoformat(time_eq)
-            base_query = base_query.filter(Log.created_at == time_eq)
-        except ValueError:
-            return jsonify({"error": "Invalid date format for time. Please provide date in ISO 8601 format"}), 400
+def page_logs_query(query, table, cursor=None):
+    """
+    Order a log query by (created_at, id), starting after the cursor if given.
+    """
+    if cursor:
+        query = query.where(tuple_(table.c.created_at, table.c.id) > cursor)
+    return query.order_by(table.c.created_at, table.c.id)
+
 
-    logs = base_query.all()
+def _archived_blocks(segments, filters, fields, cursor=None):
+    """
+    Yield the matching rows of the archive segments, one list per block, oldest first.
+    """
+    for segment in segments:
+        yield from segment.read(filters, fields, CURSOR_COLUMNS, cursor)
+
+
+def _stream_logs(archived_blocks, queries, fields, limit=None):
+    """
+    Stream the archived rows, then the rows of the queries, as NDJSON, one
+    archive block or chunk of LOGS_STREAM_CHUNK_SIZE rows at a time so memory
+    use does not grow with the result size.
+    """
+    chunk_size = current_app.config.get('LOGS_STREAM_CHUNK_SIZE', 1000)
+    encode = log_serializer.encoder(fields)
 
-    # Serialize logs to JSON
-    serialized_logs = [{
-        'id': log.id,
-        'endpoint_name': log.endpoint_name,
-        'method': log.method,
-        'status_code': log.status_code,
-        'error': log.error,
-        'created_at': log.created_at
-    } for log in logs]
+    def generate():
+        remaining = limit
+        for block in archived_blocks:
+            if remaining is not None:
+                if remaining <= 0:
+                    return
+                block = block[:remaining]
+                remaining -= len(block)
+            yield b''.join(dumps(encode(log)) + b'\n' for log in block)
+        for query in queries:
+            if remaining is not None:
+                if remaining <= 0:
+                    return
+                query = query.limit(remaining)
+            result = read_session().execute(query.execution_options(yield_per=chunk_size))
+            for partition in result.partitions():
+                if remaining is not None:
+                    remaining -= len(partition)
+                yield b''.join(dumps(encode(log)) + b'\n' for log in partition)
 
-    return jsonify(serialized_logs), 200
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
@@ -0,0 +1,18 @@
+from flask import Blueprint, Response
+from metrics_registry import registry
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+@metrics_bp.route('/metrics')
+def get_metrics():
+    """
+    Expose the in-process metrics in the Prometheus text format.
+
+    Never touches the database, so it keeps answering when the database is
+    slow or down.
+
+    Returns:
+        Text: Every metric in the Prometheus exposition format.
+    """
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,62 @@
+from flask import Blueprint, Response, current_app, jsonify, request, send_file
+from flask_jwt_extended import jwt_required
+from security import admin_required
+
+profiles_bp = Blueprint('profiles', __name__, url_prefix='/profiles')
+
+
+def _profiler():
+    return current_app.extensions.get('request_profiler')
+
+
+@profiles_bp.route('/', methods=['GET'])
+@jwt_required()
+@admin_required("Only admins can read request profiles")
+def get_profiles():
+    """
+    List the stored request profiles, most recent first.
+
+    Returns:
+        JSON: The ID, endpoint, request ID, creation time and size of every profile.
+    """
+    profiler = _profiler()
+    return jsonify(profiler.list_profiles() if profiler else []), 200
+
+
+@profiles_bp.route('/<profile_id>', methods=['GET'])
+@jwt_required()
+@admin_required("Only admins can read request profiles")
+def get_profile(profile_id):
+    """
+    Serve a stored request profile.
+
+    Args:
+        profile_id (str): ID of the profile, from the X-Profile-Id response header or the list.
+
+    Supported query parameters:
+    - format: 'pstats' (default) for the raw file, to open with pstats or
+      snakeviz, or 'text' for the most expensive functions as text.
+    - sort: Sort key of the text format (defaults to 'cumulative').
+    - limit: Number of functions in the text format (defaults to 50).
+
+    Returns:
+        The pstats file or its text summary.
+    """
+    profiler = _profiler()
+    path = profiler.profile_path(profile_id) if profiler else None
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+
+    output_format = request.args.get('format', 'pstats')
+    if output_format == 'pstats':
+        return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                         download_name=f'{profile_id}.pstats')
+    if output_format != 'text':
+        return jsonify({"error": "format must be 'pstats' or 'text'"}), 400
+
+    try:
+        limit = int(request.args.get('limit', 50))
+        summary = profiler.summary(profile_id, request.args.get('sort', 'cumulative'), limit)
+    except (KeyError, ValueError):
+        return jsonify({"error": "Invalid sort or limit"}), 400
+    return Response(summary, mimetype='text/plain')
@@ -1,6 +1,20 @@
-from flask import Blueprint, jsonify, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, TestCase, User
+import codecs
+import csv
+import io
+import json
+from datetime import datetime
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from flask_jwt_extended import jwt_required
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from database import read_session
+from models import db, TestCase
+from pagination import parse_limit
+from search import match_expression, search_query
+from security import admin_required
+from serializers import CSV_MIMETYPE, NDJSON_MIMETYPE, dumps, test_case_serializer
+from shards import current_router
+from versioning import bump_table_version, get_table_version
 
 test_cases_bp = Blueprint('test_cases', __name__, url_prefix='/testcases')
 
@@ -11,13 +25,88 @@ def get_all_test_cases():
     """
     Retrieve all test cases.
 
+    Supported query parameters:
+    - fields: Comma-separated fields to return, all of them by default.
+
+    Supports conditional requests: the ETag and Last-Modified headers follow
+    the test case table version, and a matching If-None-Match or
+    If-Modified-Since header gets a 304 Not Modified. If-None-Match takes
+    precedence, and Last-Modified is only sent once the second of the last
+    write is over (see _set_validators).
+
     Returns:
         JSON: A list of all test cases.
     """
-    test_cases = TestCase.query.all()
-    results = [{"id": test_case.id, "name": test_case.name,
-                "description": test_case.description} for test_case in test_cases]
-    return jsonify(results), 200
+    try:
+        fields = test_case_serializer.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    session = read_session()
+    version, updated_at = get_table_version(TestCase.__tablename__, session)
+
+    # Reuse the serialized lists until the next write bumps the table version.
+    # A newer version gets a new entry, so a request still serving an older one
+    # cannot store its lists under the new version
+    cache = current_app.extensions.get('test_cases_list_cache')
+    if cache is None or cache['version'] < version:
+        cache = current_app.extensions['test_cases_list_cache'] = {'version': version, 'bodies': {}}
+    bodies = cache['bodies'] if cache['version'] == version else {}
+    body = bodies.get(fields)
+    if body is None:
+        test_cases = session.execute(select(*test_case_serializer.columns(fields)).order_by(TestCase.id)).all()
+        body = bodies[fields] = test_case_serializer.encode(test_cases, fields)
+
+    response = current_app.response_class(body, mimetype='application/json')
+    etag = f"test_cases-{version}-{_timestamp(updated_at)}"
+    if fields != test_case_serializer.fields:
+        etag += '-' + '.'.join(fields)
+    _set_validators(response, etag, updated_at)
+    return response.make_conditional(request)
+
+
+@test_cases_bp.route('/search', methods=['GET'])
+@jwt_required()
+def search_test_cases():
+    """
+    Search test cases by name and description, best matches first.
+
+    Supported query parameters:
+    - q: Words every returned test case contains, the last one as a prefix (required).
+    - fields: Comma-separated fields to return, all of them by default.
+    - limit: Maximum number of test cases to return (defaults to TEST_CASES_SEARCH_PAGE_SIZE).
+    - offset: Number of matches to skip, from the X-Next-Offset header of the previous page.
+
+    Returns:
+        JSON: A list of the matching test cases.
+    """
+    expression = match_expression(request.args.get('q', ''))
+    if expression is None:
+        return jsonify({"error": "q must contain at least one word"}), 400
+
+    try:
+        fields = test_case_serializer.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        limit = parse_limit(request.args.get('limit'),
+                            current_app.config.get('TEST_CASES_SEARCH_PAGE_SIZE', 20),
+                            current_app.config.get('TEST_CASES_SEARCH_MAX_PAGE_SIZE', 100))
+        offset = int(request.args.get('offset', 0))
+        if offset < 0:
+            raise ValueError(offset)
+    except ValueError:
+        return jsonify({"error": "limit must be a positive integer and offset a non-negative integer"}), 400
+
+    # One extra row tells whether there is a next page
+    query = search_query(expression, test_case_serializer.columns(fields)).limit(limit + 1).offset(offset)
+    test_cases = read_session().execute(query).all()
+
+    response = test_case_serializer.response(test_cases[:limit], fields)
+    if len(test_cases) > limit:
+        response.headers['X-Next-Offset'] = str(offset + limit)
+    return response
 
 
 @test_cases_bp.route('/<int:test_case_id>', methods=['GET'])
@@ -32,14 +121,37 @@ def get_single_test_case(test_case_id):
     Returns:
         JSON: Details of the requested test case.
     """
-    test_case = db.session.get(TestCase, test_case_id)
+    test_case = read_session().get(TestCase, test_case_id)
     if not test_case:
         return jsonify({"error": "Test case not found"}), 404
-    return jsonify({"id": test_case.id, "name": test_case.name, "description": test_case.description}), 200
+
+    response = jsonify({"id": test_case.id, "name": test_case.name, "description": test_case.description})
+    _set_validators(response, f"test_case-{test_case.id}-{test_case.version}-{_timestamp(test_case.updated_at)}",
+                    test_case.updated_at)
+    return response.make_conditional(request)
+
+
+def _set_validators(response, etag, updated_at, now=None):
+    """
+    Set the ETag of the response, and its Last-Modified header unless the
+    resource was written during the current second: HTTP dates have a
+    one-second resolution, so a later write in the same second would keep the
+    same Last-Modified and If-Modified-Since would answer 304 with a stale body.
+    """
+    response.set_etag(etag)
+    now = now or datetime.utcnow()
+    if updated_at is not None and updated_at.replace(microsecond=0) < now.replace(microsecond=0):
+        response.last_modified = updated_at
+
+
+def _timestamp(value):
+    # Distinguishes versions of a database that was recreated
+    return int(value.timestamp() * 1000000) if value else 0
 
 
 @test_cases_bp.route('/', methods=['POST'])
 @jwt_required()
+@admin_required("Only admins can create test cases")
 def create_test_case():
     """
     Create a new test case.
@@ -47,21 +159,14 @@ def create_test_case():
     Returns:
         JSON: Confirmation message and details of the created test case upon successful creation.
     """
-    current_user = get_jwt_identity()
-    user = User.query.filter_by(username=current_user).first()
-    if not user or user.role != 'admin':
-        return jsonify({"error": "Only admins can create test cases"}), 401
-
     data = request.get_json()
-    if not data or 'name' not in data or not isinstance(data['name'], str) or len(data['name']) > 100:
-        return jsonify({"error": "Invalid name provided for test case"}), 400
+    error = _validate_test_case(data)
+    if error:
+        return jsonify({"error": error}), 400
 
-    description = data.get('description', '')
-    if description and not isinstance(description, str):
-        return jsonify({"error": "Invalid description provided for test case"}), 400
-
-    new_test_case = TestCase(name=data['name'], description=description)
+    new_test_case = TestCase(name=data['name'], description=data.get('description', ''))
     db.session.add(new_test_case)
+    bump_table_version(TestCase.__tablename__)
     db.session.commit()
 
     # Return confirmation message along with the details of the created test case
@@ -76,8 +181,172 @@ def create_test_case():
     return jsonify(response_body), 201
 
 
+def _validate_test_case(data):
+    """
+    Return the validation error of a new test case, or None if it is valid.
+    """
+    if not data or not isinstance(data, dict) or not isinstance(data.get('name'), str) or len(data['name']) > 100:
+        return "Invalid name provided for test case"
+    description = data.get('description', '')
+    if description and not isinstance(description, str):
+        return "Invalid description provided for test case"
+    return None
+
+
+@test_cases_bp.route('/import', methods=['POST'])
+@jwt_required()
+@admin_required("Only admins can import test cases")
+def import_test_cases():
+    """
+    Create test cases from a CSV (Content-Type: text/csv, with a header row
+    naming the 'name' and 'description' columns) or NDJSON
+    (Content-Type: application/x-ndjson) body, validated like single creations.
+
+    The body is read line by line and inserted in transactions of
+    TEST_CASES_IMPORT_CHUNK_SIZE test cases, so memory use does not grow with
+    its size. Committed chunks stay committed if a later line fails to decode.
+    Other columns or keys, e.g. the 'id' of an export, are ignored.
+
+    Returns:
+        JSON: Imported and rejected counts, the number of committed chunks and
+        the first TEST_CASES_IMPORT_MAX_ERRORS errors with their line number.
+        201 if every test case was imported, 207 if only some were, 400 if
+        nothing was imported.
+    """
+    if request.mimetype == CSV_MIMETYPE:
+        items = _read_csv_items()
+    elif request.mimetype == NDJSON_MIMETYPE:
+        items = _read_ndjson_items()
+    else:
+        return jsonify({"error": f"Content-Type must be {CSV_MIMETYPE} or {NDJSON_MIMETYPE}"}), 415
+
+    chunk_size = current_app.config.get('TEST_CASES_IMPORT_CHUNK_SIZE', 1000)
+    max_errors = current_app.config.get('TEST_CASES_IMPORT_MAX_ERRORS', 100)
+    progress = {"imported": 0, "rejected": 0, "chunks": 0, "errors": []}
+
+    def add_error(line, error):
+        progress['rejected'] += 1
+        if len(progress['errors']) < max_errors:
+            progress['errors'].append({"line": line, "error": error})
+
+    rows = []
+    try:
+        for line, item in items:
+            error = _validate_test_case(item)
+            if error:
+                add_error(line, error)
+                continue
+            rows.append({"name": item['name'], "description": item.get('description', '')})
+            if len(rows) == chunk_size:
+                _insert_test_cases(rows, progress)
+                rows = []
+    except (UnicodeDecodeError, csv.Error) as e:
+        add_error(None, f"Unreadable body: {e}")
+        rows = []
+    if rows:
+        _insert_test_cases(rows, progress)
+
+    progress['errors_truncated'] = progress['rejected'] > len(progress['errors'])
+    if not progress['imported']:
+        status_code = 400
+    else:
+        status_code = 207 if progress['rejected'] else 201
+    return jsonify(progress), status_code
+
+
+def _insert_test_cases(rows, progress):
+    # One executemany and one commit per chunk
+    db.session.execute(insert(TestCase), rows)
+    bump_table_version(TestCase.__tablename__)
+    db.session.commit()
+    progress['imported'] += len(rows)
+    progress['chunks'] += 1
+
+
+def _read_csv_items():
+    """
+    Yield (line number, row dict) for the rows of a CSV body.
+    """
+    reader = csv.DictReader(codecs.iterdecode(request.stream, 'utf-8-sig'))
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _read_ndjson_items():
+    """
+    Yield (line number, item) for the lines of an NDJSON body, None for lines
+    that are not valid JSON.
+    """
+    for line_number, line in enumerate(request.stream, start=1):
+        if line.strip():
+            try:
+                yield line_number, json.loads(line)
+            except ValueError:
+                yield line_number, None
+
+
+@test_cases_bp.route('/export', methods=['GET'])
+@jwt_required()
+def export_test_cases():
+    """
+    Stream every test case, oldest first, in chunks of
+    TEST_CASES_EXPORT_CHUNK_SIZE so memory use does not grow with the catalog.
+
+    Supported query parameters:
+    - format: 'csv' or 'ndjson', otherwise chosen from the Accept header (NDJSON by default).
+    - fields: Comma-separated fields to export, all of them by default.
+
+    The X-Total-Count header holds the number of test cases to expect, for
+    progress reporting.
+
+    Returns:
+        CSV with a header row, or NDJSON with one test case per line.
+    """
+    export_format = request.args.get('format')
+    if export_format is None:
+        best = request.accept_mimetypes.best_match([NDJSON_MIMETYPE, CSV_MIMETYPE], default=NDJSON_MIMETYPE)
+        export_format = 'csv' if best == CSV_MIMETYPE else 'ndjson'
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({"error": "format must be 'csv' or 'ndjson'"}), 400
+
+    try:
+        fields = test_case_serializer.parse_fields(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    session = read_session()
+    total = session.scalar(select(func.count()).select_from(TestCase))
+    chunk_size = current_app.config.get('TEST_CASES_EXPORT_CHUNK_SIZE', 1000)
+    query = select(*test_case_serializer.columns(fields)).order_by(TestCase.id)
+
+    def generate():
+        result = read_session().execute(query.execution_options(yield_per=chunk_size))
+        if export_format == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(fields)
+            for partition in result.partitions():
+                writer.writerows(partition)
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue().encode()
+        else:
+            encode = test_case_serializer.encoder(fields)
+            for partition in result.partitions():
+                yield b''.join(dumps(encode(test_case)) + b'\n' for test_case in partition)
+
+    mimetype = CSV_MIMETYPE if export_format == 'csv' else NDJSON_MIMETYPE
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    response.headers['X-Total-Count'] = str(total)
+    response.headers['Content-Disposition'] = f'attachment; filename=test_cases.{export_format}'
+    return response
+
+
 @test_cases_bp.route('/<int:test_case_id>', methods=['PUT'])
 @jwt_required()
+@admin_required("Only admins can update test cases")
 def update_test_case(test_case_id):
     """
     Update an existing test case.
@@ -88,11 +357,6 @@ def update_test_case(test_case_id):
     Returns:
         JSON: Confirmation message upon successful update.
     """
-    current_user = get_jwt_identity()
-    user = User.query.filter_by(username=current_user).first()
-    if not user or user.role != 'admin':
-        return jsonify({"error": "Only admins can update test cases"}), 401
-
     test_case = db.session.get(TestCase, test_case_id)
     if not test_case:
         return jsonify({"error": "Test case not found"}), 404
@@ -111,6 +375,7 @@ def update_test_case(test_case_id):
 
     test_case.name = name
     test_case.description = description
+    bump_table_version(TestCase.__tablename__)
     db.session.commit()
 
     return jsonify({"message": "Test case updated successfully"}), 200
@@ -118,6 +383,7 @@ def update_test_case(test_case_id):
 
 @test_cases_bp.route('/<int:test_case_id>', methods=['DELETE'])
 @jwt_required()
+@admin_required("Only admins can delete test cases")
 def delete_test_case(test_case_id):
     """
     Delete a test case.
@@ -128,15 +394,60 @@ def delete_test_case(test_case_id):
     Returns:
         JSON: Confirmation message upon successful deletion.
     """
-    current_user = get_jwt_identity()
-    user = User.query.filter_by(username=current_user).first()
-    if not user or user.role != 'admin':
-        return jsonify({"error": "Only admins can delete test cases"}), 401
-
     test_case = db.session.get(TestCase, test_case_id)
     if not test_case:
         return jsonify({"error": "Test case not found"}), 404
 
+    # Its execution results are removed by the database cascade, without being loaded
     db.session.delete(test_case)
+    bump_table_version(TestCase.__tablename__)
     db.session.commit()
+    _delete_shard_rows([test_case_id])
     return jsonify({"message": "Test case deleted successfully"}), 200
+
+
+def _delete_shard_rows(test_case_ids):
+    # Results kept in shards are out of reach of the cascade. The test cases
+    # are already deleted, so a failure is left to `flask rebuild-summaries`
+    try:
+        current_router().delete_test_cases(test_case_ids)
+    except SQLAlchemyError as e:
+        current_app.logger.error(f"Failed to delete the shard rows of test cases {sorted(test_case_ids)}: {e}")
+
+
+@test_cases_bp.route('/', methods=['DELETE'])
+@jwt_required()
+@admin_required("Only admins can delete test cases")
+def delete_test_cases():
+    """
+    Delete many test cases, and their execution results, in one transaction.
+
+    Expects a JSON payload with an 'ids' list of at most
+    TEST_CASES_BULK_DELETE_MAX_IDS test case IDs.
+
+    Returns:
+        JSON: Number of deleted test cases and the IDs that were not found.
+    """
+    data = request.get_json(silent=True)
+    ids = data.get('ids') if isinstance(data, dict) else None
+    # JSON true and false decode to bools, which are ints too
+    if not isinstance(ids, list) or not ids or \
+            not all(isinstance(id_, int) and not isinstance(id_, bool) for id_ in ids):
+        return jsonify({"error": "ids must be a non-empty list of test case IDs"}), 400
+
+    max_ids = current_app.config.get('TEST_CASES_BULK_DELETE_MAX_IDS', 10000)
+    ids = set(ids)
+    if len(ids) > max_ids:
+        return jsonify({"error": f"At most {max_ids} test cases can be deleted at once"}), 413
+
+    # A single set-based DELETE; the foreign keys cascade it to the results and summaries
+    test_case_table = TestCase.__table__
+    deleted_ids = set(db.session.scalars(
+        delete(test_case_table).where(test_case_table.c.id.in_(ids)).returning(test_case_table.c.id)))
+    if deleted_ids:
+        bump_table_version(TestCase.__tablename__)
+    db.session.commit()
+    if deleted_ids:
+        _delete_shard_rows(deleted_ids)
+
+    return jsonify({"deleted": len(deleted_ids), "not_found": sorted(ids - deleted_ids)}), 200
@@ -0,0 +1,147 @@
+import hashlib
+from datetime import datetime
+
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.schema import CreateColumn, CreateIndex, CreateTable
+
+from log_partitions import list_partitions
+from models import SchemaVersion
+from search import create_search_index
+
+# Bump when the schema changes in a way the table definitions do not show,
+# e.g. DDL emitted by event listeners
+SCHEMA_REVISION = 2
+SCHEMA_KEY = 'main'
+
+schema_version = SchemaVersion.__table__
+
+
+def schema_fingerprint(metadata, dialect):
+    """
+    Returns:
+        str: Hash of the DDL of every table and index of the metadata.
+    """
+    digest = hashlib.sha256(str(SCHEMA_REVISION).encode())
+    for table in metadata.sorted_tables:
+        digest.update(str(CreateTable(table).compile(dialect=dialect)).encode())
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            digest.update(str(CreateIndex(index).compile(dialect=dialect)).encode())
+    return digest.hexdigest()
+
+
+def stored_fingerprint(connection):
+    """
+    Returns:
+        str: Fingerprint of the schema the database was last migrated to, None if it never was.
+    """
+    if not inspect(connection).has_table(schema_version.name):
+        return None
+    return connection.execute(
+        select(schema_version.c.fingerprint).where(schema_version.c.name == SCHEMA_KEY)).scalar()
+
+
+def ensure_schema(engine, metadata):
+    """
+    Migrate the database to the schema of the metadata, unless the stored
+    fingerprint shows it already is. Starting a worker on an up-to-date
+    database therefore costs one lookup instead of a reflection of every table.
+
+    Concurrently starting workers are serialized by an immediate transaction,
+    and only the first one migrates.
+
+    Returns:
+        bool: True if the database was migrated.
+    """
+    fingerprint = schema_fingerprint(metadata, engine.dialect)
+    with engine.connect() as connection:
+        if stored_fingerprint(connection) == fingerprint:
+            return False
+
+    with engine.connect() as connection:
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+        if stored_fingerprint(connection) == fingerprint:
+            connection.rollback()
+            return False
+        migrate(connection, metadata)
+        statement = sqlite_insert(schema_version).values(name=SCHEMA_KEY, fingerprint=fingerprint,
+                                                         applied_at=datetime.utcnow())
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=[schema_version.c.name],
+            set_={'fingerprint': statement.excluded.fingerprint, 'applied_at': statement.excluded.applied_at}))
+        connection.commit()
+    return True
+
+
+def migrate(connection, metadata):
+    """
+    Create the missing tables, then add the columns and indexes missing from
+    the existing ones. Columns added this way must be nullable or have a
+    server default, as SQLite requires.
+
+    Other changes to existing tables are not applied, except turning on
+    AUTOINCREMENT (sqlite_autoincrement), which rebuilds the table.
+    """
+    metadata.create_all(connection)
+    # Execution result shards (see shards.py) hold neither test cases nor logs
+    if 'test_case' in metadata.tables:
+        # Only created with the test_case table otherwise, so add it to existing databases
+        create_search_index(connection)
+
+    # Log partitions are created as copies of the log table, so they follow its columns
+    partitions = [table for _, _, table in list_partitions(connection)] if 'log' in metadata.tables else []
+    for table in metadata.sorted_tables:
+        if table.dialect_options['sqlite']['autoincrement'] and not has_autoincrement(connection, table.name):
+            # Log ids must stay unique across the partitions rows were moved to
+            rebuild_with_autoincrement(connection, table, partitions if table.name == 'log' else ())
+
+    inspector = inspect(connection)
+    for table in [*metadata.sorted_tables, *partitions]:
+        add_missing_columns(connection, inspector, table)
+
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(connection)
+
+
+def add_missing_columns(connection, inspector, table):
+    preparer = connection.dialect.identifier_preparer
+    existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+    for column in table.columns:
+        if column.name not in existing_columns:
+            column_ddl = CreateColumn(column).compile(dialect=connection.dialect)
+            connection.exec_driver_sql(f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {column_ddl}')
+
+
+def has_autoincrement(connection, name):
+    sql = connection.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                             {'name': name}).scalar()
+    return sql is not None and 'AUTOINCREMENT' in sql.upper()
+
+
+def rebuild_with_autoincrement(connection, table, siblings=()):
+    """
+    Recreate a table created without AUTOINCREMENT with the definition of the
+    metadata, keeping its rows, and start its id sequence after the largest id
+    of the table and of its siblings (e.g. the partitions of the log table).
+    """
+    preparer = connection.dialect.identifier_preparer
+    name = preparer.format_table(table)
+    old_name = preparer.quote(f'{table.name}__rebuild')
+    inspector = inspect(connection)
+    columns = [column['name'] for column in inspector.get_columns(table.name) if column['name'] in table.c]
+    # Index names are unique per database, so make way for those of the new table
+    for index in inspector.get_indexes(table.name):
+        connection.exec_driver_sql(f'DROP INDEX {preparer.quote(index["name"])}')
+    connection.exec_driver_sql(f'ALTER TABLE {name} RENAME TO {old_name}')
+    table.create(connection)
+    column_list = ', '.join(preparer.quote(column) for column in columns)
+    connection.exec_driver_sql(f'INSERT INTO {name} ({column_list}) SELECT {column_list} FROM {old_name}')
+    connection.exec_driver_sql(f'DROP TABLE {old_name}')
+
+    last_id = max((connection.execute(select(func.max(source.c.id))).scalar() or 0
+                   for source in (table, *siblings)), default=0)
+    connection.execute(text("DELETE FROM sqlite_sequence WHERE name = :name"), {'name': table.name})
+    connection.execute(text("INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :seq)"),
+                       {'name': table.name, 'seq': last_id})
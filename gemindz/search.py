@@ -0,0 +1,99 @@
+import re
+
+from sqlalchemy import DDL, column, event, func, select, table, text
+
+from models import TestCase
+
+SEARCH_TABLE = 'test_case_fts'
+
+test_case_table = TestCase.__table__
+# External content index over test_case: only the token index is stored, the
+# column values are read back from test_case by rowid
+search_table = table(SEARCH_TABLE, column('rowid'), column('name'), column('description'))
+
+_CREATE_STATEMENTS = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+    f"name, description, content='test_case', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    # Triggers rather than ORM events, so bulk inserts and Core statements are indexed too
+    f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert AFTER INSERT ON test_case BEGIN "
+    f"INSERT INTO {SEARCH_TABLE} (rowid, name, description) VALUES (new.id, new.name, new.description); END",
+    f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete AFTER DELETE ON test_case BEGIN "
+    f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, name, description) "
+    f"VALUES ('delete', old.id, old.name, old.description); END",
+    # Version and timestamp updates leave the indexed columns alone
+    f"CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update AFTER UPDATE OF name, description ON test_case BEGIN "
+    f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}, rowid, name, description) "
+    f"VALUES ('delete', old.id, old.name, old.description); "
+    f"INSERT INTO {SEARCH_TABLE} (rowid, name, description) VALUES (new.id, new.name, new.description); END",
+)
+_DROP_STATEMENTS = (
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_insert",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_delete",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_update",
+    f"DROP TABLE IF EXISTS {SEARCH_TABLE}",
+)
+
+# Name matches weigh more than description matches in the bm25 ranking
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+_TERM = re.compile(r'\w+')
+
+for _statement in _CREATE_STATEMENTS:
+    event.listen(test_case_table, 'after_create', DDL(_statement))
+for _statement in _DROP_STATEMENTS:
+    event.listen(test_case_table, 'before_drop', DDL(_statement))
+
+
+def create_search_index(connection):
+    """
+    Create the search table and its triggers if they are missing, indexing the
+    existing test cases when the table is new.
+
+    Returns:
+        bool: True if the search table was created.
+    """
+    exists = connection.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                                {'name': SEARCH_TABLE}).first() is not None
+    for statement in _CREATE_STATEMENTS:
+        connection.exec_driver_sql(statement)
+    if not exists:
+        rebuild_search_index(connection)
+    return not exists
+
+
+def rebuild_search_index(connection):
+    """
+    Reindex every test case, e.g. after rows were written with the triggers missing.
+    """
+    connection.exec_driver_sql(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('rebuild')")
+
+
+def match_expression(query):
+    """
+    Turn free text into an FTS5 query matching rows that contain every word,
+    the last one as a prefix so results follow the user while typing. Each
+    word is quoted, so FTS5 operators and punctuation in the text are not
+    interpreted.
+
+    Returns:
+        str: The MATCH expression, None if the text has no word.
+    """
+    terms = _TERM.findall(query)
+    if not terms:
+        return None
+    phrases = [f'"{term}"' for term in terms]
+    phrases[-1] += '*'
+    return ' '.join(phrases)
+
+
+def search_query(expression, columns):
+    """
+    Returns:
+        Select: The columns of the test cases matching the expression, best matches first.
+    """
+    rank = func.bm25(text(SEARCH_TABLE), NAME_WEIGHT, DESCRIPTION_WEIGHT)
+    return (select(*columns)
+            .select_from(search_table.join(test_case_table, test_case_table.c.id == search_table.c.rowid))
+            .where(text(f"{SEARCH_TABLE} MATCH :expression").bindparams(expression=expression))
+            .order_by(rank, test_case_table.c.id))
@@ -0,0 +1,115 @@
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, jsonify
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from models import db, User
+
+_MISSING = object()
+
+
+class IdentityCache:
+    """
+    Small thread-safe TTL cache mapping usernames to their role.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, username):
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                return _MISSING
+            role, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[username]
+                return _MISSING
+            return role
+
+    def set(self, username, role, ttl):
+        with self._lock:
+            if username not in self._entries and len(self._entries) >= self.maxsize:
+                # Evict the oldest entry
+                del self._entries[next(iter(self._entries))]
+            self._entries[username] = (role, time.monotonic() + ttl)
+
+    def invalidate(self, username):
+        with self._lock:
+            self._entries.pop(username, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+identity_cache = IdentityCache()
+
+
+def current_user_role():
+    """
+    Return the role of the user identified by the current access token.
+
+    The role is read from the database through the identity cache, which only
+    queries it when the user is not cached, so demoting or deleting a user
+    takes effect before their tokens expire: at once in this process, and
+    within IDENTITY_CACHE_TTL seconds in the others. The role claim of tokens
+    issued by /auth/login is not trusted on its own.
+    """
+    username = get_jwt_identity()
+    role = identity_cache.get(username)
+    if role is _MISSING:
+        role = db.session.query(User.role).filter_by(username=username).scalar()
+        identity_cache.set(username, role, current_app.config.get('IDENTITY_CACHE_TTL', 60))
+    return role
+
+
+def admin_required(error_message):
+    """
+    Only let admins through to the decorated view. Must be applied below
+    @jwt_required() so the access token is verified first.
+
+    Args:
+        error_message (str): Error returned with a 401 to non-admin users.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if current_user_role() != 'admin':
+                return jsonify({"error": error_message}), 401
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _invalidate_identity(mapper, connection, target):
+    # Drop the cached role of registered, changed or deleted users, including
+    # the previous username if it was renamed, once the change is committed:
+    # a request reading the user before then would cache the old role again
+    session = object_session(target)
+    usernames = [target.username, *inspect(target).attrs.username.history.deleted]
+    if session is None:
+        for username in usernames:
+            identity_cache.invalidate(username)
+    else:
+        session.info.setdefault('changed_usernames', set()).update(usernames)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_identities(session):
+    for username in session.info.pop('changed_usernames', ()):
+        identity_cache.invalidate(username)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rolled_back_identities(session):
+    session.info.pop('changed_usernames', None)
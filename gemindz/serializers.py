@@ -0,0 +1,115 @@
+import json
+
+from flask import current_app
+from sqlalchemy import DateTime
+
+from models import ExecutionResult, FlakinessState, Log, LogRollup, TestCase
+
+try:
+    import orjson
+except ImportError:  # Optional, the standard library encoder is used without it
+    orjson = None
+
+JSON_MIMETYPE = 'application/json'
+NDJSON_MIMETYPE = 'application/x-ndjson'
+CSV_MIMETYPE = 'text/csv'
+
+
+def dumps(value):
+    """
+    Encode a value of JSON types as compact JSON, with orjson when it is installed.
+
+    Returns:
+        bytes: The encoded value.
+    """
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':')).encode()
+
+
+def _isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+class Serializer:
+    """
+    Encode rows selected from a fixed set of columns of a table as JSON objects.
+
+    Routes select the columns of the requested fields as plain tuples instead
+    of loading ORM instances, then encode them with the encoder compiled once
+    per field set. Datetimes are encoded as ISO 8601 strings.
+    """
+
+    def __init__(self, table, fields):
+        self.table = table
+        self.fields = tuple(fields)
+        self._encoders = {}
+
+    def parse_fields(self, value):
+        """
+        Parse a ?fields= projection: comma-separated field names.
+
+        Returns:
+            tuple: The requested fields in serializer order, all fields if value is empty.
+
+        Raises:
+            ValueError: If a field is unknown.
+        """
+        if not value:
+            return self.fields
+        requested = {field.strip() for field in value.split(',') if field.strip()}
+        unknown = sorted(requested.difference(self.fields))
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}. Available fields: {', '.join(self.fields)}")
+        return tuple(field for field in self.fields if field in requested)
+
+    def columns(self, fields, table=None, required=()):
+        """
+        Returns:
+            list: Columns of table (the serializer table by default) to select for
+            the fields, followed by the required ones that are not among them,
+            e.g. those a pagination cursor is built from.
+        """
+        table = self.table if table is None else table
+        names = fields + tuple(name for name in required if name not in fields)
+        return [table.c[name] for name in names]
+
+    def encoder(self, fields):
+        """
+        Returns:
+            function: Encodes a row selected with columns(fields) to a dict.
+        """
+        encoder = self._encoders.get(fields)
+        if encoder is None:
+            steps = tuple((name, position, _isoformat if isinstance(self.table.c[name].type, DateTime) else None)
+                          for position, name in enumerate(fields))
+            if any(convert for _, _, convert in steps):
+                def encoder(row):
+                    return {name: convert(row[position]) if convert else row[position]
+                            for name, position, convert in steps}
+            else:
+                def encoder(row):
+                    return dict(zip(fields, row))
+            self._encoders[fields] = encoder
+        return encoder
+
+    def encode(self, rows, fields):
+        """
+        Returns:
+            bytes: JSON list of the encoded rows.
+        """
+        encode_row = self.encoder(fields)
+        return dumps([encode_row(row) for row in rows])
+
+    def response(self, rows, fields, status=200):
+        return current_app.response_class(self.encode(rows, fields), status=status, mimetype=JSON_MIMETYPE)
+
+
+test_case_serializer = Serializer(TestCase.__table__, ('id', 'name', 'description'))
+execution_result_serializer = Serializer(ExecutionResult.__table__,
+                                         ('id', 'test_case_id', 'test_asset_id', 'result', 'created_at'))
+log_serializer = Serializer(Log.__table__, ('id', 'endpoint_name', 'method', 'status_code', 'error', 'duration_ms',
+                                            'query_count', 'query_time_ms', 'created_at'))
+log_rollup_serializer = Serializer(LogRollup.__table__, ('hour', 'endpoint_name', 'status_code', 'count'))
+flakiness_serializer = Serializer(FlakinessState.__table__, ('test_case_id', 'test_asset_id', 'last_result', 'run_count',
+                                                             'flip_count', 'flip_rate', 'last_run_at'))
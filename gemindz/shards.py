@@ -0,0 +1,265 @@
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app, g, has_app_context
+from sqlalchemy import Column, Index, MetaData, Table, create_engine, delete, distinct, event, insert, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
+
+from database import _pragma_listener, db, read_session
+from flakiness import rebuild_flakiness
+from models import (ExecutionResult, ExecutionResultAssetTrend, ExecutionResultCaseTrend, ExecutionResultSummary,
+                    FlakinessState, SchemaVersion)
+from rollups import rebuild_summaries
+from schema import ensure_schema
+
+# Tables of the data of a test asset, which live in the shard of the asset.
+# Test cases stay in the main database, so the shards have no foreign keys:
+# deleting test cases deletes their rows from every shard explicitly.
+SHARDED_MODELS = (ExecutionResult, ExecutionResultSummary, ExecutionResultAssetTrend, ExecutionResultCaseTrend,
+                  FlakinessState)
+# Per test case rows, deleted with the test case
+_TEST_CASE_TABLES = [model.__table__ for model in SHARDED_MODELS if model is not ExecutionResultAssetTrend]
+# Per test asset rows, moved with the test asset by a rebalance
+_TEST_ASSET_TABLES = [model.__table__ for model in SHARDED_MODELS if model is not ExecutionResultCaseTrend]
+
+
+def _copy_table(table, metadata):
+    columns = [Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable,
+                      server_default=column.server_default) for column in table.columns]
+    indexes = [Index(index.name, *[column.name for column in index.columns]) for index in table.indexes]
+    return Table(table.name, metadata, *columns, *indexes)
+
+
+shard_metadata = MetaData()
+for _model in (*SHARDED_MODELS, SchemaVersion):
+    _copy_table(_model.__table__, shard_metadata)
+
+
+def shard_index(test_asset_id, count):
+    """
+    Returns:
+        int: Position of the shard of the test asset among `count` shards. The
+        hash is stable across processes and Python versions.
+    """
+    return zlib.crc32(str(test_asset_id).encode()) % count
+
+
+def shard_url(uri, instance_path=None):
+    """
+    Returns:
+        URL: URL of a shard database. Relative SQLite paths are resolved against
+        the instance path, as Flask-SQLAlchemy does.
+    """
+    url = make_url(uri)
+    if instance_path and url.database and url.database != ':memory:' and not os.path.isabs(url.database):
+        url = url.set(database=os.path.join(instance_path, url.database))
+    return url
+
+
+def create_shard_engine(uri, pragmas=None, instance_path=None):
+    """
+    Create the engine of a shard and migrate it to the shard schema.
+    """
+    # Fan-out queries use the connections from worker threads
+    engine = create_engine(shard_url(uri, instance_path), connect_args={'check_same_thread': False})
+    if pragmas:
+        event.listen(engine, 'connect', _pragma_listener(pragmas))
+    ensure_schema(engine, shard_metadata)
+    return engine
+
+
+class ShardRouter:
+    """
+    Place the execution results, and the summaries, trends and flakiness
+    states derived from them, in EXECUTION_RESULT_SHARDS SQLite databases by
+    hash of the test asset. Each database has its own write lock, so writers
+    of different test assets no longer wait for each other.
+
+    Reads and writes of one test asset use the session of its shard; queries
+    across test assets run on every shard in parallel on a pool of
+    EXECUTION_RESULT_SHARD_WORKERS threads (one per shard by default), and
+    the caller merges their results.
+
+    Without shards, the results stay in the main database and the router
+    hands out db.session and read_session(), so routes use it either way.
+    """
+
+    def __init__(self, app=None):
+        self.engines = []
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        pragmas = app.config.get('SQLITE_PRAGMAS', {})
+        self.engines = [create_shard_engine(uri, pragmas, app.instance_path)
+                        for uri in app.config.get('EXECUTION_RESULT_SHARDS') or ()]
+        self.workers = app.config.get('EXECUTION_RESULT_SHARD_WORKERS') or len(self.engines)
+        self._session_factories = [sessionmaker(bind=engine) for engine in self.engines]
+        app.extensions['shard_router'] = self
+        app.teardown_appcontext(self._close_sessions)
+
+        def dispose_engines():
+            # Workers forked by a preloading server open their own connections
+            for engine in self.engines:
+                engine.dispose(close=False)
+
+        os.register_at_fork(after_in_child=dispose_engines)
+
+    @property
+    def enabled(self):
+        return bool(self.engines)
+
+    def index(self, test_asset_id):
+        """
+        Returns:
+            int: Position of the shard of the test asset, 0 without shards.
+        """
+        return shard_index(test_asset_id, len(self.engines)) if self.enabled else 0
+
+    def session(self, test_asset_id):
+        """
+        Returns:
+            Session: Session of the shard of the test asset, for the current request.
+        """
+        if not self.enabled:
+            return db.session
+        index = self.index(test_asset_id)
+        sessions = g.setdefault('shard_sessions', {})
+        if index not in sessions:
+            sessions[index] = self._session_factories[index]()
+        return sessions[index]
+
+    def read_session(self, test_asset_id):
+        """
+        Returns:
+            Session: Session to read the data of the test asset from.
+        """
+        if not self.enabled:
+            return read_session()
+        return self.session(test_asset_id)
+
+    def fan_out(self, function):
+        """
+        Call function(connection) on every shard in parallel.
+
+        Returns:
+            list: The return values, in shard order.
+        """
+        if not self.enabled:
+            return [function(read_session())]
+
+        def run(engine):
+            with engine.connect() as connection:
+                return function(connection)
+
+        return list(self._pool().map(run, self.engines))
+
+    def delete_test_cases(self, test_case_ids):
+        """
+        Delete the rows of deleted test cases from every shard, the job of the
+        foreign key cascade in the main database.
+        """
+        if not self.enabled:
+            return
+        test_case_ids = list(test_case_ids)
+
+        def run(engine):
+            with engine.begin() as connection:
+                for table in _TEST_CASE_TABLES:
+                    connection.execute(delete(table).where(table.c.test_case_id.in_(test_case_ids)))
+
+        list(self._pool().map(run, self.engines))
+
+    def _pool(self):
+        # Threads do not survive a fork, so every server worker starts its own pool
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='shard')
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _close_sessions(self, exception=None):
+        for session in g.pop('shard_sessions', {}).values():
+            session.close()
+
+
+_unsharded_router = ShardRouter()
+
+
+def current_router():
+    if has_app_context():
+        return current_app.extensions.get('shard_router', _unsharded_router)
+    return _unsharded_router
+
+
+def prune_test_cases(engine, test_case_ids, chunk_size=500):
+    """
+    Delete the rows of the test cases missing from test_case_ids from a
+    shard, e.g. those left behind by a failed delete_test_cases.
+
+    Returns:
+        int: Number of deleted execution results.
+    """
+    deleted = 0
+    with engine.begin() as connection:
+        orphans = set()
+        for table in _TEST_CASE_TABLES:
+            orphans.update(connection.scalars(select(distinct(table.c.test_case_id))))
+        orphans = sorted(orphans - set(test_case_ids))
+        for start in range(0, len(orphans), chunk_size):
+            chunk = orphans[start:start + chunk_size]
+            for table in _TEST_CASE_TABLES:
+                result = connection.execute(delete(table).where(table.c.test_case_id.in_(chunk)))
+                if table is ExecutionResult.__table__:
+                    deleted += result.rowcount
+    return deleted
+
+
+def rebalance(sources, targets, chunk_size=10000):
+    """
+    Move every test asset from the shard it has among the source engines to
+    the one it has among the target engines. Engines of both lists with the
+    same URL are the same shard; shards only in the source list are left
+    empty of execution results.
+
+    The rows of a test asset are copied in id order and get new ids in their
+    new shard, so pagination cursors issued before are invalidated. A test
+    asset is copied in one transaction and then deleted from its source, and
+    a rerun after an interruption first clears partial copies. The summaries,
+    trends and flakiness states of the target shards are rebuilt at the end.
+
+    Returns:
+        int: Number of moved execution results.
+    """
+    results = ExecutionResult.__table__
+    columns = [column for column in results.columns if column.name != 'id']
+    moved = 0
+    for source in sources:
+        with source.connect() as connection:
+            test_asset_ids = connection.scalars(select(distinct(results.c.test_asset_id))).all()
+        for test_asset_id in test_asset_ids:
+            target = targets[shard_index(test_asset_id, len(targets))]
+            if target.url == source.url:
+                continue
+            with source.connect() as source_connection, target.begin() as target_connection:
+                target_connection.execute(delete(results).where(results.c.test_asset_id == test_asset_id))
+                rows = source_connection.execution_options(yield_per=chunk_size).execute(
+                    select(*columns).where(results.c.test_asset_id == test_asset_id).order_by(results.c.id))
+                for partition in rows.partitions():
+                    target_connection.execute(insert(results), [row._asdict() for row in partition])
+                    moved += len(partition)
+            with source.begin() as connection:
+                for table in _TEST_ASSET_TABLES:
+                    connection.execute(delete(table).where(table.c.test_asset_id == test_asset_id))
+
+    for engine in {str(engine.url): engine for engine in [*sources, *targets]}.values():
+        with engine.begin() as connection:
+            rebuild_summaries(connection)
+            rebuild_flakiness(connection)
+    return moved
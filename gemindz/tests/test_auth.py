@@ -1,8 +1,10 @@
 import unittest
 import logging
 from flask import Flask
-from flask_jwt_extended import JWTManager
+from flask_jwt_extended import JWTManager, decode_token
+from werkzeug.security import generate_password_hash
 from models import db, User
+from passwords import PasswordHasher
 from routes.auth import auth_bp
 
 logging.basicConfig(level=logging.DEBUG)  # Set logging level to DEBUG
@@ -55,6 +57,8 @@ class AuthRouteTestCase(unittest.TestCase):
         response = self.client.post('/auth/login', json={'username': 'test_user', 'password': 'password'})
         self.assertEqual(response.status_code, 200)
         self.assertIn('access_token', response.json)
+        with self.app.app_context():
+            self.assertEqual(decode_token(response.json['access_token'])['role'], 'user')
 
     def test_login_invalid_credentials(self):
         new_user = User(username='test_user', password='password')
@@ -64,6 +68,51 @@ class AuthRouteTestCase(unittest.TestCase):
         response = self.client.post('/auth/login', json={'username': 'test_user', 'password': 'wrong_password'})
         self.assertEqual(response.status_code, 401)
 
+    def test_login_upgrades_outdated_hash(self):
+        with self.app.app_context():
+            user = User(username='test_user', password='password')
+            user.password_hash = generate_password_hash('password', method='pbkdf2:sha256:1000')
+            db.session.add(user)
+            db.session.commit()
+        response = self.client.post('/auth/login', json={'username': 'test_user', 'password': 'password'})
+        self.assertEqual(response.status_code, 200)
+        with self.app.app_context():
+            user = User.query.filter_by(username='test_user').one()
+            self.assertTrue(user.password_hash.startswith('scrypt:32768:8:1$'))
+            self.assertTrue(user.check_password('password'))
+
+    def test_login_rejected_when_hashing_pool_is_saturated(self):
+        self.app.config.update(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_MAX_PENDING=1, PASSWORD_HASH_QUEUE_TIMEOUT=0)
+        hasher = PasswordHasher(self.app)
+        with self.app.app_context():
+            db.session.add(User(username='test_user', password='password'))
+            db.session.commit()
+
+        hasher._slots.acquire()
+        try:
+            response = self.client.post('/auth/login', json={'username': 'test_user', 'password': 'password'})
+        finally:
+            hasher._slots.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+
+    def test_hashing_pool_hashes_in_worker_processes(self):
+        hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=1)
+        try:
+            password_hash = hasher.hash('password')
+            self.assertTrue(password_hash.startswith('pbkdf2:sha256:1000$'))
+            self.assertTrue(hasher.verify(password_hash, 'password'))
+            self.assertFalse(hasher.needs_rehash(password_hash))
+        finally:
+            hasher.shutdown()
+
+    def test_method_without_cost_does_not_rehash(self):
+        for method, stored in (('pbkdf2:sha256', 'pbkdf2:sha256:600000'), ('pbkdf2', 'pbkdf2:sha256:600000'),
+                               ('scrypt', 'scrypt:32768:8:1')):
+            hasher = PasswordHasher(method=method)
+            self.assertFalse(hasher.needs_rehash(stored + '$salt$hash'))
+            self.assertTrue(hasher.needs_rehash('pbkdf2:sha256:1000$salt$hash'))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,53 @@
+import os
+import unittest
+from unittest import mock
+from app import create_app
+from benchmarks.run import build_context, compare
+from benchmarks.scenarios import SCENARIOS, run_scenario
+from benchmarks.seed import seed_database
+from models import db, ExecutionResult, ExecutionResultSummary, Log, TestCase
+
+COUNTS = {'users': 3, 'test_cases': 5, 'test_assets': 2, 'execution_results': 50, 'logs': 50}
+
+
+class BenchmarkHarnessTestCase(unittest.TestCase):
+    def setUp(self):
+        environ = {'GEMINDZ_CONFIG': 'development', 'GEMINDZ_SQLALCHEMY_DATABASE_URI': '"sqlite:///:memory:"',
+                   'GEMINDZ_LOG_MAINTENANCE_INTERVAL': 'null', 'GEMINDZ_PASSWORD_HASH_WORKERS': '0'}
+        with mock.patch.dict(os.environ, environ):
+            self.app = create_app()
+        with self.app.app_context():
+            seed_database(db, COUNTS, chunk_size=20)
+
+    def tearDown(self):
+        self.app.extensions['log_writer'].stop()
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_seed_database(self):
+        with self.app.app_context():
+            self.assertEqual(TestCase.query.count(), 5)
+            self.assertEqual(ExecutionResult.query.count(), 50)
+            self.assertEqual(Log.query.count(), 50)
+            self.assertEqual(db.session.query(db.func.sum(ExecutionResultSummary.count)).scalar(), 50)
+
+    def test_every_scenario_runs_without_errors(self):
+        client = self.app.test_client()
+        context = build_context(self.app, COUNTS)
+        for name, scenario in SCENARIOS.items():
+            with self.subTest(scenario=name):
+                result = run_scenario(client, scenario, context, requests=2, warmup=0, memory_requests=1)
+                self.assertEqual(result['errors'], 0)
+                self.assertGreater(result['throughput_rps'], 0)
+
+    def test_compare_flags_regressions(self):
+        metrics = {'throughput_rps': 100, 'p50_ms': 10, 'p95_ms': 20, 'p99_ms': 30, 'peak_memory_kib': 100}
+        baseline = {'scenarios': {'home': metrics}}
+        slower = {'scenarios': {'home': {**metrics, 'p99_ms': 40, 'throughput_rps': 90}}}
+        self.assertEqual(compare(baseline, slower, 0.2, 0.25), ['home: p99_ms 30 -> 40'])
+        self.assertEqual(compare(baseline, baseline, 0.2, 0.25), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import unittest
+from flask import Flask
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from config import ProductionConfig
+from database import init_db, read_session
+from models import db, Log
+from routes.logs import logs_bp
+
+
+class StorageProfileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(self.directory.name, 'test.db')}"
+        for key in ('SQLITE_PRAGMAS', 'SQLITE_READ_ENGINE', 'SQLITE_READ_POOL_SIZE', 'SQLALCHEMY_ENGINE_OPTIONS'):
+            self.app.config[key] = getattr(ProductionConfig, key)
+        self.app.register_blueprint(logs_bp)
+        init_db(self.app)
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        self.app.extensions['read_engine'].dispose()
+        self.app_context.pop()
+        self.directory.cleanup()
+
+    def pragma(self, connection, name):
+        return connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+
+    def test_pragmas_are_applied_to_writer_connections(self):
+        connection = db.session.connection()
+        self.assertEqual(self.pragma(connection, 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma(connection, 'synchronous'), 1)
+        self.assertEqual(self.pragma(connection, 'busy_timeout'), 5000)
+        self.assertEqual(self.pragma(connection, 'foreign_keys'), 1)
+        self.assertEqual(self.pragma(connection, 'cache_size'), -65536)
+
+    def test_read_session_uses_read_only_engine(self):
+        db.session.add(Log(endpoint_name='/testcases/', method='GET', status_code=200))
+        db.session.commit()
+
+        with self.app.test_request_context():
+            session = read_session()
+            self.assertIsNot(session, db.session)
+            self.assertIs(session.get_bind(), self.app.extensions['read_engine'])
+            self.assertEqual(self.pragma(session.connection(), 'query_only'), 1)
+            self.assertEqual(session.execute(text('SELECT count(*) FROM log')).scalar(), 1)
+            with self.assertRaises(OperationalError):
+                session.execute(text("DELETE FROM log"))
+
+    def test_get_logs_reads_committed_rows(self):
+        db.session.add(Log(endpoint_name='/testcases/', method='GET', status_code=200))
+        db.session.commit()
+
+        response = self.client.get('/logs/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([log['endpoint_name'] for log in response.json], ['/testcases/'])
+
+    def test_read_session_falls_back_to_db_session(self):
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        db.init_app(app)
+        with app.test_request_context():
+            self.assertIs(read_session(), db.session)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,10 @@
+import json
 import unittest
+from datetime import datetime
 from flask import Flask
 from flask_jwt_extended import JWTManager
-from models import db, User, ExecutionResult
+from commands import register_commands
+from models import db, User, ExecutionResult, ExecutionResultSummary, TestCase
 from routes.execution_results import execution_results_bp
 from routes.auth import auth_bp
 from routes.test_cases import test_cases_bp
@@ -21,6 +24,7 @@ class TestExecutionResultsEndpoints(unittest.TestCase):
         self.app.register_blueprint(execution_results_bp)
         self.app.register_blueprint(auth_bp)
         self.app.register_blueprint(test_cases_bp)
+        register_commands(self.app)
 
         self.client = self.app.test_client()
 
@@ -70,6 +74,7 @@ class TestExecutionResultsEndpoints(unittest.TestCase):
     def test_get_execution_results_for_test_asset(self):
         with self.app.app_context():
             # Create a test execution result
+            db.session.add(TestCase(name='Test Case', description=''))
             execution_result = ExecutionResult(test_case_id=1, test_asset_id=1, result='pass')
             db.session.add(execution_result)
             db.session.commit()
@@ -79,6 +84,186 @@ class TestExecutionResultsEndpoints(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTrue(len(response.json) > 0)
 
+    def test_get_execution_results_pagination_and_filters(self):
+        with self.app.app_context():
+            db.session.add_all([TestCase(name='Test Case 1', description=''),
+                                TestCase(name='Test Case 2', description='')])
+            db.session.add_all([ExecutionResult(test_case_id=1, test_asset_id=1, result=result)
+                                for result in ('pass', 'fail', 'pass')])
+            db.session.add(ExecutionResult(test_case_id=2, test_asset_id=1, result='pass'))
+            db.session.commit()
+
+        response = self.client.get('/execution_results/1?limit=3')
+        self.assertEqual([result['id'] for result in response.json], [1, 2, 3])
+        response = self.client.get(f"/execution_results/1?limit=3&cursor={response.headers['X-Next-Cursor']}")
+        self.assertEqual([result['id'] for result in response.json], [4])
+        self.assertNotIn('X-Next-Cursor', response.headers)
+
+        response = self.client.get('/execution_results/1?test_case_id=1&result=pass')
+        self.assertEqual([result['id'] for result in response.json], [1, 3])
+        response = self.client.get('/execution_results/1?time[lte]=2000-01-01T00:00:00')
+        self.assertEqual(response.status_code, 404)
+
+    def create_test_case(self, headers):
+        response = self.client.post('/testcases/', headers=headers, json={"name": "Test Case"})
+        return response.json.get('test_case').get('id')
+
+    def test_record_execution_results_batch(self):
+        headers = {'Authorization': 'Bearer ' + self.get_token('test_user', 'password')}
+        test_case_id = self.create_test_case(headers)
+        batch = [{"test_case_id": test_case_id, "test_asset_id": 1, "result": "pass"},
+                 {"test_case_id": test_case_id, "test_asset_id": 2, "result": "fail"}]
+        response = self.client.post('/execution_results/batch', json=batch, headers=headers)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json['created'], 2)
+        self.assertEqual([item['status'] for item in response.json['results']], ['created', 'created'])
+        with self.app.app_context():
+            self.assertEqual(ExecutionResult.query.count(), 2)
+
+    def test_record_execution_results_batch_all_or_nothing(self):
+        headers = {'Authorization': 'Bearer ' + self.get_token('test_user', 'password')}
+        test_case_id = self.create_test_case(headers)
+        batch = [{"test_case_id": test_case_id, "test_asset_id": 1, "result": "pass"},
+                 {"test_case_id": 999, "test_asset_id": 1, "result": "pass"}]
+        response = self.client.post('/execution_results/batch', json=batch, headers=headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([item['status'] for item in response.json['results']], ['skipped', 'rejected'])
+        with self.app.app_context():
+            self.assertEqual(ExecutionResult.query.count(), 0)
+
+    def test_record_execution_results_batch_partial_ndjson(self):
+        headers = {'Authorization': 'Bearer ' + self.get_token('test_user', 'password')}
+        test_case_id = self.create_test_case(headers)
+        body = '\n'.join([json.dumps({"test_case_id": test_case_id, "test_asset_id": 1, "result": "pass"}),
+                          'not json',
+                          json.dumps({"test_case_id": test_case_id, "result": "pass"}),
+                          json.dumps({"test_case_id": test_case_id, "test_asset_id": True, "result": "pass"})])
+        response = self.client.post('/execution_results/batch?mode=partial', data=body, headers=headers,
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json['created'], 1)
+        self.assertEqual(response.json['rejected'], 3)
+        self.assertEqual([item['status'] for item in response.json['results']],
+                         ['created', 'rejected', 'rejected', 'rejected'])
+        self.assertEqual(response.json['results'][3]['error'], "test_case_id and test_asset_id must be integers")
+
+    def test_get_execution_results_summary(self):
+        headers = {'Authorization': 'Bearer ' + self.get_token('test_user', 'password')}
+        test_case_id = self.create_test_case(headers)
+        self.client.post('/execution_results', headers=headers,
+                         json={"test_case_id": test_case_id, "test_asset_id": 1, "result": "pass"})
+        batch = [{"test_case_id": test_case_id, "test_asset_id": 1, "result": "pass"},
+                 {"test_case_id": test_case_id, "test_asset_id": 1, "result": "fail"}]
+        self.client.post('/execution_results/batch', json=batch, headers=headers)
+
+        response = self.client.get('/execution_results/1/summary')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['total'], 3)
+        self.assertEqual(response.json['results'], {"pass": 2, "fail": 1})
+        self.assertEqual(response.json['test_cases'],
+                         [{"test_case_id": test_case_id, "total": 3, "results": {"pass": 2, "fail": 1}}])
+
+        # Deleting the test case cascades to its results and their counts
+        self.client.delete(f'/testcases/{test_case_id}', headers=headers)
+        self.assertEqual(self.client.get('/execution_results/1/summary').status_code, 404)
+
+    def test_execution_results_trend(self):
+        with self.app.app_context():
+            db.session.add_all([TestCase(name='Test Case 1', description=''),
+                                TestCase(name='Test Case 2', description='')])
+            for test_case_id, test_asset_id, result, created_at in [
+                    (1, 1, 'pass', datetime(2024, 1, 1, 9)), (1, 1, 'fail', datetime(2024, 1, 1, 15)),
+                    (2, 1, 'pass', datetime(2024, 1, 2, 10)), (2, 2, 'pass', datetime(2024, 1, 2, 11)),
+                    (1, 1, 'pass', datetime(2024, 1, 9, 8))]:
+                execution_result = ExecutionResult(test_case_id=test_case_id, test_asset_id=test_asset_id,
+                                                   result=result)
+                execution_result.created_at = created_at
+                db.session.add(execution_result)
+            db.session.commit()
+
+        response = self.client.get('/execution_results/trend?test_asset_id=1&time[gte]=2024-01-01T00:00:00'
+                                   '&time[lte]=2024-01-31T00:00:00')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {"test_asset_id": 1, "bucket": "1d", "buckets": [
+            {"start": "2024-01-01T00:00:00", "total": 2, "results": {"pass": 1, "fail": 1}, "pass_rate": 0.5},
+            {"start": "2024-01-02T00:00:00", "total": 1, "results": {"pass": 1}, "pass_rate": 1.0},
+            {"start": "2024-01-09T00:00:00", "total": 1, "results": {"pass": 1}, "pass_rate": 1.0}]})
+
+        # Longer buckets are merged from the stored ones, aligned on the epoch (a Thursday)
+        response = self.client.get('/execution_results/trend?test_case_id=1&bucket=7d'
+                                   '&time[gte]=2024-01-01T00:00:00&time[lte]=2024-01-31T00:00:00')
+        self.assertEqual([(bucket['start'], bucket['total']) for bucket in response.json['buckets']],
+                         [("2023-12-28T00:00:00", 2), ("2024-01-04T00:00:00", 1)])
+        response = self.client.get('/execution_results/trend?test_case_id=1&bucket=12h'
+                                   '&time[gte]=2024-01-01T00:00:00&time[lte]=2024-01-01T23:59:59')
+        self.assertEqual([bucket['results'] for bucket in response.json['buckets']], [{"pass": 1}, {"fail": 1}])
+        # Times with an offset are converted to UTC
+        response = self.client.get('/execution_results/trend?test_asset_id=1&bucket=1h'
+                                   '&time[gte]=2024-01-01T00:00:00Z&time[lte]=2024-01-01T16:00:00%2B03:00')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(bucket['start'], bucket['results']) for bucket in response.json['buckets']],
+                         [("2024-01-01T09:00:00", {"pass": 1})])
+
+        # Changes and rebuilds keep the trends in step with the results
+        with self.app.app_context():
+            db.session.get(ExecutionResult, 2).result = 'pass'
+            db.session.delete(db.session.get(ExecutionResult, 5))
+            db.session.commit()
+        for rebuild in (False, True):
+            if rebuild:
+                self.assertEqual(self.app.test_cli_runner().invoke(args=['rebuild-summaries']).exit_code, 0)
+            response = self.client.get('/execution_results/trend?test_asset_id=1&time[gte]=2024-01-01T00:00:00'
+                                       '&time[lte]=2024-01-31T00:00:00')
+            self.assertEqual([(bucket['start'], bucket['results']) for bucket in response.json['buckets']],
+                             [("2024-01-01T00:00:00", {"pass": 2}), ("2024-01-02T00:00:00", {"pass": 1})])
+
+        self.assertEqual(self.client.get('/execution_results/trend?test_asset_id=1&bucket=30m').status_code, 400)
+        self.assertEqual(self.client.get('/execution_results/trend?bucket=1d').status_code, 400)
+        self.assertEqual(self.client.get('/execution_results/trend?test_asset_id=1&bucket=1h'
+                                         '&time[gte]=2020-01-01T00:00:00').status_code, 400)
+
+    def test_flaky_execution_results(self):
+        token = self.get_token('test_user', 'password')
+        headers = {'Authorization': 'Bearer ' + token}
+        with self.app.app_context():
+            db.session.add_all([TestCase(name='Test Case 1', description=''),
+                                TestCase(name='Test Case 2', description='')])
+            db.session.commit()
+        # Pair (1, 1) flips on every run, (2, 1) once and (1, 2) never
+        items = [{"test_case_id": 1, "test_asset_id": 1, "result": result} for result in ('pass', 'fail') * 3]
+        items += [{"test_case_id": 2, "test_asset_id": 1, "result": result} for result in ('pass',) * 5 + ('fail',)]
+        self.client.post('/execution_results/batch', headers=headers, json=items[:8])
+        for item in items[8:] + [{"test_case_id": 1, "test_asset_id": 2, "result": 'pass'}] * 6:
+            self.client.post('/execution_results', headers=headers, json=item)
+
+        response = self.client.get('/execution_results/flaky')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(pair['test_case_id'], pair['test_asset_id'], pair['flip_count'], pair['run_count'],
+                           pair['last_result']) for pair in response.json],
+                         [(1, 1, 5, 6, 'fail'), (2, 1, 1, 6, 'fail')])
+        self.assertAlmostEqual(response.json[1]['flip_rate'], 0.1)
+        self.assertEqual(len(self.client.get('/execution_results/flaky?limit=1').json), 1)
+        self.assertEqual(self.client.get('/execution_results/flaky?min_runs=7').json, [])
+        response = self.client.get('/execution_results/flaky?test_asset_id=1&fields=test_case_id')
+        self.assertEqual(response.json, [{"test_case_id": 1}, {"test_case_id": 2}])
+
+        # Replaying the results gives the same states
+        expected = self.client.get('/execution_results/flaky').json
+        self.assertEqual(self.app.test_cli_runner().invoke(args=['rebuild-flakiness']).exit_code, 0)
+        self.assertEqual(self.client.get('/execution_results/flaky').json, expected)
+
+    def test_rebuild_summaries_command(self):
+        with self.app.app_context():
+            db.session.add(TestCase(name='Test Case', description=''))
+            db.session.flush()
+            db.session.execute(ExecutionResult.__table__.insert(),
+                               [{"test_case_id": 1, "test_asset_id": 1, "result": "pass"}] * 3)
+            db.session.commit()
+        result = self.app.test_cli_runner().invoke(args=['rebuild-summaries'])
+        self.assertEqual(result.exit_code, 0)
+        with self.app.app_context():
+            self.assertEqual(db.session.get(ExecutionResultSummary, (1, 1, 'pass')).count, 3)
+
 
 if __name__ == '__main__':
     unittest.main()
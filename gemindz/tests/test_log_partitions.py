@@ -0,0 +1,182 @@
+import os
+import tempfile
+import threading
+import unittest
+from datetime import datetime
+from unittest import mock
+from flask import Flask
+from sqlalchemy import insert
+from models import db, Log, LogRollup
+import log_archive
+from log_archive import LogArchive, _exclusive_lock, write_segment
+from log_partitions import list_partitions, maintain_logs
+from routes.logs import logs_bp
+
+
+class LogPartitionsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.register_blueprint(logs_bp)
+        db.init_app(self.app)
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        db.session.execute(insert(Log), [
+            {'endpoint_name': '/old', 'method': 'GET', 'status_code': 200, 'created_at': datetime(2024, 1, 1, 10, 5)},
+            {'endpoint_name': '/old', 'method': 'GET', 'status_code': 200, 'created_at': datetime(2024, 1, 1, 10, 40)},
+            {'endpoint_name': '/recent', 'method': 'GET', 'status_code': 404, 'created_at': datetime(2024, 1, 3, 9)},
+            {'endpoint_name': '/today', 'method': 'GET', 'status_code': 200, 'created_at': datetime(2024, 1, 4, 12)},
+        ])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        for _, _, table in list_partitions(db.session.connection()):
+            table.drop(db.engine)
+        db.drop_all()
+        self.app_context.pop()
+
+    def maintain(self, retention_days=30):
+        return maintain_logs(db.engine, {'LOG_PARTITION_DAYS': 1, 'LOG_PARTITION_GRACE': 0,
+                                         'LOG_RETENTION_DAYS': retention_days}, now=datetime(2024, 1, 4, 13))
+
+    def test_seal_moves_past_days_to_partitions(self):
+        self.assertEqual(self.maintain()['sealed'], ['log_p20240101_20240102', 'log_p20240103_20240104'])
+        self.assertEqual([log.endpoint_name for log in Log.query.all()], ['/today'])
+
+        # The head table and the partitions are read in time order
+        response = self.client.get('/logs/')
+        self.assertEqual([log['endpoint_name'] for log in response.json], ['/old', '/old', '/recent', '/today'])
+        response = self.client.get('/logs/?limit=2')
+        response = self.client.get(f"/logs/?limit=2&cursor={response.headers['X-Next-Cursor']}")
+        self.assertEqual([log['endpoint_name'] for log in response.json], ['/recent', '/today'])
+
+        response = self.client.get('/logs/?time[gte]=2024-01-03T00:00:00&time[lte]=2024-01-03T23:59:59')
+        self.assertEqual([log['endpoint_name'] for log in response.json], ['/recent'])
+        # Times with an offset are converted to the naive UTC times logs are stored with
+        response = self.client.get('/logs/?time[gte]=2024-01-03T00:00:00Z&time[lte]=2024-01-03T12:00:00%2B03:00')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([log['endpoint_name'] for log in response.json], ['/recent'])
+
+    def test_retention_downsamples_expired_partitions(self):
+        self.assertEqual(self.maintain(retention_days=2)['dropped'], ['log_p20240101_20240102'])
+        self.assertEqual([table.name for _, _, table in list_partitions(db.session.connection())],
+                         ['log_p20240103_20240104'])
+        rollup = LogRollup.query.one()
+        self.assertEqual((rollup.hour, rollup.endpoint_name, rollup.count), (datetime(2024, 1, 1, 10), '/old', 2))
+
+        response = self.client.get('/logs/rollups?endpoint_name=/old')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json[0]['count'], 2)
+
+
+class LogArchiveTestCase(LogPartitionsTestCase):
+    # Also runs the partition tests, with the archived partitions read from segments
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        super().setUp()
+        self.app.config.update(LOG_ARCHIVE_DIRECTORY=self.directory.name, LOG_ARCHIVE_AFTER_DAYS=1,
+                               LOG_ARCHIVE_BLOCK_ROWS=1)
+        self.archive = LogArchive(self.app)
+
+    def tearDown(self):
+        super().tearDown()
+        for segment in self.archive.segments():
+            segment.close()
+        self.directory.cleanup()
+
+    def maintain(self, retention_days=30):
+        return maintain_logs(db.engine, {'LOG_PARTITION_DAYS': 1, 'LOG_PARTITION_GRACE': 0,
+                                         'LOG_RETENTION_DAYS': retention_days}, now=datetime(2024, 1, 4, 13),
+                             archive=self.archive)
+
+    def archived_files(self):
+        # Without the lock file
+        return sorted(name for name in os.listdir(self.directory.name) if name.startswith('log_'))
+
+    def test_archives_old_partitions(self):
+        self.assertEqual(self.maintain()['archived'], ['log_p20240101_20240102'])
+        self.assertEqual([table.name for _, _, table in list_partitions(db.session.connection())],
+                         ['log_p20240103_20240104'])
+        self.assertEqual(self.archived_files(),
+                         ['log_p20240101_20240102.idx', 'log_p20240101_20240102.seg'])
+
+        response = self.client.get('/logs/?fields=endpoint_name,created_at')
+        self.assertEqual(response.json[:2], [{'endpoint_name': '/old', 'created_at': '2024-01-01T10:05:00'},
+                                             {'endpoint_name': '/old', 'created_at': '2024-01-01T10:40:00'}])
+        response = self.client.get('/logs/?limit=1')
+        response = self.client.get(f"/logs/?limit=2&cursor={response.headers['X-Next-Cursor']}")
+        self.assertEqual([log['endpoint_name'] for log in response.json], ['/old', '/recent'])
+        response = self.client.get('/logs/', headers={'Accept': 'application/x-ndjson'})
+        self.assertEqual(len(response.get_data(as_text=True).splitlines()), 4)
+
+        # Only the blocks of the requested range are decompressed
+        segment, = self.archive.segments()
+        self.assertEqual(len(list(segment.blocks(time_gte=datetime(2024, 1, 1, 10, 30)))), 1)
+        response = self.client.get('/logs/?time[gte]=2024-01-01T10:30:00&time[lte]=2024-01-01T11:00:00')
+        self.assertEqual([log['created_at'] for log in response.json], ['2024-01-01T10:40:00'])
+        self.assertEqual(self.client.get('/logs/?endpoint_name=/old&status_code=404').json, [])
+
+        # Expired segments are downsampled like partitions
+        self.assertEqual(self.maintain(retention_days=2)['dropped'], ['log_p20240101_20240102'])
+        self.assertEqual(self.archived_files(), [])
+        self.assertEqual(self.client.get('/logs/rollups?endpoint_name=/old').json[0]['count'], 2)
+
+    def test_drop_expired_is_safe_for_readers_and_interruptions(self):
+        self.maintain()
+        segment, = self.archive.segments()
+        reader = segment.read({}, ('endpoint_name',))
+        self.assertEqual([row.endpoint_name for row in next(reader)], ['/old'])
+
+        # Interrupted before the counts are committed
+        with mock.patch.object(db.engine, 'begin', side_effect=OSError('interrupted')):
+            with self.assertRaises(OSError):
+                self.archive.drop_expired(db.engine, 2, datetime(2024, 1, 4, 13))
+        self.assertEqual(self.archived_files(), ['log_p20240101_20240102.seg'])
+        self.assertEqual(self.archive.segments(), [])
+        # Readers of the deleted segment are not cut off
+        self.assertEqual([row.endpoint_name for row in next(reader)], ['/old'])
+
+        # The next run removes the leftover data without counting it again
+        self.assertEqual(self.archive.drop_expired(db.engine, 2, datetime(2024, 1, 4, 13)), [])
+        self.assertEqual(self.archived_files(), [])
+        self.assertEqual(db.session.query(LogRollup).count(), 0)
+
+    def test_archiving_waits_for_other_workers(self):
+        maintain_logs(db.engine, {'LOG_PARTITION_DAYS': 1, 'LOG_PARTITION_GRACE': 0, 'LOG_RETENTION_DAYS': 30},
+                      now=datetime(2024, 1, 4, 13))
+        os.makedirs(self.directory.name, exist_ok=True)
+        listed = threading.Event()
+        list_partitions_ = log_archive.list_partitions
+
+        def list_and_signal(connection):
+            listed.set()
+            return list_partitions_(connection)
+
+        results = []
+        with mock.patch.object(log_archive, 'list_partitions', side_effect=list_and_signal):
+            with _exclusive_lock(self.directory.name):
+                engine = db.engine
+                worker = threading.Thread(target=lambda: results.append(
+                    self.archive.archive_partitions(engine, datetime(2024, 1, 4, 13))))
+                worker.start()
+                self.assertTrue(listed.wait(5))
+                # Another worker archives the partition meanwhile
+                table, = [table for _, _, table in list_partitions_(db.session.connection())
+                          if table.name == 'log_p20240101_20240102']
+                db.session.rollback()
+                with engine.connect() as connection:
+                    write_segment(connection, table, self.directory.name)
+                with engine.begin() as connection:
+                    table.drop(connection)
+            worker.join(5)
+        self.assertEqual(results, [[]])
+        self.assertEqual(self.archived_files(), ['log_p20240101_20240102.idx', 'log_p20240101_20240102.seg'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import threading
+import time
+import unittest
+from flask import Flask
+from models import db, Log
+from log_writer import LogWriter
+
+
+class LogWriterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        db.init_app(self.app)
+        with self.app.app_context():
+            db.create_all()
+
+    def tearDown(self):
+        self.writer.stop()
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_flush_writes_queued_rows(self):
+        self.writer = LogWriter(self.app)
+        for _ in range(3):
+            self.assertTrue(self.writer.log_request(endpoint='/test', method='GET', status_code=200))
+        self.assertTrue(self.writer.flush(timeout=5))
+        with self.app.app_context():
+            self.assertEqual(Log.query.filter_by(endpoint_name='/test').count(), 3)
+        self.assertEqual(self.writer.stats()['flushed'], 3)
+
+    def test_batch_size_triggers_write(self):
+        self.app.config['LOG_BATCH_SIZE'] = 2
+        self.app.config['LOG_FLUSH_INTERVAL'] = 60
+        self.writer = LogWriter(self.app)
+        self.writer.log_request(endpoint='/test', method='GET', status_code=200)
+        self.writer.log_request(endpoint='/test', method='GET', status_code=200)
+        # Written well before the flush interval, and without stop() flushing the queue
+        deadline = time.monotonic() + 5
+        while self.writer.stats()['flushed'] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.writer.stats()['flushed'], 2)
+
+    def test_stop_does_not_hang_on_a_full_queue(self):
+        self.app.config.update(LOG_QUEUE_MAXSIZE=1, LOG_BATCH_SIZE=1, LOG_SHUTDOWN_TIMEOUT=0.2)
+        self.writer = LogWriter(self.app)
+        release = threading.Event()
+        write = self.writer._write
+        # The writer thread hangs on its first row, and the second one fills the queue
+        self.writer._write = lambda batch: release.wait() or write(batch)
+        self.writer.log_request(endpoint='/test', method='GET', status_code=200)
+        deadline = time.monotonic() + 5
+        while self.writer.stats()['queue_depth'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(self.writer.log_request(endpoint='/test', method='GET', status_code=200))
+
+        started = time.monotonic()
+        self.writer.stop()
+        self.assertLess(time.monotonic() - started, 2)
+        release.set()
+
+    def test_stopped_writer_drops_rows(self):
+        self.writer = LogWriter(self.app)
+        self.writer.stop()
+        self.assertFalse(self.writer.log_request(endpoint='/test', method='GET', status_code=200))
+        self.assertEqual(self.writer.stats()['dropped'], 1)
+
+    def test_invalid_overflow_policy(self):
+        self.app.config['LOG_OVERFLOW_POLICY'] = 'invalid'
+        self.writer = LogWriter()
+        with self.assertRaises(ValueError):
+            self.writer.init_app(self.app)
+
+
+if __name__ == '__main__':
+    unittest.main()
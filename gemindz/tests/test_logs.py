@@ -1,6 +1,10 @@
+import json
 import unittest
+from datetime import datetime
 from flask import Flask
-from models import db, Log
+from models import db
+from latency import percentile, record_latencies
+from log_writer import LogWriter
 from routes.logs import logs_bp
 
 
@@ -20,15 +24,22 @@ class LogsRouteTestCase(unittest.TestCase):
         # Create all tables in the database
         with self.app_context:
             db.create_all()
+        self.writer = LogWriter(self.app)
 
     def tearDown(self):
+        self.writer.stop()
         # Remove application context
         self.app_context.pop()
 
+    def log_request(self, **kwargs):
+        # Written by the log writer, as the requests of the application are
+        self.writer.log_request(**kwargs)
+        self.assertTrue(self.writer.flush(timeout=5))
+
     def test_get_logs_filter_endpoint_name(self):
         # Create a log entry
         with self.app_context:
-            Log.log_request(endpoint='/test', method='GET', status_code=500, error=None)
+            self.log_request(endpoint='/test', method='GET', status_code=500, error=None)
         response = self.client.get('/logs?endpoint_name=/test', follow_redirects=True)
         self.assertEqual(response.status_code, 200)
         data = response.json
@@ -37,12 +48,79 @@ class LogsRouteTestCase(unittest.TestCase):
     def test_get_logs_filter_status_code(self):
         # Create a log entry
         with self.app_context:
-            Log.log_request(endpoint='/test', method='GET', status_code=500, error=None)
+            self.log_request(endpoint='/test', method='GET', status_code=500, error=None)
         response = self.client.get('/logs?status_code=500', follow_redirects=True)
         self.assertEqual(response.status_code, 200)
         data = response.json
         self.assertEqual(len(data), 1)  # There should be one log with status_code = 500
 
+    def test_get_logs_keyset_pagination(self):
+        with self.app_context:
+            for status_code in (200, 201, 404):
+                self.log_request(endpoint='/test', method='GET', status_code=status_code, error=None)
+        response = self.client.get('/logs/?limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([log['status_code'] for log in response.json], [200, 201])
+        cursor = response.headers['X-Next-Cursor']
+
+        response = self.client.get(f'/logs/?limit=2&cursor={cursor}')
+        self.assertEqual([log['status_code'] for log in response.json], [404])
+        self.assertNotIn('X-Next-Cursor', response.headers)
+
+    def test_get_logs_invalid_cursor(self):
+        response = self.client.get('/logs/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_logs_ndjson_stream(self):
+        with self.app_context:
+            for _ in range(3):
+                self.log_request(endpoint='/test', method='GET', status_code=200, error=None)
+        response = self.client.get('/logs/', headers={'Accept': 'application/x-ndjson'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[0]['endpoint_name'], '/test')
+
+    def test_get_logs_fields_projection(self):
+        with self.app_context:
+            for status_code in (200, 404):
+                self.log_request(endpoint='/test', method='GET', status_code=status_code, error=None)
+        response = self.client.get('/logs/?fields=status_code,created_at&limit=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.json[0]), ['status_code', 'created_at'])
+        # Datetimes are ISO 8601 and the cursor still works without the id field
+        datetime.fromisoformat(response.json[0]['created_at'])
+        response = self.client.get(f"/logs/?fields=status_code&cursor={response.headers['X-Next-Cursor']}")
+        self.assertEqual(response.json, [{'status_code': 404}])
+
+        response = self.client.get('/logs/?fields=status_code,secret')
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_latency(self):
+        with self.app_context:
+            record_latencies(db.session.connection(), [('/test', datetime(2024, 1, 1, 10, 5), 3),
+                                                       ('/test', datetime(2024, 1, 1, 11, 5), 4),
+                                                       ('/test', datetime(2024, 1, 1, 11, 30), 700)])
+            db.session.commit()
+        response = self.client.get('/logs/latency?time[gte]=2024-01-01T10:30:00')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json), 1)
+        latency = response.json[0]
+        self.assertEqual(latency['endpoint_name'], '/test')
+        self.assertEqual(latency['count'], 3)
+        self.assertTrue(2 <= latency['p50'] <= 5)
+        self.assertTrue(500 <= latency['p99'] <= 1000)
+
+        response = self.client.get('/logs/latency?time[gte]=2024-01-01T11:00:00')
+        self.assertEqual(response.json[0]['count'], 2)
+
+    def test_percentile(self):
+        self.assertIsNone(percentile([0] * 14, 0.5))
+        counts = [0] * 14
+        counts[2] = 10  # Ten samples between 2 and 5 ms
+        self.assertEqual(percentile(counts, 0.5), 3.5)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,86 @@
+import os
+import threading
+import unittest
+from unittest import mock
+from flask import Flask
+from app import create_app
+from metrics_registry import MetricsRegistry, registry, requests_total
+from models import db, Log
+from routes.metrics import metrics_bp
+
+
+class MetricsRegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter_shards_are_merged(self):
+        counter = self.registry.counter('requests_total', 'Requests.', ('endpoint',))
+
+        def work():
+            for _ in range(100):
+                counter.inc(endpoint='home')
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.inc(endpoint='logs')
+
+        values = self.registry.collect()
+        self.assertEqual(values[('requests_total', ('home',))], 400)
+        self.assertEqual(values[('requests_total', ('logs',))], 1)
+        # Shards of finished threads were folded into the retired shard
+        self.assertEqual(self.registry.collect(), values)
+
+    def test_histogram_render(self):
+        histogram = self.registry.histogram('duration_seconds', 'Duration.', ('endpoint',), (0.1, 1))
+        histogram.observe(0.05, endpoint='home')
+        histogram.observe(0.5, endpoint='home')
+        histogram.observe(5, endpoint='home')
+        text = self.registry.render()
+        self.assertIn('# TYPE duration_seconds histogram', text)
+        self.assertIn('duration_seconds_bucket{endpoint="home",le="0.1"} 1', text)
+        self.assertIn('duration_seconds_bucket{endpoint="home",le="1"} 2', text)
+        self.assertIn('duration_seconds_bucket{endpoint="home",le="+Inf"} 3', text)
+        self.assertIn('duration_seconds_count{endpoint="home"} 3', text)
+
+    def test_gauge_callback(self):
+        self.registry.gauge_callback('queue_depth', 'Queue depth.', lambda: 7)
+        self.assertIn('queue_depth 7', self.registry.render())
+
+
+class MetricsRouteTestCase(unittest.TestCase):
+    def test_metrics_endpoint(self):
+        app = Flask(__name__)
+        app.register_blueprint(metrics_bp)
+        response = app.test_client().get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/plain')
+        self.assertIn('# TYPE gemindz_http_requests_total counter', response.get_data(as_text=True))
+
+    def test_request_answered_by_an_earlier_hook_is_recorded(self):
+        environ = {'GEMINDZ_SQLALCHEMY_DATABASE_URI': '"sqlite:///:memory:"', 'GEMINDZ_PASSWORD_HASH_WORKERS': '0',
+                   'GEMINDZ_LOG_MAINTENANCE_INTERVAL': 'null'}
+        with mock.patch.dict(os.environ, environ):
+            app = create_app()
+        # Answers before the hook that starts the request clock
+        app.before_request_funcs.setdefault(None, []).insert(0, lambda: ('busy', 503))
+        log_writer = app.extensions['log_writer']
+        labels = {'blueprint': 'home', 'endpoint': 'home.home', 'method': 'GET', 'status_class': '5xx'}
+        key = (requests_total.name, tuple(labels[label] for label in requests_total.labelnames))
+        before = registry.collect().get(key, 0)
+        try:
+            self.assertEqual(app.test_client().get('/').status_code, 503)
+            self.assertTrue(log_writer.flush(timeout=5))
+            with app.app_context():
+                log = db.session.query(Log).filter_by(endpoint_name='/').one()
+            self.assertEqual(log.status_code, 503)
+            self.assertIsNone(log.duration_ms)
+            self.assertEqual(registry.collect().get(key), before + 1)
+        finally:
+            log_writer.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
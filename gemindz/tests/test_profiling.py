@@ -0,0 +1,82 @@
+import tempfile
+import unittest
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+from models import db, User
+from profiling import RequestProfiler
+from routes.profiles import profiles_bp
+from routes.test_cases import test_cases_bp
+from security import identity_cache
+
+
+class RequestProfilerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['JWT_SECRET_KEY'] = 'test-secret-key-with-enough-length-for-hs256'
+        self.app.config.update(PROFILING_ENABLED=True, PROFILING_DIRECTORY=self.directory.name,
+                               PROFILING_MAX_FILES=2)
+        JWTManager(self.app)
+        db.init_app(self.app)
+        RequestProfiler(self.app)
+        self.app.register_blueprint(profiles_bp)
+        self.app.register_blueprint(test_cases_bp)
+        self.client = self.app.test_client()
+        identity_cache.clear()
+        with self.app.app_context():
+            db.create_all()
+            # Admin checks read the role of the user from the database
+            db.session.add_all([User(username='admin', password='password', role='admin'),
+                                User(username='user', password='password', role='user')])
+            db.session.commit()
+            self.admin_headers = {'Authorization': 'Bearer ' + create_access_token(
+                identity='admin', additional_claims={'role': 'admin'})}
+            self.user_headers = {'Authorization': 'Bearer ' + create_access_token(
+                identity='user', additional_claims={'role': 'user'})}
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+        self.directory.cleanup()
+
+    def test_admin_header_profiles_request(self):
+        response = self.client.get('/testcases/', headers={**self.admin_headers, 'X-Profile': '1',
+                                                           'X-Request-ID': 'abc-123'})
+        self.assertEqual(response.status_code, 200)
+        profile_id = response.headers['X-Profile-Id']
+        self.assertTrue(profile_id.endswith('--test_cases.get_all_test_cases--abc-123'))
+
+        profiles = self.client.get('/profiles/', headers=self.admin_headers).json
+        self.assertEqual([profile['id'] for profile in profiles], [profile_id])
+        self.assertEqual(profiles[0]['request_id'], 'abc-123')
+
+        response = self.client.get(f'/profiles/{profile_id}?format=text', headers=self.admin_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('function calls', response.get_data(as_text=True))
+        response = self.client.get(f'/profiles/{profile_id}', headers=self.admin_headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/octet-stream')
+
+    def test_header_ignored_for_non_admins(self):
+        response = self.client.get('/testcases/', headers={**self.user_headers, 'X-Profile': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Profile-Id', response.headers)
+        self.assertEqual(self.client.get('/profiles/', headers=self.user_headers).status_code, 401)
+
+    def test_ring_keeps_most_recent_profiles(self):
+        profile_ids = [self.client.get('/testcases/', headers={**self.admin_headers, 'X-Profile': '1'})
+                       .headers['X-Profile-Id'] for _ in range(3)]
+        profiles = self.client.get('/profiles/', headers=self.admin_headers).json
+        self.assertEqual([profile['id'] for profile in profiles], profile_ids[:0:-1])
+
+    def test_unknown_profile(self):
+        for profile_id in ('missing', '..%2F..%2Fetc%2Fpasswd'):
+            response = self.client.get(f'/profiles/{profile_id}', headers=self.admin_headers)
+            self.assertEqual(response.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+from datetime import datetime
+from flask import Flask
+from sqlalchemy import select
+from models import db, ExecutionResult, ExecutionResultSummary, Log, TestCase, User
+from routes.execution_results import filtered_execution_results_query
+from log_partitions import partition_table
+from routes.logs import filtered_logs_query, page_logs_query, parse_log_filters
+
+
+class QueryPlanTestCase(unittest.TestCase):
+    """
+    Run EXPLAIN QUERY PLAN for the queries issued by the routes and fail if
+    any of them has to scan a whole table or sort its result in a temp b-tree.
+    """
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        db.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def explain(self, statement):
+        compiled = statement.compile(dialect=db.engine.dialect, compile_kwargs={'render_postcompile': True})
+        params = tuple(self._driver_value(compiled.params[name]) for name in compiled.positiontup)
+        with db.engine.connect() as connection:
+            rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + compiled.string, params)
+            return [row[3] for row in rows]
+
+    @staticmethod
+    def _driver_value(value):
+        return value.isoformat(' ') if isinstance(value, datetime) else value
+
+    def assertIndexed(self, statement):
+        plan = self.explain(statement)
+        for step in plan:
+            self.assertFalse(step.startswith('SCAN'), f"Full scan in query plan: {plan}")
+            self.assertNotIn('TEMP B-TREE', step, f"Sort in query plan: {plan}")
+
+    def logs_query(self, query_params, cursor=None, table=Log.__table__):
+        query = filtered_logs_query(parse_log_filters(query_params), table)
+        return page_logs_query(query, table, cursor).limit(101)
+
+    def test_get_logs_by_endpoint_name(self):
+        self.assertIndexed(self.logs_query({'endpoint_name': '/test'}))
+
+    def test_get_logs_by_status_code(self):
+        self.assertIndexed(self.logs_query({'status_code': '500'}))
+
+    def test_get_logs_by_time_range(self):
+        self.assertIndexed(self.logs_query({'time[gte]': '2024-01-01T00:00:00',
+                                            'time[lte]': '2024-01-02T00:00:00'}))
+
+    def test_get_logs_by_endpoint_name_and_time_range(self):
+        self.assertIndexed(self.logs_query({'endpoint_name': '/test', 'time[gte]': '2024-01-01T00:00:00'}))
+
+    def test_get_logs_by_status_code_and_time_range(self):
+        self.assertIndexed(self.logs_query({'status_code': '500', 'time[lte]': '2024-01-01T00:00:00'}))
+
+    def test_get_logs_next_page(self):
+        self.assertIndexed(self.logs_query({}, cursor=(datetime(2024, 1, 1), 10)))
+        self.assertIndexed(self.logs_query({'endpoint_name': '/test'}, cursor=(datetime(2024, 1, 1), 10)))
+
+    def test_get_logs_from_partition(self):
+        table = partition_table(datetime(2024, 1, 1), datetime(2024, 1, 2))
+        table.create(db.engine)
+        self.assertIndexed(self.logs_query({'endpoint_name': '/test'}, table=table))
+        self.assertIndexed(self.logs_query({'status_code': '500'}, cursor=(datetime(2024, 1, 1), 10), table=table))
+
+    def execution_results_query(self, query_params):
+        return filtered_execution_results_query(1, query_params) \
+            .where(ExecutionResult.id > 10).order_by(ExecutionResult.id).limit(101)
+
+    def test_get_execution_results_for_test_asset(self):
+        self.assertIndexed(self.execution_results_query({}))
+        self.assertIndexed(self.execution_results_query({'time[gte]': '2024-01-01T00:00:00'}))
+
+    def test_get_execution_results_by_test_case_and_result(self):
+        self.assertIndexed(self.execution_results_query({'test_case_id': '1'}))
+        self.assertIndexed(self.execution_results_query({'result': 'pass'}))
+        self.assertIndexed(self.execution_results_query({'test_case_id': '1', 'result': 'pass'}))
+
+    def test_get_execution_results_summary(self):
+        self.assertIndexed(select(ExecutionResultSummary).where(ExecutionResultSummary.test_asset_id == 1))
+
+    def test_test_case_cascade_loads_execution_results(self):
+        self.assertIndexed(select(ExecutionResult).where(ExecutionResult.test_case_id == 1))
+
+    def test_get_single_test_case(self):
+        self.assertIndexed(select(TestCase).where(TestCase.id == 1))
+
+    def test_login_user_lookup(self):
+        self.assertIndexed(select(User).where(User.username == 'test_user'))
+
+
+if __name__ == '__main__':
+    unittest.main()
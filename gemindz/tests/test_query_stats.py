@@ -0,0 +1,55 @@
+import unittest
+from flask import Flask, jsonify
+from models import db, TestCase
+from query_stats import QueryInstrumentation, normalize_sql
+
+
+class QueryStatsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config.update(QUERY_STATS_HEADERS=True, QUERY_REPEAT_THRESHOLD=2)
+        db.init_app(self.app)
+        QueryInstrumentation(self.app)
+
+        @self.app.route('/n_plus_one')
+        def n_plus_one():
+            # One statement per test case, as a lazy loading loop would run
+            names = [db.session.get(TestCase, test_case_id) for test_case_id in (1, 2, 3)]
+            return jsonify([name is not None for name in names])
+
+        self.client = self.app.test_client()
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_normalize_sql(self):
+        self.assertEqual(normalize_sql("SELECT name FROM test_case\n WHERE id IN (1, 2,3) AND name = 'it''s'"),
+                         "SELECT name FROM test_case WHERE id IN (?) AND name = ?")
+        self.assertEqual(normalize_sql("SELECT * FROM log_p20240101_20240102 WHERE id IN (?, ?)"),
+                         "SELECT * FROM log_p20240101_20240102 WHERE id IN (?)")
+
+    def test_headers_and_repeated_statements(self):
+        with self.assertLogs('gemindz.repeated_queries', level='WARNING') as logs:
+            response = self.client.get('/n_plus_one')
+        self.assertEqual(response.headers['X-Query-Count'], '3')
+        self.assertGreater(float(response.headers['X-Query-Time-Ms']), 0)
+        self.assertEqual(response.headers['X-Query-Repeated'], '3')
+        self.assertIn('ran the same statement 3 times: SELECT', logs.output[0])
+
+    def test_slow_query_log(self):
+        self.app.config['QUERY_SLOW_THRESHOLD_MS'] = 0
+        with self.assertLogs('gemindz.slow_queries', level='WARNING') as logs:
+            self.client.get('/n_plus_one')
+        self.assertEqual(len(logs.output), 3)
+        self.assertIn('GET /n_plus_one: SELECT test_case.', logs.output[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
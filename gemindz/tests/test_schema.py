@@ -0,0 +1,114 @@
+import os
+import unittest
+from unittest import mock
+from flask import Flask
+from sqlalchemy import inspect, text
+from app import create_app
+from models import db
+from schema import ensure_schema, has_autoincrement, schema_fingerprint, stored_fingerprint
+
+
+class SchemaVersionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        db.init_app(self.app)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_migrates_once(self):
+        self.assertTrue(ensure_schema(db.engine, db.metadata))
+        with db.engine.connect() as connection:
+            self.assertEqual(stored_fingerprint(connection), schema_fingerprint(db.metadata, db.engine.dialect))
+        self.assertFalse(ensure_schema(db.engine, db.metadata))
+
+    def test_adds_missing_columns_and_indexes(self):
+        with db.engine.begin() as connection:
+            connection.execute(text("CREATE TABLE test_case (id INTEGER PRIMARY KEY, created_at DATETIME, "
+                                    "name VARCHAR(100) NOT NULL, description TEXT)"))
+            connection.execute(text("INSERT INTO test_case (name) VALUES ('existing')"))
+            connection.execute(text("CREATE TABLE log (id INTEGER PRIMARY KEY, created_at DATETIME, "
+                                    "endpoint_name VARCHAR(100) NOT NULL, method VARCHAR(10) NOT NULL, "
+                                    "status_code INTEGER NOT NULL, error TEXT)"))
+
+        self.assertTrue(ensure_schema(db.engine, db.metadata))
+
+        inspector = inspect(db.engine)
+        self.assertIn('duration_ms', [column['name'] for column in inspector.get_columns('log')])
+        self.assertIn('ix_log_endpoint_name_created_at', [index['name'] for index in inspector.get_indexes('log')])
+        self.assertIn('user', inspector.get_table_names())
+        with db.engine.connect() as connection:
+            self.assertEqual(connection.execute(text("SELECT version FROM test_case")).scalar(), 1)
+            # The search index is added and covers the existing rows
+            self.assertEqual(connection.execute(
+                text("SELECT rowid FROM test_case_fts WHERE test_case_fts MATCH 'existing'")).scalar(), 1)
+
+    def test_rebuilds_log_table_with_autoincrement(self):
+        with db.engine.begin() as connection:
+            connection.execute(text("CREATE TABLE log (id INTEGER PRIMARY KEY, created_at DATETIME, "
+                                    "endpoint_name VARCHAR(100) NOT NULL, method VARCHAR(10) NOT NULL, "
+                                    "status_code INTEGER NOT NULL, error TEXT)"))
+            connection.execute(text("CREATE INDEX ix_log_created_at ON log (created_at)"))
+            connection.execute(text("INSERT INTO log (id, endpoint_name, method, status_code) "
+                                    "VALUES (3, '/head', 'GET', 200)"))
+            connection.execute(text("CREATE TABLE log_p20240101_20240102 (id INTEGER PRIMARY KEY, "
+                                    "created_at DATETIME, endpoint_name VARCHAR(100) NOT NULL, "
+                                    "method VARCHAR(10) NOT NULL, status_code INTEGER NOT NULL, error TEXT)"))
+            connection.execute(text("INSERT INTO log_p20240101_20240102 (id, endpoint_name, method, status_code) "
+                                    "VALUES (7, '/old', 'GET', 200)"))
+
+        self.assertTrue(ensure_schema(db.engine, db.metadata))
+
+        with db.engine.begin() as connection:
+            self.assertTrue(has_autoincrement(connection, 'log'))
+            self.assertEqual(connection.execute(text("SELECT id, endpoint_name FROM log")).all(), [(3, '/head')])
+            connection.execute(text("DELETE FROM log"))
+            # Ids of rows moved to partitions are not reused
+            connection.execute(text("INSERT INTO log (endpoint_name, method, status_code) VALUES ('/new', 'GET', 200)"))
+            self.assertEqual(connection.execute(text("SELECT id FROM log")).scalar(), 8)
+        indexes = [index['name'] for index in inspect(db.engine).get_indexes('log')]
+        self.assertIn('ix_log_created_at', indexes)
+        self.assertIn('ix_log_status_code_created_at', indexes)
+        db.session.execute(text("DROP TABLE log_p20240101_20240102"))
+
+    def test_adds_missing_columns_to_log_partitions(self):
+        with db.engine.begin() as connection:
+            connection.execute(text("CREATE TABLE log_p20240101_20240102 (id INTEGER PRIMARY KEY, "
+                                    "created_at DATETIME, endpoint_name VARCHAR(100) NOT NULL, "
+                                    "method VARCHAR(10) NOT NULL, status_code INTEGER NOT NULL, error TEXT)"))
+
+        self.assertTrue(ensure_schema(db.engine, db.metadata))
+
+        columns = [column['name'] for column in inspect(db.engine).get_columns('log_p20240101_20240102')]
+        self.assertIn('query_count', columns)
+        self.assertIn('duration_ms', columns)
+        db.session.execute(text("DROP TABLE log_p20240101_20240102"))
+
+
+class AppFactoryTestCase(unittest.TestCase):
+    def test_config_from_environment(self):
+        environ = {'GEMINDZ_CONFIG': 'production', 'GEMINDZ_SQLALCHEMY_DATABASE_URI': '"sqlite:///:memory:"',
+                   'GEMINDZ_SQLALCHEMY_ENGINE_OPTIONS': '{}', 'GEMINDZ_LOG_MAINTENANCE_INTERVAL': 'null',
+                   'GEMINDZ_PASSWORD_HASH_WORKERS': '0'}
+        with mock.patch.dict(os.environ, environ):
+            app = create_app()
+        try:
+            self.assertFalse(app.config['DEBUG'])
+            self.assertIsNone(app.config['LOG_MAINTENANCE_INTERVAL'])
+            self.assertEqual(app.test_client().get('/').status_code, 200)
+        finally:
+            app.extensions['log_writer'].stop()
+
+    def test_unknown_config_name(self):
+        with self.assertRaises(ValueError):
+            create_app('staging')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+from flask import Flask, jsonify
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required
+from models import db, User
+from security import admin_required, identity_cache
+
+
+class AdminRequiredTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['JWT_SECRET_KEY'] = '34kt0OC79E9_vAgP7NkeRgqhiChiVCVT0MpDlzM_JI0'
+        db.init_app(self.app)
+        JWTManager(self.app)
+
+        @self.app.route('/admin')
+        @jwt_required()
+        @admin_required("Admins only")
+        def admin_view():
+            return jsonify({"message": "ok"})
+
+        self.client = self.app.test_client()
+        identity_cache.clear()
+        with self.app.app_context():
+            db.create_all()
+            db.session.add(User(username='test_user', password='password', role='user'))
+            db.session.commit()
+
+    def tearDown(self):
+        identity_cache.clear()
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def get(self, **token_kwargs):
+        with self.app.app_context():
+            token = create_access_token(identity='test_user', **token_kwargs)
+        return self.client.get('/admin', headers={'Authorization': 'Bearer ' + token})
+
+    def test_role_claim_is_checked_against_database(self):
+        self.assertEqual(self.get(additional_claims={'role': 'admin'}).status_code, 401)
+        with self.app.app_context():
+            User.query.filter_by(username='test_user').first().role = 'admin'
+            db.session.commit()
+        self.assertEqual(self.get(additional_claims={'role': 'admin'}).status_code, 200)
+
+        # Demoted or deleted admins lose access before their token expires
+        with self.app.app_context():
+            token = create_access_token(identity='test_user', additional_claims={'role': 'admin'})
+            User.query.filter_by(username='test_user').first().role = 'user'
+            db.session.commit()
+        headers = {'Authorization': 'Bearer ' + token}
+        self.assertEqual(self.client.get('/admin', headers=headers).status_code, 401)
+        with self.app.app_context():
+            db.session.delete(User.query.filter_by(username='test_user').first())
+            db.session.commit()
+        self.assertEqual(self.client.get('/admin', headers=headers).status_code, 401)
+
+    def test_token_without_claim_uses_cached_role(self):
+        self.assertEqual(self.get().status_code, 401)
+        self.assertEqual(identity_cache.get('test_user'), 'user')
+
+    def test_user_change_invalidates_cached_role(self):
+        self.assertEqual(self.get().status_code, 401)
+        with self.app.app_context():
+            user = User.query.filter_by(username='test_user').first()
+            user.role = 'admin'
+            db.session.commit()
+        self.assertEqual(self.get().status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,223 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+from flask import Flask
+from flask_jwt_extended import JWTManager
+from sqlalchemy import event, func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from commands import register_commands
+from models import db, User, ExecutionResult, ExecutionResultSummary, FlakinessState, TestCase
+from routes.auth import auth_bp
+from routes.execution_results import execution_results_bp
+from routes.test_cases import test_cases_bp
+from shards import ShardRouter, create_shard_engine, rebalance, shard_index
+
+# Test assets 7, 2 and 1 land in shards 0, 1 and 2 of three
+TEST_ASSET_IDS = (7, 2, 1)
+
+
+class ShardRouterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = Flask(__name__)
+        self.app.config['TESTING'] = True
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+        self.app.config['JWT_SECRET_KEY'] = '34kt0OC79E9_vAgP7NkeRgqhiChiVCVT0MpDlzM_JI0'
+        self.app.config['EXECUTION_RESULT_SHARDS'] = [self.shard_uri(index) for index in range(3)]
+
+        db.init_app(self.app)
+        JWTManager(self.app)
+        self.router = ShardRouter(self.app)
+
+        self.app.register_blueprint(execution_results_bp)
+        self.app.register_blueprint(auth_bp)
+        self.app.register_blueprint(test_cases_bp)
+        register_commands(self.app)
+
+        self.client = self.app.test_client()
+
+        with self.app.app_context():
+            db.create_all()
+            db.session.add(User(username='test_user', password='password', role="admin"))
+            db.session.add_all([TestCase(name='Test Case 1', description=''),
+                                TestCase(name='Test Case 2', description='')])
+            db.session.commit()
+        response = self.client.post('/auth/login', json={'username': 'test_user', 'password': 'password'})
+        self.headers = {'Authorization': 'Bearer ' + response.json['access_token']}
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+        for engine in self.router.engines:
+            engine.dispose()
+        self.directory.cleanup()
+
+    def shard_uri(self, name):
+        return f"sqlite:///{os.path.join(self.directory.name, f'shard{name}.db')}"
+
+    def shard_counts(self, engines=None, table=ExecutionResult.__table__):
+        """
+        Returns:
+            list: {test_asset_id: row count} of every shard.
+        """
+        counts = []
+        for engine in engines or self.router.engines:
+            with engine.connect() as connection:
+                counts.append(dict(connection.execute(
+                    select(table.c.test_asset_id, func.count()).group_by(table.c.test_asset_id)).all()))
+        return counts
+
+    def record(self):
+        # Pair (1, asset) flips on every run of assets 7 and 1, (2, asset) never
+        items = [{"test_case_id": test_case_id, "test_asset_id": test_asset_id,
+                  "result": result if test_case_id == 1 and test_asset_id != 2 else 'pass'}
+                 for test_asset_id in TEST_ASSET_IDS for test_case_id in (1, 2) for result in ('pass', 'fail') * 3]
+        response = self.client.post('/execution_results/batch', headers=self.headers, json=items)
+        self.assertEqual(response.status_code, 201)
+        return response
+
+    def test_routes_results_to_the_shard_of_their_test_asset(self):
+        self.assertEqual([shard_index(test_asset_id, 3) for test_asset_id in TEST_ASSET_IDS], [0, 1, 2])
+        response = self.record()
+        # Ids are assigned by each shard
+        self.assertEqual([item['id'] for item in response.json['results']][:13], list(range(1, 13)) + [1])
+        response = self.client.post('/execution_results', headers=self.headers,
+                                    json={"test_case_id": 1, "test_asset_id": 2, "result": "pass"})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json['execution_result']['id'], 13)
+
+        self.assertEqual(self.shard_counts(), [{7: 12}, {2: 13}, {1: 12}])
+        self.assertEqual(self.shard_counts(table=FlakinessState.__table__), [{7: 2}, {2: 2}, {1: 2}])
+        with self.app.app_context():
+            self.assertEqual(ExecutionResult.query.count(), 0)
+
+        response = self.client.get('/execution_results/2?test_case_id=1&limit=5')
+        self.assertEqual([result['test_asset_id'] for result in response.json], [2] * 5)
+        self.assertIn('X-Next-Cursor', response.headers)
+        response = self.client.get('/execution_results/2/summary')
+        self.assertEqual(response.json['results'], {"pass": 13})
+        self.assertEqual(self.client.get('/execution_results/3/summary').status_code, 404)
+
+    def test_batch_writes_shards_in_order(self):
+        events = []
+        listeners = [(engine, name, lambda connection, index=index, name=name: events.append((name, index)))
+                     for index, engine in enumerate(self.router.engines) for name in ('begin', 'commit')]
+        for listener in listeners:
+            event.listen(*listener)
+        try:
+            items = [{"test_case_id": 1, "test_asset_id": test_asset_id, "result": "pass"}
+                     for test_asset_id in reversed(TEST_ASSET_IDS)]
+            response = self.client.post('/execution_results/batch', headers=self.headers, json=items)
+        finally:
+            for listener in listeners:
+                event.remove(*listener)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(events, [('begin', 0), ('begin', 1), ('begin', 2),
+                                  ('commit', 0), ('commit', 1), ('commit', 2)])
+
+    def test_batch_reports_the_items_of_failed_shards(self):
+        commit = Session.commit
+
+        def fail_on_shard_1(session):
+            if session.bind is self.router.engines[1]:
+                raise OperationalError('COMMIT', {}, Exception('disk I/O error'))
+            commit(session)
+
+        items = [{"test_case_id": 1, "test_asset_id": test_asset_id, "result": "pass"}
+                 for test_asset_id in TEST_ASSET_IDS]
+        with mock.patch.object(Session, 'commit', autospec=True, side_effect=fail_on_shard_1):
+            response = self.client.post('/execution_results/batch', headers=self.headers, json=items)
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual((response.json['created'], response.json['failed']), (1, 2))
+        self.assertEqual([item['status'] for item in response.json['results']], ['created', 'failed', 'failed'])
+        # The shards after the failed one are rolled back
+        self.assertEqual(self.shard_counts(), [{7: 1}, {}, {}])
+
+        # Retrying the failed items records each result once
+        failed = [item for item, status in zip(items, response.json['results']) if status['status'] == 'failed']
+        response = self.client.post('/execution_results/batch', headers=self.headers, json=failed)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.shard_counts(), [{7: 1}, {2: 1}, {1: 1}])
+
+    def test_merges_queries_across_shards(self):
+        self.record()
+        response = self.client.get('/execution_results/trend?test_case_id=1&time[gte]=2000-01-01T00:00:00'
+                                   f'&time[lte]={datetime.utcnow().isoformat()}&bucket=1000d')
+        self.assertEqual([(bucket['total'], bucket['results']) for bucket in response.json['buckets']],
+                         [(18, {"pass": 12, "fail": 6})])
+        response = self.client.get('/execution_results/trend?test_asset_id=7&bucket=1d')
+        self.assertEqual(response.json['buckets'][0]['results'], {"pass": 9, "fail": 3})
+
+        flaky = self.client.get('/execution_results/flaky').json
+        self.assertEqual(sorted((pair['test_case_id'], pair['test_asset_id']) for pair in flaky), [(1, 1), (1, 7)])
+        response = self.client.get('/execution_results/flaky?limit=1&fields=test_asset_id')
+        self.assertEqual(len(response.json), 1)
+        self.assertEqual(self.client.get('/execution_results/flaky?test_asset_id=2').json, [])
+
+        # The rebuild commands run on every shard
+        for command in ('rebuild-summaries', 'rebuild-flakiness'):
+            self.assertEqual(self.app.test_cli_runner().invoke(args=[command]).exit_code, 0)
+        self.assertEqual(self.client.get('/execution_results/flaky').json, flaky)
+        self.assertEqual(self.client.get('/execution_results/2/summary').json['total'], 12)
+
+    def test_deleting_test_cases_deletes_their_shard_rows(self):
+        self.record()
+        self.assertEqual(self.client.delete('/testcases/1', headers=self.headers).status_code, 200)
+        self.assertEqual(self.shard_counts(), [{7: 6}, {2: 6}, {1: 6}])
+        self.assertEqual(self.shard_counts(table=ExecutionResultSummary.__table__), [{7: 1}, {2: 1}, {1: 1}])
+        self.assertEqual(self.client.get('/execution_results/flaky').json, [])
+
+        response = self.client.delete('/testcases/', headers=self.headers, json={"ids": [2]})
+        self.assertEqual(response.json['deleted'], 1)
+        self.assertEqual(self.shard_counts(), [{}, {}, {}])
+        self.assertEqual(self.shard_counts(table=FlakinessState.__table__), [{}, {}, {}])
+
+    def test_rebuild_summaries_deletes_rows_left_by_failed_deletes(self):
+        self.record()
+        error = OperationalError('DELETE', {}, Exception('database is locked'))
+        with mock.patch.object(self.router, 'delete_test_cases', side_effect=error):
+            self.assertEqual(self.client.delete('/testcases/1', headers=self.headers).status_code, 200)
+        self.assertEqual(self.shard_counts(), [{7: 12}, {2: 12}, {1: 12}])
+
+        result = self.app.test_cli_runner().invoke(args=['rebuild-summaries'])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Deleted 18 execution results', result.output)
+        self.assertEqual(self.shard_counts(), [{7: 6}, {2: 6}, {1: 6}])
+        self.assertEqual(self.shard_counts(table=FlakinessState.__table__), [{7: 1}, {2: 1}, {1: 1}])
+        self.assertEqual(self.client.get('/execution_results/2/summary').json['total'], 6)
+
+    def test_rebalance(self):
+        self.record()
+        # From three shards to two, the first of which is kept
+        targets = [self.router.engines[0], create_shard_engine(self.shard_uri('new'))]
+        self.assertEqual([shard_index(test_asset_id, 2) for test_asset_id in TEST_ASSET_IDS], [0, 1, 1])
+        self.assertEqual(rebalance(self.router.engines, targets, chunk_size=5), 24)
+        self.assertEqual(self.shard_counts(targets), [{7: 12}, {2: 12, 1: 12}])
+        self.assertEqual(self.shard_counts()[1:], [{}, {}])
+        self.assertEqual(self.shard_counts(targets, FlakinessState.__table__), [{7: 2}, {2: 2, 1: 2}])
+
+        # The summaries are rebuilt in the new shards
+        summary = ExecutionResultSummary.__table__
+        with targets[1].connect() as connection:
+            self.assertEqual(connection.execute(
+                select(summary.c.result, func.sum(summary.c.count)).where(summary.c.test_asset_id == 1)
+                .group_by(summary.c.result).order_by(summary.c.result)).all(), [('fail', 3), ('pass', 9)])
+
+        # Reruns move nothing
+        self.assertEqual(rebalance(targets, targets), 0)
+        targets[1].dispose()
+
+    def test_rebalance_shards_command(self):
+        self.record()
+        result = self.app.test_cli_runner().invoke(args=['rebalance-shards', '--to', self.shard_uri('new')])
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Moved 36 execution results', result.output)
+        self.assertEqual(self.shard_counts(), [{}, {}, {}])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,13 @@
 import unittest
-from flask import Flask
+from datetime import datetime, timedelta
+from flask import Flask, Response
 from flask_jwt_extended import JWTManager
-from models import db, User
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+from models import db, ExecutionResult, ExecutionResultSummary, TableVersion, TestCase, User
+import rollups  # noqa: F401, keeps the summaries of the results below
 from routes.auth import auth_bp
-from routes.test_cases import test_cases_bp
+from routes.test_cases import _set_validators, test_cases_bp
 
 
 class TestEndpoints(unittest.TestCase):
@@ -101,6 +105,25 @@ class TestEndpoints(unittest.TestCase):
             "message": "Test case updated successfully"
         })
 
+    def test_concurrent_writes_are_last_write_wins(self):
+        with self.app.app_context():
+            db.session.add(TestCase(name='Test Case', description=''))
+            db.session.commit()
+            test_case = db.session.get(TestCase, 1)
+            with Session(db.engine) as other_session:
+                other_test_case = other_session.get(TestCase, 1)
+                test_case.name = 'First'
+                db.session.commit()
+                other_test_case.name = 'Second'
+                other_session.commit()
+                self.assertEqual((other_test_case.name, other_test_case.version), ('Second', 3))
+
+                db.session.delete(db.session.get(TestCase, 1))
+                other_session.delete(other_test_case)
+                other_session.commit()
+            db.session.commit()
+            self.assertIsNone(db.session.get(TestCase, 1))
+
     def test_delete_test_case(self):
         token = self.get_token('test_user', 'password')
         headers = {'Authorization': 'Bearer ' + token}
@@ -117,6 +140,197 @@ class TestEndpoints(unittest.TestCase):
             "message": "Test case deleted successfully"
         })
 
+    def test_delete_test_cases_cascades_in_database(self):
+        token = self.get_token('test_user', 'password')
+        headers = {'Authorization': 'Bearer ' + token}
+        for number in range(3):
+            self.client.post('/testcases/', headers=headers, json={"name": f"Test Case {number}"})
+        with self.app.app_context():
+            for test_case_id in (1, 2, 3):
+                db.session.add_all([ExecutionResult(test_case_id=test_case_id, test_asset_id=1, result='pass')
+                                    for _ in range(5)])
+            db.session.commit()
+            self.assertEqual(db.session.scalar(select(func.count()).select_from(ExecutionResultSummary)), 3)
+            statements = []
+            event.listen(db.engine, 'before_cursor_execute',
+                         lambda conn, cursor, statement, *args: statements.append(statement))
+
+        response = self.client.delete('/testcases/1', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        # The results are deleted by the foreign key cascade, never loaded
+        self.assertFalse([statement for statement in statements if 'FROM execution_result' in statement])
+
+        response = self.client.delete('/testcases/', headers=headers, json={"ids": [2, 3, 99]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {"deleted": 2, "not_found": [99]})
+        with self.app.app_context():
+            self.assertEqual(db.session.scalar(select(func.count()).select_from(ExecutionResult)), 0)
+            self.assertEqual(db.session.scalar(select(func.count()).select_from(ExecutionResultSummary)), 0)
+        self.assertEqual(self.client.get('/testcases/', headers=headers).json, [])
+
+        response = self.client.delete('/testcases/', headers=headers, json={"ids": ["1"]})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.delete('/testcases/', headers=headers, json={"ids": [True]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_all_test_cases_conditional(self):
+        token = self.get_token('test_user', 'password')
+        headers = {'Authorization': 'Bearer ' + token}
+        response = self.client.get('/testcases/', headers=headers)
+        etag = response.headers['ETag']
+
+        response = self.client.get('/testcases/', headers={**headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        # A write bumps the table version, so the cached list is rebuilt
+        self.client.post('/testcases/', headers=headers, json={"name": "Test Case"})
+        response = self.client.get('/testcases/', headers={**headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertEqual([test_case['name'] for test_case in response.json], ["Test Case"])
+
+    def test_list_of_an_older_version_is_not_cached_under_a_newer_one(self):
+        token = self.get_token('test_user', 'password')
+        headers = {'Authorization': 'Bearer ' + token}
+        self.client.post('/testcases/', headers=headers, json={"name": "Test Case"})
+        # Another request already saw the next version
+        self.app.extensions['test_cases_list_cache'] = {'version': 2, 'bodies': {}}
+
+        response = self.client.get('/testcases/', headers=headers)
+        self.assertEqual([test_case['name'] for test_case in response.json], ["Test Case"])
+        self.assertEqual(self.app.extensions['test_cases_list_cache'], {'version': 2, 'bodies': {}})
+
+    def test_last_modified_waits_for_the_end_of_the_second(self):
+        token = self.get_token('test_user', 'password')
+        headers = {'Authorization': 'Bearer ' + token}
+        self.client.post('/testcases/', headers=headers, json={"name": "Test Case"})
+        with self.app.app_context():
+            updated_at = db.session.get(TableVersion, 'test_case').updated_at
+        response = Response()
+        _set_validators(response, 'test_cases-1', updated_at, now=updated_at.replace(microsecond=999999))
+        self.assertIsNone(response.last_modified)
+        _set_validators(response, 'test_cases-1', updated_at, now=updated_at + timedelta(seconds=1))
+        self.assertEqual(response.last_modified.replace(tzinfo=None), updated_at.replace(microsecond=0))
+
+        # Once sent, a matching If-Modified-Since gets a 304 unless the ETag differs
+        with self.app.app_context():
+            db.session.get(TableVersion, 'test_case').updated_at = datetime(2024, 1, 1)
+            db.session.commit()
+        response = self.client.get('/testcases/', headers=headers)
+        last_modified = response.headers['Last-Modified']
+        response = self.client.get('/testcases/', headers={**headers, 'If-Modified-Since': last_modified})
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get('/testcases/', headers={**headers, 'If-Modified-Since': last_modified,
+                                                           'If-None-Match': '"stale"'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_all_test_cases_fields(self):
+        token = self.get_token('test_user', 'password')
+        headers = {'Authorization': 'Bearer ' + token}
+        self.client.post('/testcases/', headers=headers, json={"name": "Test Case", "description": "Details"})
+
+        response = self.client.get('/testcases/?fields=name,id', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, [{"id": 1, "name": "Test Case"}])
+        # Each projection is a different representation
+        full = self.client.get('/testcases/', headers=headers)
+        self.assertEqual(full.json, [{"id": 1, "name": "Test Case", "description": "Details"}])
+        self.assertNotEqual(full.headers['ETag'], response.headers['ETag'])
+
+        response = self.client.get('/testcases/?fields=password', headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_single_test_case_conditional(self):
+        token = self.get_token('test_user', 'password')
+        headers = {'Authorization': 'Bearer ' + token}
+        response = self.client.post('/testcases/', headers=headers, json={"name": "Test Case"})
+        test_case_id = response.json.get('test_case').get('id')
+        etag = self.client.get(f'/testcases/{test_case_id}', headers=headers).headers['ETag']
+
+        response = self.client.get(f'/testcases/{test_case_id}', headers={**headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        self.client.put(f'/testcases/{test_case_id}', headers=headers, json={"name": "Updated Test Case"})
+        response = self.client.get(f'/testcases/{test_case_id}', headers={**headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_search_test_cases(self):
+        token = self.get_token('test_user', 'password')
+        headers = {'Authorization': 'Bearer ' + token}
+        for name, description in [("Login fails", "Wrong password"), ("Logout", "Session ends after login"),
+                                  ("Upload", "Large files"), ("Password reset", "Sends an email")]:
+            self.client.post('/testcases/', headers=headers, json={"name": name, "description": description})
+
+        response = self.client.get('/testcases/search?q=login', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        # Name matches rank before "Logout", which matches through its description
+        self.assertEqual([test_case['name'] for test_case in response.json], ["Login fails", "Logout"])
+        # Terms match as prefixes, "log" matches "Login" and "Logout"
+        response = self.client.get('/testcases/search?q=log&fields=id', headers=headers)
+        self.assertEqual(sorted(test_case['id'] for test_case in response.json), [1, 2])
+
+        response = self.client.get('/testcases/search?q=password&limit=1', headers=headers)
+        self.assertEqual([test_case['name'] for test_case in response.json], ["Password reset"])
+        self.assertEqual(response.headers['X-Next-Offset'], '1')
+        response = self.client.get('/testcases/search?q=password&limit=1&offset=1', headers=headers)
+        self.assertEqual([test_case['name'] for test_case in response.json], ["Login fails"])
+        self.assertNotIn('X-Next-Offset', response.headers)
+
+        # Updates and deletes are reindexed, operators in the text are not interpreted
+        self.client.put('/testcases/3', headers=headers, json={"name": "Upload avatar"})
+        self.client.delete('/testcases/1', headers=headers)
+        response = self.client.get('/testcases/search?q=avatar OR "login', headers=headers)
+        self.assertEqual(response.json, [])
+        response = self.client.get('/testcases/search?q=avatar', headers=headers)
+        self.assertEqual([test_case['id'] for test_case in response.json], [3])
+        response = self.client.get('/testcases/search?q=fails', headers=headers)
+        self.assertEqual(response.json, [])
+
+        self.assertEqual(self.client.get('/testcases/search?q=%20-', headers=headers).status_code, 400)
+
+    def test_import_and_export_test_cases(self):
+        self.app.config['TEST_CASES_IMPORT_CHUNK_SIZE'] = 2
+        token = self.get_token('test_user', 'password')
+        headers = {'Authorization': 'Bearer ' + token}
+        body = ('id,name,description\r\n7,Login,"Multi\r\nline"\r\n8,Logout,\r\n9,' + 'x' * 101 + ',\r\n'
+                '10,Upload,Large files\r\n')
+        response = self.client.post('/testcases/import', headers={**headers, 'Content-Type': 'text/csv'}, data=body)
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.json, {"imported": 3, "rejected": 1, "chunks": 2, "errors_truncated": False,
+                                         "errors": [{"line": 5, "error": "Invalid name provided for test case"}]})
+
+        body = '{"name": "Search"}\nnot json\n{"name": "Reset", "description": 5}\n'
+        response = self.client.post('/testcases/import', headers={**headers, 'Content-Type': 'application/x-ndjson'},
+                                    data=body)
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([error['line'] for error in response.json['errors']], [2, 3])
+
+        response = self.client.get('/testcases/export?format=csv&fields=id,name,description', headers=headers)
+        self.assertEqual(response.headers['X-Total-Count'], '4')
+        self.assertEqual(response.get_data(as_text=True),
+                         'id,name,description\r\n1,Login,"Multi\r\nline"\r\n2,Logout,\r\n3,Upload,Large files\r\n'
+                         '4,Search,\r\n')
+        response = self.client.get('/testcases/export?fields=name', headers=headers)
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual(response.get_data(as_text=True).splitlines()[-1], '{"name":"Search"}')
+
+        # Imported test cases are visible to the list cache and the search index
+        self.assertEqual(len(self.client.get('/testcases/', headers=headers).json), 4)
+        self.assertEqual(len(self.client.get('/testcases/search?q=upload', headers=headers).json), 1)
+
+        response = self.client.post('/testcases/import', headers=headers, json=[{"name": "Test Case"}])
+        self.assertEqual(response.status_code, 415)
+
+    def test_create_test_case_requires_admin(self):
+        with self.app.app_context():
+            db.session.add(User(username='regular_user', password='password'))
+            db.session.commit()
+        token = self.get_token('regular_user', 'password')
+        headers = {'Authorization': 'Bearer ' + token}
+        response = self.client.post('/testcases/', headers=headers, json={"name": "Test Case"})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json, {"error": "Only admins can create test cases"})
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, TableVersion
+
+table_version = TableVersion.__table__
+
+
+def bump_table_version(name):
+    """
+    Increment the version of a table in the current transaction. Call it from
+    every write to the table so cached reads of it are invalidated.
+    """
+    statement = sqlite_insert(table_version).values(name=name, version=1, updated_at=datetime.utcnow())
+    statement = statement.on_conflict_do_update(
+        index_elements=[table_version.c.name],
+        set_={'version': table_version.c.version + 1, 'updated_at': statement.excluded.updated_at})
+    db.session.execute(statement)
+
+
+def get_table_version(name, session=None):
+    """
+    Args:
+        name (str): Name of the table.
+        session: Session to read with, db.session by default.
+
+    Returns:
+        tuple: (version, updated_at) of the table, (0, None) if it was never written.
+    """
+    row = (session or db.session).execute(
+        select(table_version.c.version, table_version.c.updated_at).where(table_version.c.name == name)).first()
+    return tuple(row) if row else (0, None)
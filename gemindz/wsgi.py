@@ -0,0 +1,13 @@
+"""
+WSGI entry point for preforking servers, e.g.:
+
+    GEMINDZ_CONFIG=production gunicorn --preload --workers 4 wsgi:app
+
+With --preload the app is created once in the master, so the imports and the
+schema check run once and the workers share the loaded code. Background
+threads, the password hashing pool and database connections are only opened
+in the workers (see LogWriter, LogMaintenance, PasswordHasher and init_db).
+"""
+from app import create_app
+
+app = create_app()